@@ -1,13 +1,20 @@
+import asyncio
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from functools import wraps
+from functools import partial, wraps
 from http import HTTPStatus
-from typing import Dict
+from typing import Callable, Dict, List, Tuple
 
+import numpy as np
+import pandas as pd
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
 
-from webScrape import receiver
-from backend import technical_indicators
+from config import config
+from webScrape import database, receiver, snapshot
+from backend import batch, columnar, export, response_cache, technical_indicators
 
 tags_metadata = [
     {
@@ -28,6 +35,18 @@ tags_metadata = [
         'name': 'Monthly',
         'description': 'This API endpoint returns **monthly** time series of the stock symbol data.'
                        '**Function parameter** = _TIME_SERIES_MONTHLY_'
+    },
+    {
+        'name': 'Export',
+        'description': 'This API endpoint streams the data of many stock symbols as **NDJSON** or **CSV**.'
+    },
+    {
+        'name': 'Latest',
+        'description': 'This API endpoint returns the **latest** bar with the latest indicator values.'
+    },
+    {
+        'name': 'Batch',
+        'description': 'This API endpoint calculates **many indicators** of **many stock symbols** at once.'
     }
 
 ]
@@ -40,6 +59,230 @@ app = FastAPI(
     openapi_tags=tags_metadata
 )
 
+# Frequencies of the data selected by the function parameter
+FREQUENCIES: Dict[str, str] = {
+    'TIME_SERIES_DAILY': '1d',
+    'TIME_SERIES_WEEKLY': '1wk',
+    'TIME_SERIES_MONTHLY': '1mo'
+}
+
+# Threads running the blocking database reads and downloads outside the event loop
+executor = ThreadPoolExecutor(max_workers=config.API_WORKERS, thread_name_prefix='api')
+# Requests being processed, identical requests wait for the same result
+_in_flight: Dict[Tuple, asyncio.Future] = {}
+
+
+class BatchIndicator(BaseModel):
+    """Technical indicator requested in the batch, parameters the same as the /indicators endpoint."""
+    function: str
+    time_period: int = 14
+    fast_period: int = 12
+    slow_period: int = 26
+    signal_period: int = 9
+    af_start: float = 0.02
+    af_increment: float = 0.02
+    af_max: float = 0.2
+
+
+class BatchRequest(BaseModel):
+    """Symbols and indicators of the batch request."""
+    symbols: List[str]
+    indicators: List[BatchIndicator]
+    function: str = 'TIME_SERIES_DAILY'
+    start: str | None = None
+    end: str | None = None
+    limit: int | None = None
+    latest: bool = False
+
+
+async def run_blocking(key: Tuple, func: Callable, *args, **kwargs):
+    """
+    Run the blocking function inside the executor, coalescing concurrent calls with the same key.
+    :param key: Identifier of the call, calls with equal keys share a single execution
+    :param func: Blocking function
+    :return: Result of the function
+    """
+    future = _in_flight.get(key)
+    if future is None:
+        future = asyncio.get_running_loop().run_in_executor(executor, partial(func, *args, **kwargs))
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    # Cancelled request must not cancel the execution shared with the other requests
+    return await asyncio.shield(future)
+
+
+def _needs_standard_encoder(data: pd.DataFrame) -> bool:
+    """
+    Check whether pandas formats any of the float values differently than the standard JSON encoder.
+    Pandas writes small and large numbers without the exponent and large fractions with extra digits.
+    """
+    values = np.abs(data.select_dtypes('float').to_numpy())
+    if values.size == 0:
+        return False
+    different = ((values > 0) & (values < 1e-4)) | ((values >= 1e5) & (values != np.floor(values))) | (values >= 1e16)
+    return bool(different.any())
+
+
+def serialize_frame(data: pd.DataFrame) -> bytes:
+    """
+    Serialize the data indexed by the date straight into the JSON of the response.
+    The output is identical to the data parsed with json.loads and encoded again by FastAPI.
+    :param data: Pandas DataFrame indexed by the date
+    :return: JSON object with the rows indexed by the date
+    """
+    body: bytes = data.to_json(orient='index', force_ascii=False).encode()
+    # Escaped characters and some numbers are formatted differently, encode them the slower way
+    if b'\\' in body or _needs_standard_encoder(data):
+        body = json.dumps(json.loads(body), ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+    return body
+
+
+def render_response(meta_data: Dict, data: bytes) -> bytes:
+    """
+    Join the metadata and the serialized data into the body of the response.
+    :param meta_data: Metadata of the response
+    :param data: Data serialized into JSON
+    :return: JSON body with the "Meta Data" and "data" keys, formatted the same as FastAPI responses
+    """
+    envelope: bytes = json.dumps({'Meta Data': meta_data}, ensure_ascii=False, allow_nan=False,
+                                 separators=(',', ':')).encode()
+    return envelope[:-1] + b',"data":' + data + b'}'
+
+
+def selection_params(start: str | None, end: str | None, columns: str | None, limit: int | None) -> Dict:
+    """
+    Validate the parameters selecting the rows and the columns of the response.
+    :param start: Beginning of the period of time, valid format: "2021-09-08"
+    :param end: End of the period of time, valid format: "2021-08-08"
+    :param columns: Names of the columns separated by commas
+    :param limit: Maximum number of the latest rows
+    :return: Dictionary with the parameters passed to the data sources
+    """
+    for date in (start, end):
+        if date is not None:
+            try:
+                datetime.strptime(date, '%Y-%m-%d')
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f'Invalid date {date}, valid format: YYYY-MM-DD')
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail='Limit must be a positive number')
+    if columns is not None:
+        columns = [column.strip() for column in columns.split(',') if column.strip()]
+    return {'start': start, 'end': end, 'columns': columns, 'limit': limit}
+
+
+def selection_key(selection: Dict) -> Tuple:
+    """Return the part of the cache key identifying the selected rows and columns."""
+    columns = selection['columns']
+    return selection['start'], selection['end'], None if columns is None else tuple(columns), selection['limit']
+
+
+async def selected_response(key: Tuple, func: Callable, *args, **kwargs) -> response_cache.CachedResponse | None:
+    """Return the cached response, unknown columns of the selection are reported as a bad request."""
+    try:
+        return await cached_response(key, func, *args, **kwargs)
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+
+
+def prepare_response(data: pd.DataFrame, symbol: str, media_type: str = columnar.JSON) -> response_cache.CachedResponse:
+    """
+    Serialize the data into the requested format.
+    :param data: Pandas DataFrame indexed by the date
+    :param symbol: Stock market symbol
+    :param media_type: Media type of the response
+    :return: Response with the serialized data
+    """
+    if media_type == columnar.JSON:
+        body: bytes = serialize_frame(data)
+    else:
+        body = columnar.serialize(data, media_type, {'symbol': symbol})
+    return response_cache.CachedResponse(body, response_cache.make_etag(body), len(body))
+
+
+def load_data(symbol: str, frequency: str, media_type: str = columnar.JSON, adjusted: bool = False,
+              **selection) -> response_cache.CachedResponse:
+    """
+    Read the data of the stock symbol and convert it into the response format.
+    :param symbol: Stock market symbol
+    :param frequency: String defining the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param media_type: Media type of the response
+    :param adjusted: Whether to adjust the prices for the dividends and stock splits
+    :param selection: Date range, columns and limit of the rows passed to receive_data
+    :return: Response with the data indexed by the date
+    """
+    stock_data = receiver.receive_data(symbol=symbol, frequency=frequency, change_index=True, adjusted=adjusted,
+                                       **selection)
+    return prepare_response(stock_data, symbol, media_type)
+
+
+def load_indicator(symbol: str, indicator: str, media_type: str = columnar.JSON,
+                   **params) -> response_cache.CachedResponse | None:
+    """
+    Calculate the technical indicator of the stock symbol and convert it into the response format.
+    :param symbol: Stock market symbol
+    :param indicator: Name of the technical indicator
+    :param media_type: Media type of the response
+    :param params: Parameters of the indicator passed to get_indicator
+    :return: Response with the indicator values indexed by the date or None when the symbol is missing
+    """
+    enhanced_data = technical_indicators.get_indicator(symbol, indicator, **params)
+    if enhanced_data is None:
+        return None
+    return prepare_response(enhanced_data, symbol, media_type)
+
+
+def load_latest(symbol: str, frequency: str, media_type: str = columnar.JSON,
+                database_name: str = 'stock_database.db') -> response_cache.CachedResponse | None:
+    """
+    Read the snapshot with the latest values of the stock symbol and convert it into the response format.
+    :param symbol: Stock market symbol
+    :param frequency: String defining the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param media_type: Media type of the response
+    :param database_name: Name of the database with the data. Default "stock_database"
+    :return: Response with a single row indexed by the date or None when the symbol is missing
+    """
+    with database.connect(database_name) as connection:
+        latest = snapshot.get_snapshot(connection, symbol, frequency)
+    if latest is None:
+        return None
+    latest_date = latest.pop('Date')
+    return prepare_response(pd.DataFrame([latest], index=pd.Index([latest_date], name='Date')), symbol, media_type)
+
+
+def response_format(request: Request) -> str:
+    """
+    Return the media type of the response accepted by the client.
+    :param request: Request with the Accept header
+    :return: Media type of the response
+    """
+    try:
+        return columnar.negotiate(request.headers.get('accept'))
+    except columnar.NotAcceptable as err:
+        raise HTTPException(status_code=HTTPStatus.NOT_ACCEPTABLE, detail=str(err))
+
+
+def _load_and_cache(key: Tuple, func: Callable, *args, **kwargs) -> response_cache.CachedResponse | None:
+    """Load the response and save it inside the cache, unless the symbol was written in the meantime."""
+    symbol_generation: int = response_cache.generation(key[1])
+    response = func(*args, **kwargs)
+    if response is not None:
+        response_cache.put(key, response, symbol_generation)
+    return response
+
+
+async def cached_response(key: Tuple, func: Callable, *args, **kwargs) -> response_cache.CachedResponse | None:
+    """
+    Return the cached response or load it inside the executor.
+    :param key: Endpoint, symbol and parameters of the request
+    :param func: Blocking function loading the response
+    :return: Response with the data
+    """
+    response = response_cache.get(key)
+    if response is None:
+        response = await run_blocking(key, _load_and_cache, key, func, *args, **kwargs)
+    return response
+
 
 def create_response(func):
     @wraps(func)
@@ -55,6 +298,20 @@ def create_response(func):
                 '6. Url': request.url._url
             }
         }
+        if 'etag' in results:
+            headers: Dict[str, str] = {'ETag': results['etag'], 'Vary': 'Accept'}
+            # Client already has the current version of the data
+            if response_cache.etag_matches(request.headers.get('if-none-match'), results['etag']):
+                return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+            # Columnar formats are sent without the metadata envelope
+            if results.get('media_type', columnar.JSON) != columnar.JSON:
+                return Response(results['data'], media_type=results['media_type'], headers=headers)
+            # Serialized data is inserted into the body without parsing it again
+            return Response(render_response(response['Meta Data'], results['data']),
+                            media_type=columnar.JSON, headers=headers)
+        # Serialized data of the batch requests
+        if isinstance(results.get('data'), bytes):
+            return Response(render_response(response['Meta Data'], results['data']), media_type=columnar.JSON)
         if 'data' in results:
             response['data'] = results['data']
         return response
@@ -81,52 +338,184 @@ async def _index(request: Request) -> Dict:
 
 @app.get('/data', tags=['Daily', 'Weekly', 'Monthly'])
 @create_response
-async def _read_data(request: Request, symbol: str, function: str) -> Dict:
+async def _read_data(request: Request, symbol: str, function: str, start: str | None = None,
+                     end: str | None = None, columns: str | None = None, limit: int | None = None,
+                     adjusted: bool = False) -> Dict:
     """
         Return the data of the stock market symbol, covering 20+ years of historical data:
         - **symbol**: stock market symbol
         - **function**: determine time series
+        - **start**: beginning of the period of time, YYYY-MM-DD
+        - **end**: end of the period of time, YYYY-MM-DD
+        - **columns**: columns separated by commas, ex. Close,Volume
+        - **limit**: maximum number of the latest rows
+        - **adjusted**: adjust the prices and the volume for the dividends and stock splits
         """
-    if function == 'TIME_SERIES_WEEKLY':
-        stock_data = receiver.receive_data(symbol=symbol, frequency='1wk', change_index=True)
-    elif function == 'TIME_SERIES_MONTHLY':
-        stock_data = receiver.receive_data(symbol=symbol, frequency='1mo', change_index=True)
-    elif function == 'TIME_SERIES_DAILY':
-        stock_data = receiver.receive_data(symbol=symbol, frequency='1d', change_index=True)
-    else:
+    if function not in FREQUENCIES:
         raise HTTPException(status_code=400, detail='Invalid function parameter')
-    res = stock_data.to_json(orient='index')
-    parsed = json.loads(res)
+    frequency: str = FREQUENCIES[function]
+    selection: Dict = selection_params(start, end, columns, limit)
+    media_type: str = response_format(request)
+    key: Tuple = ('data', symbol.upper(), frequency, media_type, adjusted, *selection_key(selection))
+    cached = await selected_response(key, load_data, symbol, frequency, media_type, adjusted, **selection)
     response = {
         'message': HTTPStatus.OK.phrase,
         'symbol': symbol,
         'status-code': HTTPStatus.OK,
-        'data': parsed
+        'data': cached.data,
+        'etag': cached.etag,
+        'media_type': media_type
     }
     return response
 
 
-@app.get('/indicators', tags=['MACD', 'RSI', 'EMA'])
+@app.get('/latest', tags=['Latest'])
+@create_response
+async def _latest(request: Request, symbol: str, function: str = 'TIME_SERIES_DAILY') -> Dict:
+    """
+        Return the latest bar of the stock market symbol together with the latest stored indicators:
+        - **symbol**: stock market symbol
+        - **function**: determine time series
+        """
+    if function not in FREQUENCIES:
+        raise HTTPException(status_code=400, detail='Invalid function parameter')
+    frequency: str = FREQUENCIES[function]
+    media_type: str = response_format(request)
+    cached = await cached_response(('latest', symbol.upper(), frequency, media_type), load_latest,
+                                   symbol, frequency, media_type)
+    if cached is None:
+        raise HTTPException(status_code=404, detail=f'Symbol {symbol} not found')
+    return {
+        'message': HTTPStatus.OK.phrase,
+        'symbol': symbol,
+        'status-code': HTTPStatus.OK,
+        'data': cached.data,
+        'etag': cached.etag,
+        'media_type': media_type
+    }
+
+
+@app.get('/indicators', tags=['MACD', 'RSI', 'EMA', 'PSAR'])
 @create_response
 async def _indicators(request: Request, symbol: str, function: str, time_period: int = 14, fast_period: int = 12,
-                      slow_period: int = 26, signal_period: int = 9) -> Dict:
+                      slow_period: int = 26, signal_period: int = 9, af_start: float = 0.02,
+                      af_increment: float = 0.02, af_max: float = 0.2, start: str | None = None,
+                      end: str | None = None, columns: str | None = None, limit: int | None = None) -> Dict:
     if function == 'MACD':
-        enhanced_data = technical_indicators.get_indicator(symbol, 'MACD', fast_period=fast_period,
-                                                           slow_period=slow_period, signal_period=signal_period)
-    elif function == 'RSI':
-        enhanced_data = technical_indicators.get_indicator(symbol, 'RSI', period=time_period)
-    elif function == 'EMA':
-        enhanced_data = technical_indicators.get_indicator(symbol, 'EMA', period=time_period)
+        params = {'fast_period': fast_period, 'slow_period': slow_period, 'signal_period': signal_period}
+    elif function in ('RSI', 'EMA'):
+        params = {'period': time_period}
+    elif function == 'PSAR':
+        params = {'af_start': af_start, 'af_increment': af_increment, 'af_max': af_max}
     else:
         raise HTTPException(status_code=400, detail='Invalid function parameter')
-    res = enhanced_data.to_json(orient='index')
+    selection: Dict = selection_params(start, end, columns, limit)
+    media_type: str = response_format(request)
+    key: Tuple = ('indicators', symbol.upper(), function, media_type, *sorted(params.items()),
+                  *selection_key(selection))
+    cached = await selected_response(key, load_indicator, symbol, function, media_type, **params, **selection)
+    if cached is None:
+        raise HTTPException(status_code=404, detail=f'Symbol {symbol} not found')
     return {
         'message': HTTPStatus.OK.phrase,
         'symbol': symbol,
         'status-code': HTTPStatus.OK,
-        'data': json.loads(res)
+        'data': cached.data,
+        'etag': cached.etag,
+        'media_type': media_type
     }
 
 
+def load_batch(symbols: List[str], specs: List[technical_indicators.IndicatorSpec], frequency: str,
+               **selection) -> bytes:
+    """
+    Calculate the indicators of many symbols and serialize them into a single JSON object.
+    :param symbols: Stock market symbols
+    :param specs: List of the technical indicators with their parameters
+    :param frequency: String defining the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param selection: Date range and limit of the rows passed to batch_indicators
+    :return: JSON object with the indicators indexed by the date for every symbol, null for the missing symbols
+    """
+    results = batch.batch_indicators(symbols, specs, frequency, **selection)
+    parts: List[bytes] = [json.dumps(symbol, ensure_ascii=False).encode() + b':'
+                          + (b'null' if data is None else serialize_frame(data))
+                          for symbol, data in results.items()]
+    return b'{' + b','.join(parts) + b'}'
+
+
+@app.post('/indicators/batch', tags=['Batch'])
+@create_response
+async def _indicators_batch(request: Request, body: BatchRequest) -> Dict:
+    """
+        Calculate the indicators of many stock market symbols with a single request:
+        - **symbols**: list of the stock market symbols
+        - **indicators**: list of the indicators, ex. {"function": "EMA", "time_period": 20}
+        - **function**: determine time series
+        - **start**: beginning of the period of time, YYYY-MM-DD
+        - **end**: end of the period of time, YYYY-MM-DD
+        - **limit**: maximum number of the latest rows of every symbol
+        - **latest**: return only the latest values of every symbol
+        """
+    if body.function not in FREQUENCIES:
+        raise HTTPException(status_code=400, detail='Invalid function parameter')
+    symbols: List[str] = list(dict.fromkeys(symbol.strip().upper() for symbol in body.symbols if symbol.strip()))
+    if not symbols or not body.indicators:
+        raise HTTPException(status_code=400, detail='At least one symbol and one indicator are required')
+    for indicator in body.indicators:
+        if indicator.function not in batch.BATCH_INDICATORS:
+            raise HTTPException(status_code=400, detail=f'Invalid indicator {indicator.function}, possible values: '
+                                                        f'{", ".join(batch.BATCH_INDICATORS)}')
+    specs: List[technical_indicators.IndicatorSpec] = [
+        technical_indicators.IndicatorSpec(indicator.function, indicator.time_period, indicator.fast_period,
+                                           indicator.slow_period, indicator.signal_period, indicator.af_start,
+                                           indicator.af_increment, indicator.af_max)
+        for indicator in body.indicators
+    ]
+    selection: Dict = selection_params(body.start, body.end, None, 1 if body.latest else body.limit)
+    del selection['columns']
+    frequency: str = FREQUENCIES[body.function]
+    key: Tuple = ('batch', tuple(symbols), tuple(specs), frequency, *selection.values())
+    data: bytes = await run_blocking(key, load_batch, symbols, specs, frequency, **selection)
+    return {
+        'message': HTTPStatus.OK.phrase,
+        'symbol': None,
+        'status-code': HTTPStatus.OK,
+        'data': data
+    }
+
+
+@app.get('/export', tags=['Export'])
+async def _export(request: Request, symbols: str | None = None, function: str = 'TIME_SERIES_DAILY',
+                  start: str | None = None, end: str | None = None, columns: str | None = None,
+                  format: str = 'ndjson') -> StreamingResponse:
+    """
+        Stream the data of many stock market symbols, one row per line:
+        - **symbols**: stock market symbols separated by commas, default all symbols of stock_symbols.csv
+        - **function**: determine time series
+        - **start**: beginning of the period of time, YYYY-MM-DD
+        - **end**: end of the period of time, YYYY-MM-DD
+        - **columns**: columns separated by commas, default Open,High,Low,Close,Adj Close,Volume
+        - **format**: ndjson or csv, the response is compressed when the client accepts gzip
+        """
+    if function not in FREQUENCIES:
+        raise HTTPException(status_code=400, detail='Invalid function parameter')
+    if format not in export.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail='Invalid format parameter, possible values: ndjson, csv')
+    selection: Dict = selection_params(start, end, columns, None)
+    if symbols is not None:
+        symbol_list = [symbol.strip() for symbol in symbols.split(',') if symbol.strip()]
+    else:
+        symbol_list = export.default_symbols()
+    start_date = datetime.strptime(start, '%Y-%m-%d').date() if start is not None else None
+    end_date = datetime.strptime(end, '%Y-%m-%d').date() if end is not None else None
+    # Synchronous iterator is consumed by the threads of the server, outside the event loop
+    chunks = export.export_rows(symbol_list, FREQUENCIES[function], start_date, end_date, selection['columns'], format)
+    headers: Dict[str, str] = {'Vary': 'Accept-Encoding'}
+    if export.accepts_gzip(request.headers.get('accept-encoding')):
+        chunks = export.gzip_stream(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return StreamingResponse(chunks, media_type=export.MEDIA_TYPES[format], headers=headers)
+
+
 # if __name__ == '__main__':
 #     uvicorn.run(app, port=os.environ.get("PORT", 8000), host="127.0.0.1")
@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List
+import pandas as pd
+from config import config
+from config.config import logger
+from webScrape import catalog, database, receiver
+from backend import technical_indicators
+from backend.technical_indicators import IndicatorSpec
+
+# Indicators which may be requested in a batch
+BATCH_INDICATORS: List[str] = ['RSI', 'MACD', 'EMA', 'SMA', 'PSAR']
+
+# Threads calculating the indicators of the symbols
+executor = ThreadPoolExecutor(max_workers=config.BATCH_WORKERS, thread_name_prefix='batch')
+
+
+def symbol_indicators(symbol: str, specs: List[IndicatorSpec], frequency: str = '1d', start: str | None = None,
+                      end: str | None = None, limit: int | None = None,
+                      database_name: str = 'stock_database.db') -> pd.DataFrame | None:
+    """
+    Calculate the indicators of the symbol from the saved prices, nothing is downloaded nor written.
+    :param symbol: Stock market symbol
+    :param specs: List of the technical indicators with their parameters
+    :param frequency: String defining the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param start: Beginning of the returned period of time, valid format: "2021-09-08"
+    :param end: End of the returned period of time, valid format: "2021-08-08"
+    :param limit: Maximum number of the latest rows to return
+    :param database_name: Name of the database with the data
+    :return: Pandas DataFrame with the indicator columns indexed by the date, the latest first, None when missing
+    """
+    # Every worker thread reuses its own connection for the following symbols
+    with database.connect(database_name) as connection:
+        entry = catalog.get_entry(connection, symbol, frequency)
+        if entry is None:
+            return None
+        prices = receiver.read_symbol_table(connection, symbol, frequency, entry.table_name, entry.start_date,
+                                            entry.end_date, columns=['Close', 'High', 'Low'])
+    if prices.empty:
+        return None
+    # Indicators are calculated over the whole history, the rows are selected afterwards
+    prices = prices[::-1]
+    values = technical_indicators.compute_indicators(prices, specs)
+    data = pd.DataFrame(values, index=pd.Index(prices['Date'].astype(str).to_numpy(), name='Date'))[::-1]
+    return technical_indicators.select_rows(data, start, end, limit)
+
+
+def batch_indicators(symbols: Iterable[str], specs: List[IndicatorSpec], frequency: str = '1d',
+                     start: str | None = None, end: str | None = None, limit: int | None = None,
+                     database_name: str = 'stock_database.db') -> Dict[str, pd.DataFrame | None]:
+    """
+    Calculate the indicators of many symbols in parallel, every worker thread reuses its database connection.
+    :param symbols: Stock market symbols
+    :param specs: List of the technical indicators with their parameters
+    :param frequency: String defining the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param start: Beginning of the returned period of time, valid format: "2021-09-08"
+    :param end: End of the returned period of time, valid format: "2021-08-08"
+    :param limit: Maximum number of the latest rows to return
+    :param database_name: Name of the database with the data
+    :return: Dictionary with the indicators of every symbol in the requested order, None for the missing symbols
+    """
+    symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+    futures = [executor.submit(symbol_indicators, symbol, specs, frequency, start, end, limit, database_name)
+               for symbol in symbols]
+    results: Dict[str, pd.DataFrame | None] = {}
+    for symbol, future in zip(symbols, futures):
+        results[symbol] = future.result()
+        if results[symbol] is None:
+            logger.warning(f'Batch skipped {symbol}, no data in the database')
+    return results
+
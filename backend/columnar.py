@@ -0,0 +1,67 @@
+from typing import Dict
+import pandas as pd
+
+# Columnar formats need pyarrow from the requirements, JSON is still served when it is not installed
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+ARROW_STREAM: str = 'application/vnd.apache.arrow.stream'
+PARQUET: str = 'application/vnd.apache.parquet'
+JSON: str = 'application/json'
+
+
+class NotAcceptable(Exception):
+    """Raised when the client accepts only the formats which cannot be served."""
+
+
+def negotiate(accept: str | None) -> str:
+    """
+    Choose the format of the response from the Accept request header.
+    :param accept: Value of the Accept request header
+    :return: Media type of the response
+    """
+    if not accept:
+        return JSON
+    requested: Dict[str, float] = {}
+    for media_range in accept.split(','):
+        media_type, *params = [part.strip() for part in media_range.split(';')]
+        quality: float = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        requested[media_type.lower()] = quality
+    available = [JSON] if pyarrow is None else [ARROW_STREAM, PARQUET, JSON]
+    candidates = [(requested[media_type], media_type) for media_type in available
+                  if requested.get(media_type, 0) > 0]
+    if candidates:
+        # Highest quality wins, columnar formats are preferred on ties
+        return max(candidates, key=lambda candidate: (candidate[0], -available.index(candidate[1])))[1]
+    if any(requested.get(media_type, 0) > 0 for media_type in ('*/*', 'application/*')):
+        return JSON
+    raise NotAcceptable(f'Supported formats: {", ".join(available)}')
+
+
+def serialize(data: pd.DataFrame, media_type: str, metadata: Dict[str, str] | None = None) -> bytes:
+    """
+    Serialize the data indexed by the date into the columnar format.
+    :param data: Pandas DataFrame indexed by the date
+    :param media_type: Media type of the response, possible values: [ARROW_STREAM, PARQUET]
+    :param metadata: Key-value pairs saved inside the schema
+    :return: Serialized table with the Date column followed by the data columns
+    """
+    table = pyarrow.Table.from_pandas(data.reset_index(), preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), **(metadata or {})})
+    sink = pyarrow.BufferOutputStream()
+    if media_type == PARQUET:
+        pyarrow.parquet.write_table(table, sink)
+    else:
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,119 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List
+import pandas as pd
+from config import config
+from config.config import logger
+from webScrape import catalog, database, receiver
+
+# Columns exported when the client does not select them
+DEFAULT_COLUMNS: List[str] = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+# Number of rows read from the database at once
+BATCH_SIZE: int = 1000
+# Supported formats with their media types
+MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+
+def default_symbols() -> List[str]:
+    """
+    Return the symbols listed inside the stock_symbols.csv file.
+    :return: List with the stock market symbols
+    """
+    return pd.read_csv(Path(config.DATA_DICT, 'stock_symbols.csv'), header=None)[0].tolist()
+
+
+def _ndjson_batch(symbol: str, column_names: List[str], rows: List[tuple]) -> bytes:
+    """Serialize the batch of rows into JSON objects, one per line."""
+    names: List[str] = ['Symbol'] + column_names
+    lines: List[str] = [json.dumps(dict(zip(names, (symbol, *(receiver.normalize_value(column, value)
+                                                               for column, value in zip(column_names, row))))),
+                                   ensure_ascii=False, separators=(',', ':'))
+                        for row in rows]
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def _csv_batch(symbol: str, column_names: List[str], rows: List[tuple]) -> bytes:
+    """Serialize the batch of rows into CSV lines."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerows((symbol, *(receiver.normalize_value(column, value) for column, value in zip(column_names, row)))
+                     for row in rows)
+    return buffer.getvalue().encode()
+
+
+def export_rows(symbols: Iterable[str], frequency: str = '1d', start: date | None = None, end: date | None = None,
+                columns: List[str] | None = None, export_format: str = 'ndjson',
+                database_name: str = 'stock_database.db', batch_size: int = BATCH_SIZE) -> Iterator[bytes]:
+    """
+    Stream the data of many symbols, only a single batch of rows is kept in memory.
+    Symbols missing in the database or without the requested columns are skipped.
+    :param symbols: Stock market symbols
+    :param frequency: String defining the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param start: Beginning of the period of time, None exports from the oldest row
+    :param end: End of the period of time, None exports up to the latest row
+    :param columns: Names of the exported columns. Default DEFAULT_COLUMNS
+    :param export_format: Format of the rows, possible values: [ndjson, csv]
+    :param database_name: Name of the database with the data. Default "stock_database"
+    :param batch_size: Number of rows read from the database at once
+    :return: Iterator over the chunks of the serialized rows
+    """
+    columns = columns or DEFAULT_COLUMNS
+    serialize: Callable = _csv_batch if export_format == 'csv' else _ndjson_batch
+    if export_format == 'csv':
+        header: List[str] = ['Symbol', 'Date'] + [column for column in dict.fromkeys(columns) if column != 'Date']
+        yield (','.join(header) + '\n').encode()
+    # Rows are read by the threads of the server one batch after another
+    connection = database.open_connection(database_name, check_same_thread=False)
+    try:
+        for symbol in symbols:
+            symbol = symbol.upper()
+            entry = catalog.get_entry(connection, symbol, frequency)
+            if entry is None:
+                logger.warning(f'Export skipped {symbol}, no data in the database')
+                continue
+            try:
+                column_names, batches = receiver.iterate_symbol_table(connection, symbol, frequency, entry.table_name,
+                                                                      start or entry.start_date,
+                                                                      end or entry.end_date, columns, batch_size)
+            except ValueError as err:
+                logger.warning(f'Export skipped {symbol}: {err}')
+                continue
+            for rows in batches:
+                yield serialize(symbol, column_names, rows)
+    finally:
+        connection.close()
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    """
+    Check whether the client accepts the gzip compressed response.
+    :param accept_encoding: Value of the Accept-Encoding request header
+    :return: Whether to compress the response
+    """
+    for encoding in (accept_encoding or '').split(','):
+        name, _, quality = encoding.partition(';')
+        if name.strip().lower() == 'gzip':
+            return quality.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """
+    Compress the stream of chunks into a single gzip member.
+    :param chunks: Chunks of the response body
+    :param level: Compression level
+    :return: Iterator over the compressed chunks
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed: bytes = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
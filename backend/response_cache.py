@@ -0,0 +1,119 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Tuple
+from config import config
+
+
+class CachedResponse(NamedTuple):
+    """Data of the API response serialized into JSON."""
+    data: bytes
+    etag: str
+    size: int
+
+
+# Cached responses in the LRU order, {(endpoint, symbol, *params): (created, response)}
+_entries: 'OrderedDict[Tuple, Tuple[float, CachedResponse]]' = OrderedDict()
+# Number of writes of every symbol, responses read before a write are not cached
+_generations: Dict[str, int] = {}
+_total_size: int = 0
+_lock = threading.Lock()
+
+
+def make_etag(serialized: str | bytes) -> str:
+    """
+    Create the entity tag of the serialized data.
+    The tag is weak, because the metadata of the response changes with every request.
+    :param serialized: Data serialized into JSON
+    :return: Value of the ETag header
+    """
+    if isinstance(serialized, str):
+        serialized = serialized.encode()
+    return f'W/"{hashlib.blake2b(serialized, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Check whether the client already has the current version of the data.
+    :param if_none_match: Value of the If-None-Match request header
+    :param etag: Entity tag of the current data
+    :return: Whether the response may be answered with 304 Not Modified
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    # Weak comparison ignores the W/ prefix
+    return '*' in tags or etag.removeprefix('W/') in [tag.removeprefix('W/') for tag in tags]
+
+
+def generation(symbol: str) -> int:
+    """
+    Return the number of writes of the symbol seen by this process.
+    :param symbol: Stock market symbol
+    :return: Generation of the symbol data
+    """
+    return _generations.get(symbol.upper(), 0)
+
+
+def get(key: Tuple) -> CachedResponse | None:
+    """
+    Return the cached response, None when it is missing or expired.
+    :param key: Endpoint, symbol and parameters of the request
+    :return: Cached response
+    """
+    with _lock:
+        item = _entries.get(key)
+        if item is None:
+            return None
+        created, response = item
+        if time.monotonic() - created > config.RESPONSE_CACHE_TTL:
+            _remove(key)
+            return None
+        _entries.move_to_end(key)
+        return response
+
+
+def put(key: Tuple, response: CachedResponse, symbol_generation: int) -> None:
+    """
+    Cache the response and evict the least recently used responses over the memory budget.
+    :param key: Endpoint, symbol and parameters of the request, the symbol is the second element
+    :param response: Response to cache
+    :param symbol_generation: Generation of the symbol read before the data was loaded
+    """
+    global _total_size
+    if response.size > config.RESPONSE_CACHE_BYTES:
+        return
+    with _lock:
+        # The symbol was written while the response was prepared
+        if generation(key[1]) != symbol_generation:
+            return
+        if key in _entries:
+            _remove(key)
+        _entries[key] = (time.monotonic(), response)
+        _total_size += response.size
+        while _total_size > config.RESPONSE_CACHE_BYTES:
+            _remove(next(iter(_entries)))
+
+
+def _remove(key: Tuple) -> None:
+    """Remove the entry from the cache, the lock must be held."""
+    global _total_size
+    _, response = _entries.pop(key)
+    _total_size -= response.size
+
+
+def invalidate(symbol: str | None = None) -> None:
+    """
+    Remove the cached responses of the symbol after its data was written, all of them when symbol is None.
+    :param symbol: Stock market symbol
+    """
+    with _lock:
+        if symbol is None:
+            for key in list(_entries):
+                _remove(key)
+            return
+        symbol = symbol.upper()
+        _generations[symbol] = _generations.get(symbol, 0) + 1
+        for key in [key for key in _entries if key[1] == symbol]:
+            _remove(key)
@@ -1,31 +1,144 @@
+import copy
+import json
 import sqlite3
-from pathlib import Path
 import numpy as np
-from config import config
 import pandas as pd
-from typing import Union, List
-from webScrape import app, receiver
+from typing import Union, List, Dict, Tuple, NamedTuple
+from webScrape import app, bars, database, receiver, schema, snapshot
+from backend import response_cache
+
+# Table with the last values of the indicators, used to calculate only the new bars
+STATE_TABLE: str = 'indicator_state'
+# Columns of the symbol table which are not indicators
+PRICE_COLUMNS: List[str] = ['Date', 'Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+# Default parameters of the indicators updated every day
+RSI_WINDOW: int = 14
+MACD_PERIODS: Tuple[int, int, int] = (12, 26, 9)
 
 
 def append_to_table(symbol: str, data: pd.DataFrame, connection: sqlite3.Connection | None = None) -> None:
     """
-    Append new columns into stock symbol table
+    Append new columns into stock symbol table, the indicator values are updated in place by the date
     :param symbol: Stock market symbol
     :param data: Pandas DataFrame with the data to be saved in table
     :param connection: Connection to the database.
     """
-    # Variable responsible for closing database connection
-    single_usage: bool = False
-    if connection is None:
-        single_usage = True
-        connection = sqlite3.connect(Path(config.DATA_DICT, 'stock_database.db'))
-    table_name = app.get_name_of_symbol_table(symbol=symbol, frequency='1d', connection=connection)
-    if table_name is not None:
-        data.to_sql(table_name, connection, if_exists='replace', index=False)
-    else:
-        pass
-    if single_usage:
-        connection.close()
+    # Use the connection of the current thread when the connection is not given
+    with database.connect(connection=connection) as connection:
+        table_name = app.get_name_of_symbol_table(symbol=symbol, frequency='1d', connection=connection)
+        # Indicators of the symbols stored in the shared bars table are calculated on read
+        if table_name is not None and table_name != bars.BARS_TABLE:
+            # Rows are updated by the date, the primary key of the typed schema
+            stored_columns: List[str] = receiver.table_columns(connection, table_name)
+            columns: List[str] = [column for column in data.columns if column not in PRICE_COLUMNS]
+            update_query: str = (f'UPDATE `{table_name}` SET {", ".join(f"`{column}` = ?" for column in columns)} '
+                                 f'WHERE Date = ?;')
+            values: List[list] = [data[column].tolist() for column in columns] + [schema.to_epoch_days(data['Date'])]
+            with connection:
+                for column in columns:
+                    if column not in stored_columns:
+                        connection.execute(f'ALTER TABLE `{table_name}` ADD COLUMN `{column}` REAL;')
+                if columns:
+                    connection.executemany(update_query, zip(*values))
+                snapshot.refresh_snapshot(connection, symbol)
+            response_cache.invalidate(symbol)
+
+
+class IndicatorSpec(NamedTuple):
+    """Technical indicator with its parameters."""
+    name: str
+    period: int = 14
+    fast_period: int = 12
+    slow_period: int = 26
+    signal_period: int = 9
+    af_start: float = 0.02
+    af_increment: float = 0.02
+    af_max: float = 0.2
+    adjust: bool = False
+
+
+def indicator_columns(spec: IndicatorSpec) -> List[str]:
+    """
+    Return names of the table columns filled by the indicator.
+    :param spec: Technical indicator with its parameters
+    :return: List with the column names
+    """
+    if spec.name == 'MACD':
+        return ['MACD_Line', 'MACD_Signal', 'MACD_Hist']
+    if spec.name in ['EMA', 'SMA']:
+        return [f'{spec.name}_{spec.period}']
+    return [spec.name]
+
+
+def _ewm_mean(values: np.ndarray, span: float | None = None, com: float | None = None,
+              adjust: bool = False) -> np.ndarray:
+    """Calculate exponentially weighted mean of the array without copying it."""
+    return pd.Series(values, copy=False).ewm(span=span, com=com, adjust=adjust).mean().to_numpy()
+
+
+def compute_indicators(data: pd.DataFrame, specs: List[IndicatorSpec]) -> Dict[str, np.ndarray]:
+    """
+    Calculate all the indicators from the contiguous price arrays, sharing intermediate results between them.
+    :param data: DataFrame with stock symbol data in chronological order
+    :param specs: List of the technical indicators with their parameters
+    :return: Dictionary with the rounded values of every indicator column
+    """
+    close: np.ndarray = np.ascontiguousarray(data['Close'].to_numpy(dtype=np.float64))
+    results: Dict[str, np.ndarray] = {}
+    # Exponential moving averages of the close prices, shared by the EMA and MACD indicators
+    ema_cache: Dict[int, np.ndarray] = {}
+
+    def close_ema(span: int) -> np.ndarray:
+        if span not in ema_cache:
+            ema_cache[span] = _ewm_mean(close, span=span)
+        return ema_cache[span]
+
+    delta: np.ndarray = np.diff(close)
+    for spec in specs:
+        if spec.name == 'RSI':
+            gain_ema = _ewm_mean(np.where(delta < 0, 0.0, delta), com=spec.period - 1, adjust=spec.adjust)
+            loss_ema = np.abs(_ewm_mean(np.where(delta > 0, 0.0, delta), com=spec.period - 1, adjust=spec.adjust))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rsi = 100 - 100 / (1 + gain_ema / loss_ema)
+            # The first bar has no price change
+            results['RSI'] = np.concatenate(([np.nan], rsi))
+        elif spec.name == 'MACD':
+            macd_line = close_ema(spec.fast_period) - close_ema(spec.slow_period)
+            signal_line = _ewm_mean(macd_line, span=spec.signal_period)
+            results['MACD_Line'] = macd_line
+            results['MACD_Signal'] = signal_line
+            results['MACD_Hist'] = macd_line - signal_line
+        elif spec.name == 'EMA':
+            results[f'EMA_{spec.period}'] = close_ema(spec.period)
+        elif spec.name == 'SMA':
+            sma = pd.Series(close, copy=False).rolling(window=spec.period, min_periods=1).mean()
+            results[f'SMA_{spec.period}'] = sma.to_numpy()
+        elif spec.name == 'PSAR':
+            results['PSAR'] = parabolic_sar(data['High'].to_numpy(), data['Low'].to_numpy(),
+                                            spec.af_start, spec.af_increment, spec.af_max)
+    return {column: np.round(values, 2) for column, values in results.items()}
+
+
+def calculate_indicators(symbol: str, specs: List[IndicatorSpec], connection: sqlite3.Connection | None = None,
+                         append: bool = True, data: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Calculate the list of technical indicators and save all of them with a single write.
+    :param symbol: Stock market symbol
+    :param specs: List of the technical indicators with their parameters
+    :param connection: Connection to the database.
+    :param append: Determine whether return data or append to the database table
+    :param data: DataFrame with stock symbol data in chronological order. Default None
+    :return: Pandas DataFrame with data and extra indicator columns, latest data first
+    """
+    # Fetch the data from the database and reverse for indicators calculation
+    if data is None:
+        data: pd.DataFrame = receiver.receive_data(symbol, connection)[::-1]
+    # New frame, the given data might be a reversed slice of the caller's frame
+    data = data.assign(**compute_indicators(data, specs))
+    if append:
+        # Append new data to the database table
+        append_to_table(symbol, data[::-1], connection)
+    return data[::-1]
 
 
 def calculate_RSI(symbol: str, connection: sqlite3.Connection | None = None, window: int = 14, adjust: bool = False, append: bool = True,
@@ -37,34 +150,10 @@ def calculate_RSI(symbol: str, connection: sqlite3.Connection | None = None, win
     :param window: The number of periods over which the RSI calculation should be performed
     :param adjust: Bool value passed to 'ewm' method
     :param append: Determine whether return data or append to the database table
-    :param data: DataFrame with stock symbol data. Default None
+    :param data: DataFrame with stock symbol data in chronological order. Default None
     :return: Pandas DataFrame with data and extra RSI column
     """
-    # Fetch the data from the database and reverse for RSI calculation
-    if data is None:
-        data: pd.DataFrame = receiver.receive_data(symbol)[::-1]
-    delta = data['Close'].diff(1).dropna()
-    loss = delta.copy()
-    gains = delta.copy()
-
-    gains[gains < 0] = 0
-    loss[loss > 0] = 0
-
-    gain_ema = gains.ewm(com=window - 1, adjust=adjust).mean()
-    loss_ema = abs(loss.ewm(com=window - 1, adjust=adjust).mean())
-
-    RS = gain_ema / loss_ema
-    RSI = 100 - 100 / (1 + RS)
-
-    RSI = RSI[::-1]
-    # Append data to the symbol table in the database
-    data.loc[:, 'RSI'] = round(RSI, 2)
-    if append:
-        # Append new data to the database table
-        append_to_table(symbol, data[::-1], connection)
-    # Set Date as index in the DataFrame
-    data.set_index('Date')
-    return data[::-1]
+    return calculate_indicators(symbol, [IndicatorSpec('RSI', period=window, adjust=adjust)], connection, append, data)
 
 
 def calculate_MACD(symbol: str, connection: sqlite3.Connection | None = None, fast_period: int = 12, slow_period: int = 26, signal_period: int = 9,
@@ -77,32 +166,11 @@ def calculate_MACD(symbol: str, connection: sqlite3.Connection | None = None, fa
     :param slow_period: The number of periods for the long-term
     :param signal_period: The number of periods for the Signal Line
     :param append: Determine whether return data or append to the database table
-    :param data: DataFrame with stock symbol data. Default None
+    :param data: DataFrame with stock symbol data in chronological order. Default None
     :return: Pandas DataFrame with data and extra MACD columns
     """
-    # Fetch the data from the database and reverse for MACD calculation
-    if data is None:
-        data: pd.DataFrame = receiver.receive_data(symbol)
-    # Calculate the Short-term EMA (fast EMA)
-    short_ema = data['Close'].ewm(span=fast_period, adjust=False).mean()
-    # Calculate the Long-term EMA (slow EMA)
-    long_ema = data['Close'].ewm(span=slow_period, adjust=False).mean()
-    # Calculate the MACD line
-    macd_line = short_ema - long_ema
-    # Calculate the Signal line (9-day EMA of MACD line)
-    signal_line = macd_line.ewm(span=signal_period, adjust=False).mean()
-    # Calculate the MACD histogram
-    histogram = macd_line - signal_line
-    # Append data to the symbol table in the database
-    data['MACD_Line'] = round(macd_line, 2)
-    data['MACD_Signal'] = round(signal_line, 2)
-    data['MACD_Hist'] = round(histogram, 2)
-    if append:
-        # Append new data to the database table
-        append_to_table(symbol, data[::-1], connection)
-    # Set Date as index in the DataFrame
-    data.set_index('Date')
-    return data[::-1]
+    spec = IndicatorSpec('MACD', fast_period=fast_period, slow_period=slow_period, signal_period=signal_period)
+    return calculate_indicators(symbol, [spec], connection, append, data)
 
 
 def calculate_EMA(symbol: str, connection: sqlite3.Connection | None = None, period: int = 10, append: bool = True,
@@ -113,21 +181,10 @@ def calculate_EMA(symbol: str, connection: sqlite3.Connection | None = None, per
     :param connection: Connection to the database.
     :param period: The number of periods over which the EMA calculation is performed
     :param append: Determine whether return data or append to the database table
-    :param data: DataFrame with stock symbol data. Default None
+    :param data: DataFrame with stock symbol data in chronological order. Default None
     :return: Pandas DataFrame with data and extra EMA column
     """
-    # Fetch the data from the database and reverse for EMA calculation
-    if data is None:
-        data: pd.DataFrame = receiver.receive_data(symbol)
-    # Calculate Exponential Moving Average Indicator
-    ema = data['Close'].ewm(span=period, adjust=False).mean()
-    data[f'EMA_{period}'] = round(ema, 2)
-    if append:
-        # Append new data to the database table
-        append_to_table(symbol, data[::-1], connection)
-    # Set Date as index in the DataFrame
-    data.set_index('Date')
-    return data[::-1]
+    return calculate_indicators(symbol, [IndicatorSpec('EMA', period=period)], connection, append, data)
 
 
 def calculate_SMA(symbol: str, connection: sqlite3.Connection | None = None, period: int = 14, append: bool = True,
@@ -136,84 +193,133 @@ def calculate_SMA(symbol: str, connection: sqlite3.Connection | None = None, per
     Calculate Simple Moving Average Indicator (SMA) values for given data
     :param symbol: Stock market symbol
     :param connection: Connection to the database.
-    :param symbol: Stock market symbol
     :param period: The number of periods over which the SMA calculation is performed
     :param append: Determine whether return data or append to the database table
-    :param data: DataFrame with stock symbol data. Default None
+    :param data: DataFrame with stock symbol data in chronological order. Default None
     :return: Pandas DataFrame with data and extra SMA column
     """
-    # Fetch the data from the database and reverse for SMA calculation
-    if data is None:
-        data: pd.DataFrame = receiver.receive_data(symbol)
-    # Calculate Simple Moving Average Indicator
-    sma = data['Close'].rolling(window=period, min_periods=1).mean()
-    data[f'SMA_{period}'] = round(sma, 2)
-    if append:
-        # Append new data to the database table
-        append_to_table(symbol, data[::-1], connection)
-    # Set Date as index in the DataFrame
-    data.set_index('Date')
-    return data[::-1]
+    return calculate_indicators(symbol, [IndicatorSpec('SMA', period=period)], connection, append, data)
 
 
-def calculate_PSAR(symbol: str, af_start=0.02, af_increment=0.02, af_max=0.2, append=True) -> pd.DataFrame:
-    """
-        Calculate Parabolic SAR Indicator (PSAR) values for given data
-        :param symbol: Stock market symbol
-        :param af_start:
-        :param af_increment:
-        :param af_max:
-        :param append: Determine whether return data or append to the database table
-        :return: Pandas DataFrame with data and extra PSAR column
-        """
-    # Fetch the data from the database and reverse for RSI calculation
-    data: pd.DataFrame = receiver.receive_data(symbol)
-    high_prices = data['High']
-    low_prices = data['Low']
-
-    # Initialize variables
-    af: float = af_start
-    psar: List[float] = []
-    uptrend: bool = True
-    extreme_high = high_prices.iloc[0]
-    extreme_low = low_prices.iloc[0]
-    sar = low_prices.iloc[0] if uptrend else high_prices.iloc[0]
-
-    for i in range(len(data)):
+def _psar_kernel(high, low, af_start: float, af_increment: float, af_max: float, uptrend: bool, af: float,
+                 extreme: float, sar: float, start: int):
+    """
+    Calculate Parabolic SAR values bar by bar, the indicator depends on its previous value.
+    :param high: High prices in chronological order
+    :param low: Low prices in chronological order
+    :param af_start: Initial acceleration factor
+    :param af_increment: Acceleration factor increment for every new extreme point
+    :param af_max: Maximum acceleration factor
+    :param uptrend: Trend of the bar preceding the start index
+    :param af: Acceleration factor of the bar preceding the start index
+    :param extreme: Extreme point of the bar preceding the start index
+    :param sar: SAR value of the bar preceding the start index
+    :param start: Index of the first calculated bar, previous bars are used only as a history
+    :return: Numpy array with PSAR values and the state after the last bar
+    """
+    n = len(high)
+    psar = np.empty(n)
+    psar[:start] = sar
+    for i in range(start, n):
+        sar = sar + af * (extreme - sar)
         if uptrend:
-            if high_prices.iloc[i] > extreme_high:
-                extreme_high = high_prices.iloc[i]
-                af = min(af + af_increment, af_max)
-
-            sar = sar + af * (extreme_high - sar)
-
-            if low_prices.iloc[i] < sar:
+            # SAR cannot be placed above the lows of two previous bars
+            sar = min(sar, low[i - 1], low[i - 2] if i > 1 else low[i - 1])
+            if low[i] < sar:
                 uptrend = False
-                sar = extreme_high
-                extreme_low = low_prices.iloc[i]
+                sar = extreme
+                extreme = low[i]
                 af = af_start
-
+            elif high[i] > extreme:
+                extreme = high[i]
+                af = min(af + af_increment, af_max)
         else:
-            if low_prices.iloc[i] < extreme_low:
-                extreme_low = low_prices.iloc[i]
+            # SAR cannot be placed below the highs of two previous bars
+            sar = max(sar, high[i - 1], high[i - 2] if i > 1 else high[i - 1])
+            if high[i] > sar:
+                uptrend = True
+                sar = extreme
+                extreme = high[i]
+                af = af_start
+            elif low[i] < extreme:
+                extreme = low[i]
                 af = min(af + af_increment, af_max)
+        psar[i] = sar
+    return psar, uptrend, af, extreme, sar
 
-            sar = sar - af * (sar - extreme_low)
 
-            if high_prices.iloc[i] > sar:
-                uptrend = True
-                sar = extreme_low
-                extreme_high = high_prices.iloc[i]
-                af = af_start
+# Compile the PSAR kernel when Numba is available
+try:
+    import numba
+    _psar_compiled = numba.njit(cache=True)(_psar_kernel)
+except ImportError:
+    _psar_compiled = None
+
+
+def _run_psar(high: np.ndarray, low: np.ndarray, af_start: float, af_increment: float, af_max: float,
+              uptrend: bool, af: float, extreme: float, sar: float, start: int):
+    """
+    Execute compiled PSAR kernel or its pure Python version.
+    Every SAR value depends on the previous one, so the fallback cannot be vectorized with numpy and stays a loop
+    over plain floats. benchmarks/bench_psar.py measures it without Numba, about 20x faster than the iloc loop.
+    """
+    high = np.ascontiguousarray(high, dtype=np.float64)
+    low = np.ascontiguousarray(low, dtype=np.float64)
+    if _psar_compiled is not None:
+        return _psar_compiled(high, low, af_start, af_increment, af_max, uptrend, af, extreme, sar, start)
+    # Python floats are much faster to iterate than numpy scalars
+    return _psar_kernel(high.tolist(), low.tolist(), af_start, af_increment, af_max, uptrend, af, extreme, sar, start)
 
-        psar.append(sar)
 
-    print(pd.Series(psar, index=data.index))
-    # return pd.Series(psar, index=df.index)
+def parabolic_sar(high: np.ndarray, low: np.ndarray, af_start: float = 0.02, af_increment: float = 0.02,
+                  af_max: float = 0.2) -> np.ndarray:
+    """
+    Calculate Parabolic SAR Indicator (PSAR) values for given prices
+    :param high: High prices in chronological order
+    :param low: Low prices in chronological order
+    :param af_start: Initial acceleration factor
+    :param af_increment: Acceleration factor increment for every new extreme point
+    :param af_max: Maximum acceleration factor
+    :return: Numpy array with PSAR values
+    """
+    if len(high) == 0:
+        return np.empty(0)
+    # Start with the uptrend and the first low as SAR
+    return _run_psar(high, low, af_start, af_increment, af_max, True, af_start, float(high[0]), float(low[0]), 1)[0]
+
+
+def calculate_PSAR(symbol: str, connection: sqlite3.Connection | None = None, af_start: float = 0.02,
+                   af_increment: float = 0.02, af_max: float = 0.2, append: bool = True,
+                   data: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Calculate Parabolic SAR Indicator (PSAR) values for given data
+    :param symbol: Stock market symbol
+    :param connection: Connection to the database.
+    :param af_start: Initial acceleration factor
+    :param af_increment: Acceleration factor increment for every new extreme point
+    :param af_max: Maximum acceleration factor
+    :param append: Determine whether return data or append to the database table
+    :param data: DataFrame with stock symbol data in chronological order. Default None
+    :return: Pandas DataFrame with data and extra PSAR column
+    """
+    spec = IndicatorSpec('PSAR', af_start=af_start, af_increment=af_increment, af_max=af_max)
+    return calculate_indicators(symbol, [spec], connection, append, data)
+
+
+def select_rows(data: pd.DataFrame, start: str | None = None, end: str | None = None,
+                 limit: int | None = None) -> pd.DataFrame:
+    """Return the rows of the data indexed by the date, the latest first, within the date range."""
+    if start is not None:
+        data = data[data.index >= start]
+    if end is not None:
+        data = data[data.index <= end]
+    return data.iloc[:limit]
 
 
 def get_indicator(symbol: str, indicator: str, period: int = 14, fast_period: int = 12, slow_period: int = 26,
-                  signal_period: int = 9) -> pd.DataFrame:
+                  signal_period: int = 9, af_start: float = 0.02, af_increment: float = 0.02,
+                  af_max: float = 0.2, start: str | None = None, end: str | None = None,
+                  columns: List[str] | None = None, limit: int | None = None) -> pd.DataFrame:
     """
     Get the specific indicator for stock symbol.
     :param symbol: Stock market symbol
@@ -222,94 +328,360 @@ def get_indicator(symbol: str, indicator: str, period: int = 14, fast_period: in
     :param fast_period: The number of periods for the short-term
     :param slow_period: The number of periods for the long-term
     :param signal_period: The number of periods for the Signal Line
+    :param af_start: Initial acceleration factor of the PSAR
+    :param af_increment: Acceleration factor increment of the PSAR
+    :param af_max: Maximum acceleration factor of the PSAR
+    :param start: Beginning of the returned period of time, valid format: "2021-09-08"
+    :param end: End of the returned period of time, valid format: "2021-08-08"
+    :param columns: Names of the indicator columns to return, None returns all of them
+    :param limit: Maximum number of the latest rows to return
     :return: Pandas DataFrame with indicator data
     """
     # Check whether the parameters are default
     non_default_params: bool = False
     if period != 14 or fast_period != 12 or slow_period != 26 or signal_period != 9:
         non_default_params = True
+    if af_start != 0.02 or af_increment != 0.02 or af_max != 0.2:
+        non_default_params = True
     # Available indicators
-    available_indicators: List[str] = ['MACD', 'RSI', 'EMA', 'SMA']
-    # Get the name of the symbol table
-    table_name = app.get_name_of_symbol_table(symbol=symbol, frequency='1d')
-    if table_name is not None:
-        append_new_indicator: bool = False
-        if not non_default_params:
-            data = receiver.receive_data(symbol, change_index=True)
-            return_column: List[str] = [col for col in data.columns if indicator in col]
-            if len(return_column) != 0:
-                return data[return_column]
-            # Indicate the methods to append the new column with indicator
-            append_new_indicator = True
-        if indicator in available_indicators:
-            if indicator == 'MACD':
-                data = calculate_MACD(symbol, fast_period, slow_period, signal_period, append=append_new_indicator)
-            elif indicator == 'RSI':
-                data = calculate_RSI(symbol, window=period, append=append_new_indicator)
-            elif indicator == 'EMA':
-                data = calculate_EMA(symbol, period=period, append=append_new_indicator)
-            elif indicator == 'SMA':
-                data = calculate_SMA(symbol, period=period, append=append_new_indicator)
+    available_indicators: List[str] = ['MACD', 'RSI', 'EMA', 'SMA', 'PSAR']
+    with database.connect() as connection:
+        # Get the name of the symbol table
+        table_name = app.get_name_of_symbol_table(symbol=symbol, frequency='1d', connection=connection)
+        if table_name is not None:
+            append_new_indicator: bool = False
+            if not non_default_params:
+                stored_columns: List[str] = receiver.table_columns(connection, table_name)
+                return_column: List[str] = [col for col in stored_columns if indicator in col]
+                if len(return_column) != 0:
+                    # Read only the requested columns and rows of the stored indicator
+                    if columns is not None:
+                        return_column = receiver.select_columns(return_column, columns)[1:]
+                    return receiver.receive_data(symbol, connection, start=start, end=end, change_index=True,
+                                                 columns=return_column, limit=limit)
+                # Indicate the methods to append the new column with indicator
+                append_new_indicator = True
+            if indicator in available_indicators:
+                spec = IndicatorSpec(indicator, period, fast_period, slow_period, signal_period,
+                                     af_start, af_increment, af_max)
+                data = calculate_indicators(symbol, [spec], connection, append=append_new_indicator).set_index('Date')
+                return_column: List[str] = [col for col in data.columns if indicator in col]
+                if columns is not None:
+                    return_column = receiver.select_columns(return_column, columns)[1:]
+                return select_rows(data[return_column], start, end, limit)
             else:
-                data = receiver.receive_data(symbol, change_index=True)
-            return_column: List[str] = [col for col in data.columns if indicator in col]
-            return data[return_column]
-        else:
-            print(f'Given indicator [{indicator}] is not handled for {symbol}!')
+                print(f'Given indicator [{indicator}] is not handled for {symbol}!')
+
+
+def _ewm_alpha(span: float | None = None, com: float | None = None) -> float:
+    """Return the smoothing factor of the exponentially weighted mean, calculated the same way as pandas."""
+    if span is not None:
+        com = (span - 1) / 2.0
+    return 1.0 / (1.0 + com)
+
+
+def _ewm_step(previous: float, value: float, alpha: float) -> float:
+    """
+    Calculate next value of the exponentially weighted mean with adjust=False.
+    The formula mirrors pandas implementation, so continued values are equal to the full recalculation.
+    """
+    if previous != value:
+        old_weight = 1.0 - alpha
+        return (old_weight * previous + alpha * value) / (old_weight + alpha)
+    return previous
+
+
+def create_state_table(connection: sqlite3.Connection) -> None:
+    """
+    Create the table with the indicator states if it does not exist yet.
+    :param connection: Connection to the SQLite database
+    """
+    connection.execute(f'''
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            "symbol" TEXT NOT NULL,
+            "frequency" TEXT NOT NULL,
+            "state" TEXT NOT NULL,
+            PRIMARY KEY("symbol", "frequency")
+        );
+    ''')
+
+
+def load_indicator_state(connection: sqlite3.Connection, symbol: str, frequency: str = '1d') -> Dict | None:
+    """
+    Load the saved state of the symbol indicators.
+    :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
+    :param frequency: String specifying the frequency of the data, defaults-1d
+    :return: Dictionary with the state or None when the state was not saved
+    """
+    create_state_table(connection)
+    row = connection.execute(f'SELECT state FROM {STATE_TABLE} WHERE symbol = ? AND frequency = ?;',
+                             (symbol.upper(), frequency)).fetchone()
+    return json.loads(row[0]) if row is not None else None
+
+
+def save_indicator_state(connection: sqlite3.Connection, symbol: str, state: Dict, frequency: str = '1d') -> None:
+    """
+    Save the state of the symbol indicators, committed by the caller.
+    :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
+    :param state: Dictionary with the state of the indicators
+    :param frequency: String specifying the frequency of the data, defaults-1d
+    """
+    create_state_table(connection)
+    connection.execute(f'INSERT OR REPLACE INTO {STATE_TABLE} (symbol, frequency, state) VALUES (?, ?, ?);',
+                       (symbol.upper(), frequency, json.dumps(state)))
 
 
-def update_single_symbol(connection: sqlite3.Connection, symbol: str, database_name: str = 'stock_database.db') -> None:
+def rewind_indicator_state(connection: sqlite3.Connection, symbol: str, first_date: str,
+                           frequency: str = '1d') -> None:
+    """
+    Rewind the saved state before the rows overwritten by the new data, so they are calculated again.
+    Committed by the caller together with the new data.
+    Overwriting only the last calculated bar restores the state before it, otherwise the state is dropped
+    and the next update recalculates the whole table.
+    :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
+    :param first_date: The earliest saved date in the "YYYY-MM-DD" format
+    :param frequency: String specifying the frequency of the data, defaults-1d
+    """
+    state = load_indicator_state(connection, symbol, frequency)
+    if state is None or first_date > state['last_date']:
+        return
+    previous = state.get('previous')
+    if previous is not None and first_date > previous['last_date']:
+        save_indicator_state(connection, symbol, previous, frequency)
+        return
+    connection.execute(f'DELETE FROM {STATE_TABLE} WHERE symbol = ? AND frequency = ?;', (symbol.upper(), frequency))
+
+
+def build_indicator_state(data: pd.DataFrame, columns: List[str], previous: bool = True) -> Dict:
+    """
+    Create the state of the indicators after the last bar of the data.
+    :param data: DataFrame with stock symbol data in chronological order
+    :param columns: Names of the indicator columns stored in the symbol table
+    :param previous: Whether to keep the state before the last bar, restored when the last bar is overwritten
+    :return: Dictionary with the last values required to continue the indicators
+    """
+    close: pd.Series = data['Close'].astype(float)
+    state: Dict = {
+        'first_date': data['Date'].iloc[0],
+        'last_date': data['Date'].iloc[-1],
+        'close': close.iloc[-1],
+        'columns': columns,
+        'rsi': None,
+        'macd': None,
+        'ema': {},
+        'sma': {},
+        'psar': None
+    }
+    if 'RSI' in columns and len(close) > 1:
+        delta = close.diff(1).dropna()
+        gain_ema = delta.clip(lower=0).ewm(com=RSI_WINDOW - 1, adjust=False).mean()
+        loss_ema = delta.clip(upper=0).ewm(com=RSI_WINDOW - 1, adjust=False).mean()
+        state['rsi'] = [gain_ema.iloc[-1], loss_ema.iloc[-1]]
+    if 'MACD_Line' in columns:
+        short_ema = close.ewm(span=MACD_PERIODS[0], adjust=False).mean()
+        long_ema = close.ewm(span=MACD_PERIODS[1], adjust=False).mean()
+        signal_line = (short_ema - long_ema).ewm(span=MACD_PERIODS[2], adjust=False).mean()
+        state['macd'] = [short_ema.iloc[-1], long_ema.iloc[-1], signal_line.iloc[-1]]
+    for column in columns:
+        if column.startswith('EMA_'):
+            state['ema'][column] = close.ewm(span=int(column.split('_')[1]), adjust=False).mean().iloc[-1]
+        elif column.startswith('SMA_'):
+            state['sma'][column] = close.iloc[-(int(column.split('_')[1]) - 1):].tolist() \
+                if int(column.split('_')[1]) > 1 else []
+    if 'PSAR' in columns:
+        _, uptrend, af, extreme, sar = _run_psar(data['High'].to_numpy(), data['Low'].to_numpy(), 0.02, 0.02, 0.2,
+                                                 True, 0.02, float(data['High'].iloc[0]),
+                                                 float(data['Low'].iloc[0]), 1)
+        state['psar'] = [bool(uptrend), af, extreme, sar,
+                         data['High'].astype(float).iloc[-2:].tolist(), data['Low'].astype(float).iloc[-2:].tolist()]
+    if previous and len(data) > 1:
+        state['previous'] = build_indicator_state(data.iloc[:-1], columns, previous=False)
+    return state
+
+
+def continue_indicators(state: Dict, highs: List[float], lows: List[float],
+                        closes: List[float]) -> Tuple[Dict[str, List[float]], Dict]:
+    """
+    Calculate the indicators only for the new bars, starting from the saved state.
+    :param state: Dictionary with the state after the last calculated bar
+    :param highs: High prices of the new bars in chronological order
+    :param lows: Low prices of the new bars in chronological order
+    :param closes: Close prices of the new bars in chronological order
+    :return: Rounded values of every indicator column and the state after the last new bar
+    """
+    values: Dict[str, List[float]] = {column: [] for column in state['columns']}
+    previous_close: float = state['close']
+    rsi_alpha: float = _ewm_alpha(com=RSI_WINDOW - 1)
+    macd_alphas: List[float] = [_ewm_alpha(span=period) for period in MACD_PERIODS]
+    for close in closes:
+        if 'RSI' in values:
+            delta = close - previous_close
+            gain, loss = max(delta, 0.0), min(delta, 0.0)
+            if state['rsi'] is None:
+                state['rsi'] = [gain, loss]
+            else:
+                state['rsi'] = [_ewm_step(state['rsi'][0], gain, rsi_alpha),
+                                _ewm_step(state['rsi'][1], loss, rsi_alpha)]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rs = np.float64(state['rsi'][0]) / abs(np.float64(state['rsi'][1]))
+            values['RSI'].append(100 - 100 / (1 + rs))
+        if 'MACD_Line' in values:
+            short_ema = _ewm_step(state['macd'][0], close, macd_alphas[0])
+            long_ema = _ewm_step(state['macd'][1], close, macd_alphas[1])
+            macd_line = short_ema - long_ema
+            signal_line = _ewm_step(state['macd'][2], macd_line, macd_alphas[2])
+            state['macd'] = [short_ema, long_ema, signal_line]
+            values['MACD_Line'].append(macd_line)
+            values['MACD_Signal'].append(signal_line)
+            values['MACD_Hist'].append(macd_line - signal_line)
+        for column in state['ema']:
+            state['ema'][column] = _ewm_step(state['ema'][column], close, _ewm_alpha(span=int(column.split('_')[1])))
+            values[column].append(state['ema'][column])
+        previous_close = close
+    # Simple moving averages are calculated over the saved window tail and new closes
+    for column, tail in state['sma'].items():
+        period = int(column.split('_')[1])
+        window = pd.Series(tail + closes, dtype=float).rolling(window=period, min_periods=1).mean()
+        values[column] = window.iloc[len(tail):].tolist()
+        state['sma'][column] = (tail + closes)[-(period - 1):] if period > 1 else []
+    if state['psar'] is not None:
+        uptrend, af, extreme, sar, high_tail, low_tail = state['psar']
+        psar, uptrend, af, extreme, sar = _run_psar(np.array(high_tail + highs), np.array(low_tail + lows),
+                                                    0.02, 0.02, 0.2, uptrend, af, extreme, sar, len(high_tail))
+        values['PSAR'] = psar[len(high_tail):].tolist()
+        state['psar'] = [bool(uptrend), af, extreme, sar, (high_tail + highs)[-2:], (low_tail + lows)[-2:]]
+    state['close'] = previous_close
+    # Round the values the same way as the full calculation
+    values = {column: np.round(np.array(column_values, dtype=float), 2).tolist()
+              for column, column_values in values.items()}
+    return values, state
+
+
+def update_indicators_incrementally(connection: sqlite3.Connection, symbol: str, table_name: str,
+                                    table_columns: List[str], state: Dict) -> bool:
+    """
+    Calculate the indicators only for the bars appended after the saved state and update their rows.
+    :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
+    :param table_name: Name of the stock symbol table
+    :param table_columns: Names of all the symbol table columns
+    :param state: Dictionary with the state after the last calculated bar
+    :return: Whether the state was valid for the table and the indicators were updated
+    """
+    # The state is valid only for the same indicators and unchanged beginning of the data
+    indicator_columns: List[str] = [column for column in table_columns if column not in PRICE_COLUMNS]
+    if set(indicator_columns) != set(state['columns']):
+        return False
+    # The state keeps the "YYYY-MM-DD" dates, typed tables convert them inside the queries
+    typed: bool = schema.has_epoch_dates(schema.column_types(connection, table_name))
+    first_date = connection.execute(f'SELECT {schema.date_column(typed)} FROM `{table_name}` '
+                                    f'ORDER BY `{table_name}`.Date LIMIT 1;').fetchone()[0]
+    if first_date != state['first_date']:
+        return False
+    # Fetch only the bars appended after the last calculated one
+    cursor = connection.execute(f'SELECT {schema.date_column(typed)}, High, Low, Close FROM `{table_name}` '
+                                f'WHERE `{table_name}`.Date > {schema.date_parameter(typed)} '
+                                f'ORDER BY `{table_name}`.Date;', (state['last_date'],))
+    rows: List[Tuple] = cursor.fetchall()
+    if len(rows) == 0:
+        return True
+    dates: List[str] = [row[0] for row in rows]
+    highs, lows, closes = ([float(str(row[i]).replace(',', '')) for row in rows] for i in range(1, 4))
+    # Keep the state before the last bar, the bar is downloaded again by the next update
+    state.pop('previous', None)
+    values, state = continue_indicators(state, highs[:-1], lows[:-1], closes[:-1])
+    if len(rows) > 1:
+        state['last_date'] = dates[-2]
+    previous: Dict = copy.deepcopy(state)
+    last_values, state = continue_indicators(state, highs[-1:], lows[-1:], closes[-1:])
+    values = {column: values[column] + last_values[column] for column in values}
+    state['last_date'] = dates[-1]
+    state['previous'] = previous
+    # Update indicator columns of the new rows inside a single transaction
+    columns: List[str] = state['columns']
+    update_query: str = (f'UPDATE `{table_name}` SET {", ".join(f"`{column}` = ?" for column in columns)} '
+                         f'WHERE Date = {schema.date_parameter(typed)};')
+    with connection:
+        connection.executemany(update_query, zip(*(values[column] for column in columns), dates))
+        snapshot.refresh_snapshot(connection, symbol)
+        save_indicator_state(connection, symbol, state)
+    response_cache.invalidate(symbol)
+    return True
+
+
+def daily_indicator_specs(table_columns: List[str]) -> List[IndicatorSpec]:
+    """
+    Return the indicators updated every day for the symbol table.
+    :param table_columns: Names of all the symbol table columns
+    :return: List with the default indicators and the extra ones already stored in the table
+    """
+    ema_periods: List[int] = [int(column.split('_')[1]) for column in table_columns if column.startswith('EMA_')]
+    sma_periods: List[int] = [int(column.split('_')[1]) for column in table_columns if column.startswith('SMA_')]
+    specs: List[IndicatorSpec] = [IndicatorSpec('RSI', period=RSI_WINDOW),
+                                  IndicatorSpec('MACD', fast_period=MACD_PERIODS[0], slow_period=MACD_PERIODS[1],
+                                                signal_period=MACD_PERIODS[2])]
+    specs += [IndicatorSpec('EMA', period=period) for period in ema_periods or [10]]
+    specs += [IndicatorSpec('SMA', period=period) for period in sma_periods or [14]]
+    # PSAR is calculated once it was requested for the symbol
+    if 'PSAR' in table_columns:
+        specs.append(IndicatorSpec('PSAR'))
+    return specs
+
+
+def update_single_symbol(connection: sqlite3.Connection, symbol: str, database_name: str = 'stock_database.db',
+                         incremental: bool = True) -> None:
     """
     Update the technical indicators for a single stock symbol
     :param connection: Connection to the SQLite database
     :param symbol: Stock market symbol
     :param database_name: Name of the database where data will be saved. Default "stock_database"
+    :param incremental: Whether to calculate indicators only for the new bars when the state is saved
     """
     # Get the name of symbol table
     table_name = app.get_name_of_symbol_table(symbol, '1d', connection, database_name)
-    if table_name is not None:
+    # Indicators of the symbols stored in the shared bars table are calculated on read
+    if table_name is not None and table_name != bars.BARS_TABLE:
         # Fetch all the table columns
         column_exists = connection.execute(f'PRAGMA table_info(`{table_name}`);')
         table_columns = [col[1] for col in column_exists]
-        # Create a lists with all the SMA, EMA periods
-        ema_periods = [ema for ema in table_columns if 'EMA' in ema]
-        sma_periods = [sma for sma in table_columns if 'SMA' in sma]
-
+        # Continue the indicators from the saved state
+        if incremental:
+            state = load_indicator_state(connection, symbol)
+            if state is not None and update_indicators_incrementally(connection, symbol, table_name,
+                                                                     table_columns, state):
+                return
         # Receive data for calculating indicators
         data: pd.DataFrame = receiver.receive_data(symbol, connection=connection, database_name=database_name)[::-1]
-        # Execute all the indicator methods
-        calculate_RSI(symbol, connection=connection, data=data)  # Calculate RSI
-        calculate_MACD(symbol, connection=connection, data=data)  # Calculate MACD
-        if len(ema_periods) != 0:  # Calculate all the EMA's
-            for ema in ema_periods:
-                calculate_EMA(symbol, connection=connection, period=int(ema.split('_')[1]), data=data)
-        else:
-            calculate_EMA(symbol, connection=connection, data=data)
+        # Calculate all the indicators in one pass and save them with a single write
+        calculate_indicators(symbol, daily_indicator_specs(table_columns), connection=connection, data=data)
 
-        if len(sma_periods) != 0:  # Calculate all the SMA's
-            for sma in sma_periods:
-                calculate_SMA(symbol, connection=connection, period=int(sma.split('_')[1]), data=data)
-        else:
-            calculate_SMA(symbol, connection=connection, data=data)
+        # Save the state for the incremental calculation of the next bars
+        column_exists = connection.execute(f'PRAGMA table_info(`{table_name}`);')
+        stored_columns = [col[1] for col in column_exists if col[1] not in PRICE_COLUMNS]
+        with connection:
+            save_indicator_state(connection, symbol, build_indicator_state(data, stored_columns))
 
 
-def update_indicators(symbols: Union[str, List[str], np.ndarray], database_name: str = 'stock_database.db') -> None:
+def update_indicators(symbols: Union[str, List[str], np.ndarray], database_name: str = 'stock_database.db',
+                      incremental: bool = True) -> None:
     """
     Update the technical indicators for given symbols
     :param symbols: Stock market symbols
     :param database_name: Name of the database where data will be saved. Default "stock_database"
+    :param incremental: Whether to calculate indicators only for the new bars when the state is saved
     """
-    # Create connection with the database
-    conn = sqlite3.connect(Path(config.DATA_DICT, database_name))
-    # Update indicators for the single symbol
-    if isinstance(symbols, str):
-        update_single_symbol(conn, symbols, database_name)
-    # Update indicators for the list of symbols
-    elif isinstance(symbols, list):
-        for symbol in symbols:
-            update_single_symbol(conn, symbol, database_name)
-    # Close the database connection
-    conn.close()
+    # Share the connection of the current thread between all the symbols
+    with database.connect(database_name) as conn:
+        # Update indicators for the single symbol
+        if isinstance(symbols, str):
+            update_single_symbol(conn, symbols, database_name, incremental)
+        # Update indicators for the list of symbols
+        elif isinstance(symbols, list):
+            for symbol in symbols:
+                update_single_symbol(conn, symbol, database_name, incremental)
 
 
 if __name__ == '__main__':
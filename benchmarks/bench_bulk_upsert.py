@@ -0,0 +1,69 @@
+"""
+Compare the daily update of a 50 year daily table saved with pandas to_sql and delete_duplicates
+against the bulk upsert into the table with the unique dates.
+Every update appends a week of bars, the first of them already saved, the same as define_update_range.
+Run from the repository root: python -m benchmarks.bench_bulk_upsert
+"""
+import datetime
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+import numpy as np
+import pandas as pd
+from webScrape import database, db_controller
+
+BARS: int = 50 * 252
+UPDATES: int = 20
+UPDATE_BARS: int = 5
+
+
+def history(bars: int, end: datetime.date, seed: int = 0) -> pd.DataFrame:
+    """Create daily prices ending on the given date, the latest rows first."""
+    rng = np.random.default_rng(seed)
+    close = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.01, bars))), 2)
+    return pd.DataFrame({
+        'Date': pd.bdate_range(end=end, periods=bars).strftime('%Y-%m-%d'),
+        'Open': close, 'High': close + 0.5, 'Low': close - 0.5, 'Close': close, 'Adj Close': close,
+        'Volume': rng.integers(1_000_000, 50_000_000, bars)
+    })[::-1].reset_index(drop=True)
+
+
+def legacy_save(connection, table_name: str, data: pd.DataFrame) -> None:
+    """Previous write path, the duplicates are removed by scanning the whole table."""
+    data.to_sql(table_name, connection, if_exists='append', index=False)
+    db_controller.delete_duplicates(connection, table_name)
+
+
+def upsert_save(connection, table_name: str, data: pd.DataFrame) -> None:
+    """Current write path, the rows are upserted and committed in a single transaction."""
+    with database.transaction(connection):
+        db_controller.upsert_rows(connection, table_name, data)
+
+
+def run(save, directory: Path, name: str) -> List[float]:
+    """Load the full history and measure the following updates."""
+    connection = database.open_connection(Path(directory, f'{name}.db'))
+    end = datetime.date(2023, 1, 2)
+    start_time = time.perf_counter()
+    save(connection, 'stock_BENCH|oldest_1973-01-01&freq=1d', history(BARS, end))
+    timings: List[float] = [time.perf_counter() - start_time]
+    for update in range(UPDATES):
+        # The last saved bar is downloaded again together with the new ones
+        end = (pd.Timestamp(end) + pd.offsets.BDay(UPDATE_BARS - 1)).date()
+        data = history(UPDATE_BARS, end, seed=update + 1)
+        start_time = time.perf_counter()
+        save(connection, 'stock_BENCH|oldest_1973-01-01&freq=1d', data)
+        timings.append(time.perf_counter() - start_time)
+    rows: int = connection.execute('SELECT COUNT(*) FROM `stock_BENCH|oldest_1973-01-01&freq=1d`;').fetchone()[0]
+    assert rows == BARS + UPDATES * (UPDATE_BARS - 1)
+    connection.close()
+    return timings
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        for name, save in [('to_sql + delete_duplicates', legacy_save), ('upsert', upsert_save)]:
+            timings = run(save, Path(directory), name.split()[0])
+            print(f'{name:<28} initial {BARS} rows {timings[0] * 1000:8.1f} ms  '
+                  f'update of {UPDATE_BARS} rows: median {np.median(timings[1:]) * 1000:6.2f} ms')
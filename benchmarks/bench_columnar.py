@@ -0,0 +1,56 @@
+"""
+Compare the payload size and the time to a decoded DataFrame of the JSON, Arrow and Parquet responses.
+Requires the optional pyarrow package.
+Run from the repository root: python -m benchmarks.bench_columnar
+"""
+import io
+import json
+import time
+from typing import Dict, List
+import pandas as pd
+from backend import api, columnar
+from benchmarks.bench_serialization import SERIES, META_DATA, synthetic_table
+
+
+def decode_json(body: bytes) -> pd.DataFrame:
+    """Client side decoding of the JSON response."""
+    return pd.DataFrame.from_dict(json.loads(body)['data'], orient='index')
+
+
+def decode_arrow(body: bytes) -> pd.DataFrame:
+    """Client side decoding of the Arrow stream response."""
+    return columnar.pyarrow.ipc.open_stream(body).read_pandas()
+
+
+def decode_parquet(body: bytes) -> pd.DataFrame:
+    """Client side decoding of the Parquet response."""
+    return pd.read_parquet(io.BytesIO(body))
+
+
+def measure(func, *args, repeat: int = 5) -> float:
+    """Return the best run time of the function in seconds."""
+    timings: List[float] = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start_time)
+    return min(timings)
+
+
+if __name__ == '__main__':
+    if columnar.pyarrow is None:
+        raise SystemExit('pyarrow is not installed, columnar formats are not available')
+    formats: Dict[str, tuple] = {
+        'json': (lambda data: api.render_response(META_DATA, api.serialize_frame(data)), decode_json),
+        'arrow': (lambda data: columnar.serialize(data, columnar.ARROW_STREAM), decode_arrow),
+        'parquet': (lambda data: columnar.serialize(data, columnar.PARQUET), decode_parquet)
+    }
+    for name, bars in SERIES.items():
+        data = synthetic_table(bars)
+        print(f'{name} series, {bars} rows, {len(data.columns)} columns')
+        for format_name, (encode, decode) in formats.items():
+            body: bytes = encode(data)
+            encode_time = measure(encode, data)
+            decode_time = measure(decode, body)
+            print(f'  {format_name:<8} {len(body) / 1024:8.0f} KiB  encode {encode_time * 1000:7.2f} ms  '
+                  f'decode {decode_time * 1000:7.2f} ms  total {(encode_time + decode_time) * 1000:7.2f} ms')
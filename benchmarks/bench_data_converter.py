@@ -0,0 +1,98 @@
+"""
+Compare the history table converter with the previous line by line implementation.
+The fixture has the layout of the text read from the history table of the webpage,
+50 years of daily rows with the quarterly dividends and a few stock splits.
+Run from the repository root: python -m benchmarks.bench_data_converter
+"""
+import re
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import List
+import numpy as np
+import pandas as pd
+from webScrape import app
+
+BARS: int = 50 * 252
+REPEATS: int = 5
+
+HEADER: str = 'Date Open High Low Close* Adj Close** Volume'
+FOOTNOTE: str = ('*Close price adjusted for splits.**Adjusted close price adjusted for splits and dividend '
+                 'and/or capital gain distributions.')
+
+
+def history_text(bars: int, seed: int = 0) -> str:
+    """Create the text of the history table, the latest rows first."""
+    rng = np.random.default_rng(seed)
+    close = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.01, bars))), 2)
+    volume = rng.integers(1_000, 50_000_000, bars)
+    dates = pd.bdate_range(end='2023-01-02', periods=bars)[::-1]
+    lines: List[str] = [HEADER]
+    for position, (date, price, shares) in enumerate(zip(dates.strftime('%b %d, %Y'), close[::-1], volume)):
+        if position % 63 == 0:
+            lines.append(f'{date} 0.{position % 90 + 10} Dividend')
+        if position % 2520 == 1000:
+            lines.append(f'{date} 2:1 Stock Split')
+        # Some of the old rows have no prices
+        if position % 997 == 500:
+            lines.append(f'{date} - - - - - -')
+            continue
+        lines.append(f'{date} {price + 0.5:,.2f} {price + 1:,.2f} {price - 1:,.2f} {price:,.2f} {price:,.2f} '
+                     f'{shares:,}')
+    lines.append(FOOTNOTE)
+    return '\n'.join(lines)
+
+
+def legacy_data_converter(stock_table) -> pd.DataFrame:
+    """Previous implementation of data_converter, parsing every line in Python."""
+    tmp_arr: np.array = np.array(stock_table.text.split('\n'))
+    separated_data = [re.split(r'\s+(?!Close\*\*)', line) for line in tmp_arr[:-1]
+                      if 'Dividend' not in line if 'Split' not in line]
+    new_column_list: List[str] = []
+    for column_name in separated_data[0]:
+        if '*' in column_name:
+            new_column_list.append(column_name.replace('*', ''))
+        else:
+            new_column_list.append(column_name)
+    separated_data[0] = new_column_list
+    stock_data: List = []
+    for i in range(1, len(separated_data)):
+        date: str = ' '.join(separated_data[i][:3])
+        converted_date: datetime.date = datetime.strftime(datetime.strptime(date, '%b %d, %Y').date(), '%Y-%m-%d')
+        stock_data.append([converted_date] + separated_data[i][3:])
+    final_list = [separated_data[0]] + stock_data
+    stock_df = pd.DataFrame(final_list[1:], columns=final_list[0])
+    numeric_columns: List[str] = ['Open', 'High', 'Low', 'Close', 'Adj Close']
+    try:
+        stock_df[numeric_columns] = stock_df[numeric_columns].astype(float)
+    except ValueError:
+        stock_df = stock_df.replace('-', '0')
+        for column in numeric_columns:
+            stock_df[column] = stock_df[column].str.replace(',', '')
+        stock_df[numeric_columns] = stock_df[numeric_columns].astype(float)
+    try:
+        stock_df['Volume'] = stock_df['Volume'].str.replace(',', '').astype(np.int64)
+    except ValueError:
+        stock_df['Volume'] = stock_df['Volume'].replace('-', '0')
+        stock_df['Volume'] = stock_df['Volume'].str.replace(',', '').astype(np.int64)
+    return stock_df
+
+
+def measure(converter, stock_table) -> float:
+    """Return the median time of the conversion in milliseconds."""
+    timings: List[float] = []
+    for _ in range(REPEATS):
+        start_time = time.perf_counter()
+        converter(stock_table)
+        timings.append(time.perf_counter() - start_time)
+    return float(np.median(timings)) * 1000
+
+
+if __name__ == '__main__':
+    table = SimpleNamespace(text=history_text(BARS))
+    legacy = legacy_data_converter(table)
+    prices, events = app.data_converter(table)
+    pd.testing.assert_frame_equal(prices, legacy, check_dtype=False, check_exact=True)
+    print(f'{len(prices)} rows, {len(events)} dividends and splits')
+    print(f'legacy data_converter {measure(legacy_data_converter, table):8.1f} ms')
+    print(f'data_converter        {measure(app.data_converter, table):8.1f} ms')
@@ -0,0 +1,132 @@
+"""
+Compare reading the history table as the text of the element with extracting its cells by a single script.
+The fixture is a page with 13,000 rows of the history table, the dividends and the stock splits included.
+Without the browser the payloads sent by the WebDriver are decoded and converted, with --browser
+the page is opened in the headless Chrome and the whole extraction is measured.
+Run from the repository root: python -m benchmarks.bench_history_extraction [--browser]
+"""
+import argparse
+import html
+import json
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, List, Tuple
+import numpy as np
+import pandas as pd
+from benchmarks.bench_data_converter import history_text
+from webScrape import app
+
+ROWS: int = 13_000
+REPEATS: int = 5
+
+
+def history_columns(text: str) -> app.HistoryColumns:
+    """Split the text of the history table into the columns returned by the extraction script."""
+    header: List[str] = ['Date', 'Open', 'High', 'Low', 'Close*', 'Adj Close**', 'Volume']
+    columns: List[list] = [[] for _ in header]
+    events: List[List[str]] = []
+    for line in text.split('\n')[1:-1]:
+        parts: List[str] = line.split(' ', 3)
+        date: str = ' '.join(parts[:3])
+        if 'Dividend' in line or 'Split' in line:
+            events.append([date, parts[3]])
+            continue
+        month, day, year = parts[:3]
+        columns[0].append(f'{year}-{app.MONTHS[month]}-{day.rstrip(",").zfill(2)}')
+        for column, cell in zip(columns[1:], parts[3].split(' ')):
+            column.append(None if cell == '-' else float(cell.replace(',', '')))
+    return app.HistoryColumns(header, columns, events)
+
+
+def history_page(text: str) -> str:
+    """Create the page with the history table in the layout of the webpage."""
+    header: List[str] = ['Date', 'Open', 'High', 'Low', 'Close*', 'Adj Close**', 'Volume']
+    body: List[str] = []
+    for line in text.split('\n')[1:-1]:
+        parts: List[str] = line.split(' ', 3)
+        date: str = html.escape(' '.join(parts[:3]))
+        if 'Dividend' in line or 'Split' in line:
+            cells = f'<td><span>{date}</span></td><td colspan="{len(header) - 1}">{html.escape(parts[3])}</td>'
+        else:
+            cells = f'<td><span>{date}</span></td>' + ''.join(f'<td><span>{html.escape(cell)}</span></td>'
+                                                                for cell in parts[3].split(' '))
+        body.append(f'<tr>{cells}</tr>')
+    columns = ''.join(f'<th><span>{html.escape(column)}</span></th>' for column in header)
+    return (f'<html><body><div id="render-target-default"><div id="Col1-1-HistoricalDataTable-Proxy"><section>'
+            f'<div></div><div><table><thead><tr>{columns}</tr></thead><tbody>{"".join(body)}</tbody></table></div>'
+            f'</section></div></div></body></html>')
+
+
+def measure(extract: Callable[[], object]) -> Tuple[float, float]:
+    """Return the median time in milliseconds and the peak of the allocated memory in MiB."""
+    timings: List[float] = []
+    for _ in range(REPEATS):
+        start_time = time.perf_counter()
+        extract()
+        timings.append(time.perf_counter() - start_time)
+    tracemalloc.start()
+    extract()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return float(np.median(timings)) * 1000, peak / 2 ** 20
+
+
+def report(name: str, extract: Callable[[], object]) -> None:
+    """Print the time and the memory of the extraction."""
+    milliseconds, megabytes = measure(extract)
+    print(f'{name:<22} {milliseconds:8.1f} ms {megabytes:8.1f} MiB')
+
+
+def offline(text: str, table: app.HistoryColumns) -> None:
+    """Decode the payloads of the WebDriver responses and convert them, as done after the browser call."""
+    text_payload: str = json.dumps({'value': text})
+    columns_payload: str = json.dumps({'value': table._asdict()})
+    print(f'payload: text {len(text_payload) / 2 ** 20:.2f} MiB, columns {len(columns_payload) / 2 ** 20:.2f} MiB')
+
+    def from_text():
+        return app.parse_history_text(json.loads(text_payload)['value'])
+
+    def from_columns():
+        return app.data_converter(app.HistoryColumns(**json.loads(columns_payload)['value']))
+
+    report('element text', from_text)
+    report('extracted columns', from_columns)
+
+
+def browser(text: str) -> None:
+    """Open the page in the headless Chrome and measure the extraction together with the WebDriver calls."""
+    with tempfile.TemporaryDirectory() as directory:
+        page = Path(directory, 'history.html')
+        page.write_text(history_page(text), encoding='utf-8')
+        driver = app.setup_webdriver()
+        try:
+            driver.get(page.as_uri())
+
+            def from_text():
+                element = driver.find_element(app.By.XPATH,
+                                              '//*[@id="Col1-1-HistoricalDataTable-Proxy"]/section/div[2]/table')
+                # The footnote below the table is the last line of the text read by data_converter
+                return app.parse_history_text(element.text + '\n')
+
+            report('browser element text', from_text)
+            report('browser columns', lambda: app.data_converter(app.extract_history_table(driver)))
+        finally:
+            driver.quit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the extraction of the history table.')
+    parser.add_argument('--browser', action='store_true', help='Open the page fixture in the headless Chrome')
+    args = parser.parse_args()
+    text = history_text(ROWS)
+    table = history_columns(text)
+    prices, events = app.data_converter(table)
+    expected_prices, expected_events = app.parse_history_text(text)
+    pd.testing.assert_frame_equal(prices, expected_prices, check_exact=True)
+    pd.testing.assert_frame_equal(events, expected_events, check_exact=True)
+    print(f'{len(prices) + len(events)} rows, {len(prices)} prices, {len(events)} dividends and splits')
+    offline(text, table)
+    if args.browser:
+        browser(text)
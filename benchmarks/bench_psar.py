@@ -0,0 +1,94 @@
+"""
+Compare the Parabolic SAR kernel with the previous pandas loop, the fallback without Numba is always measured.
+Run from the repository root: python -m benchmarks.bench_psar
+"""
+import time
+from typing import List
+import numpy as np
+import pandas as pd
+from backend import technical_indicators
+
+# 50 years of daily bars
+BARS: int = 50 * 252
+SYMBOLS: int = 180
+
+
+def synthetic_prices(bars: int, seed: int = 0) -> pd.DataFrame:
+    """Create random walk prices with High/Low columns."""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, bars)))
+    spread = np.abs(rng.normal(0, 0.01, bars)) * close
+    return pd.DataFrame({'High': close + spread, 'Low': close - spread})
+
+
+def legacy_psar(data: pd.DataFrame, af_start=0.02, af_increment=0.02, af_max=0.2) -> pd.Series:
+    """Previous implementation of calculate_PSAR, looping with iloc."""
+    high_prices = data['High']
+    low_prices = data['Low']
+    af: float = af_start
+    psar: List[float] = []
+    uptrend: bool = True
+    extreme_high = high_prices.iloc[0]
+    extreme_low = low_prices.iloc[0]
+    sar = low_prices.iloc[0]
+    for i in range(len(data)):
+        if uptrend:
+            if high_prices.iloc[i] > extreme_high:
+                extreme_high = high_prices.iloc[i]
+                af = min(af + af_increment, af_max)
+            sar = sar + af * (extreme_high - sar)
+            if low_prices.iloc[i] < sar:
+                uptrend = False
+                sar = extreme_high
+                extreme_low = low_prices.iloc[i]
+                af = af_start
+        else:
+            if low_prices.iloc[i] < extreme_low:
+                extreme_low = low_prices.iloc[i]
+                af = min(af + af_increment, af_max)
+            sar = sar - af * (sar - extreme_low)
+            if high_prices.iloc[i] > sar:
+                uptrend = True
+                sar = extreme_low
+                extreme_high = high_prices.iloc[i]
+                af = af_start
+        psar.append(sar)
+    return pd.Series(psar, index=data.index)
+
+
+def fallback_psar(high: np.ndarray, low: np.ndarray) -> np.ndarray:
+    """Calculate PSAR with the pure Python kernel, also when Numba is installed."""
+    compiled = technical_indicators._psar_compiled
+    technical_indicators._psar_compiled = None
+    try:
+        return technical_indicators.parabolic_sar(high, low)
+    finally:
+        technical_indicators._psar_compiled = compiled
+
+
+def measure(func, *args, repeat: int = 5) -> float:
+    """Return the best run time of the function in seconds."""
+    timings: List[float] = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start_time)
+    return min(timings)
+
+
+if __name__ == '__main__':
+    data = synthetic_prices(BARS)
+    high, low = data['High'].to_numpy(), data['Low'].to_numpy()
+    # Warm up the compiled kernel before measuring
+    technical_indicators.parabolic_sar(high, low)
+
+    legacy_time = measure(legacy_psar, data, repeat=1)
+    timings = {'python': measure(fallback_psar, high, low)}
+    if technical_indicators._psar_compiled is not None:
+        timings['numba'] = measure(technical_indicators.parabolic_sar, high, low)
+    print(f'{BARS} bars')
+    print(f'legacy loop:   {legacy_time * 1000:9.2f} ms per symbol, {legacy_time * SYMBOLS:8.2f} s for '
+          f'{SYMBOLS} symbols')
+    for backend, kernel_time in timings.items():
+        print(f'kernel {backend:<6}: {kernel_time * 1000:9.2f} ms per symbol, {kernel_time * SYMBOLS:8.2f} s for '
+              f'{SYMBOLS} symbols, {legacy_time / kernel_time:5.1f}x faster')
@@ -0,0 +1,63 @@
+"""
+Compare the direct serialization of the API responses with the previous to_json, json.loads and re-encode path.
+Run from the repository root: python -m benchmarks.bench_serialization
+"""
+import json
+import time
+from typing import List
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from backend import api
+
+# 50 years of daily, weekly and monthly bars
+SERIES = {'daily': 50 * 252, 'weekly': 50 * 52, 'monthly': 50 * 12}
+INDICATORS: List[str] = ['RSI', 'MACD', 'Signal Line', 'EMA_20', 'SMA_50', 'SMA_200', 'PSAR']
+META_DATA = {'1. Message': 'OK', '2. Symbol': 'AAPL', '3. Method': 'GET', '4. Status-code': 200,
+             '5. Timestamp': '2023-01-01T00:00:00', '6. Url': 'http://127.0.0.1:8000/data?symbol=AAPL'}
+
+
+def synthetic_table(bars: int, seed: int = 0) -> pd.DataFrame:
+    """Create prices with the indicator columns, indexed by the date the same as the /data endpoint."""
+    rng = np.random.default_rng(seed)
+    close = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.01, bars))), 2)
+    data = pd.DataFrame({
+        'Open': close, 'High': close + 0.5, 'Low': close - 0.5, 'Close': close, 'Adj Close': close,
+        'Volume': rng.integers(1_000_000, 50_000_000, bars)
+    }, index=pd.Index(pd.date_range('1973-01-01', periods=bars).strftime('%Y-%m-%d')[::-1], name='Date'))
+    for column in INDICATORS:
+        data[column] = np.round(rng.normal(50, 10, bars), 2)
+    return data
+
+
+def legacy_body(data: pd.DataFrame) -> bytes:
+    """Previous response path of the API."""
+    parsed = json.loads(data.to_json(orient='index'))
+    return JSONResponse(jsonable_encoder({'Meta Data': META_DATA, 'data': parsed})).body
+
+
+def direct_body(data: pd.DataFrame) -> bytes:
+    """Direct serialization of the DataFrame into the response body."""
+    return api.render_response(META_DATA, api.serialize_frame(data))
+
+
+def measure(func, *args, repeat: int = 5) -> float:
+    """Return the best run time of the function in seconds."""
+    timings: List[float] = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start_time)
+    return min(timings)
+
+
+if __name__ == '__main__':
+    for name, bars in SERIES.items():
+        data = synthetic_table(bars)
+        assert legacy_body(data) == direct_body(data)
+        legacy_time = measure(legacy_body, data)
+        direct_time = measure(direct_body, data)
+        print(f'{name:<8} {bars:6} rows {len(direct_body(data)) / 1024:8.0f} KiB  '
+              f'legacy {legacy_time * 1000:8.2f} ms  direct {direct_time * 1000:7.2f} ms  '
+              f'speedup {legacy_time / direct_time:5.1f}x')
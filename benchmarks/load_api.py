@@ -0,0 +1,110 @@
+"""
+Load test of the API under concurrent mixed traffic, reporting the latency percentiles.
+Requests arrive at a constant rate and the latency includes the time spent waiting for the server.
+Cache misses are simulated with a download taking MISS_SECONDS, the other requests read saved symbols.
+Run from the repository root: python -m benchmarks.load_api [--inline]
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+import httpx
+import numpy as np
+import pandas as pd
+from config import config
+from backend import api
+from webScrape import app, db_controller
+
+SYMBOLS: int = 20
+DAYS: int = 5000
+REQUESTS: int = 400
+# Requests sent per second
+RATE: float = 20.0
+MISS_RATIO: float = 0.05
+MISS_SECONDS: float = 1.0
+
+
+def save_symbol(symbol: str, days: int = DAYS) -> None:
+    """Save random walk prices ending today into the database."""
+    rng = np.random.default_rng(abs(hash(symbol)) % 2 ** 32)
+    prices = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.01, days))), 2)
+    data = pd.DataFrame({
+        'Date': pd.date_range(end=datetime.date.today(), periods=days).strftime('%Y-%m-%d'),
+        'Open': prices, 'High': prices, 'Low': prices, 'Close': prices, 'Adj Close': prices,
+        'Volume': rng.integers(1000, 5000, days)
+    })[::-1]
+    conn = sqlite3.connect(Path(config.DATA_DICT, 'stock_database.db'))
+    db_controller.save_into_database(conn, data, symbol, 'oldest_1990-01-02', datetime.date.today(), '1d')
+    conn.close()
+
+
+def slow_download(symbol: str, *args, **kwargs) -> None:
+    """Stand-in for the scraper, blocking like a browser session."""
+    time.sleep(MISS_SECONDS)
+    save_symbol(symbol)
+
+
+def request_mix(requests: int) -> List[tuple]:
+    """Create the list of (kind, url) requests, a few of them for the symbols missing in the database."""
+    rng = random.Random(0)
+    urls: List[tuple] = []
+    for i in range(requests):
+        if rng.random() < MISS_RATIO:
+            # Several requests share every missing symbol
+            urls.append(('miss', f'/data?symbol=MISS{i // 40}&function=TIME_SERIES_DAILY'))
+        elif rng.random() < 0.7:
+            urls.append(('data', f'/data?symbol=S{rng.randrange(SYMBOLS)}&function=TIME_SERIES_DAILY'))
+        else:
+            urls.append(('indicators', f'/indicators?symbol=S{rng.randrange(SYMBOLS)}&function=RSI&time_period=10'))
+    return urls
+
+
+async def run_load(urls: List[tuple]) -> Dict[str, List[float]]:
+    """Send the requests at a constant rate and collect the latencies by the kind of the request."""
+    latencies: Dict[str, List[float]] = {}
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test', timeout=None) as client:
+        start_time = time.perf_counter()
+
+        async def send(number: int, kind: str, url: str):
+            # Scheduled arrival of the request, measured even when the event loop is blocked
+            arrival: float = start_time + number / RATE
+            await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+            response = await client.get(url)
+            response.raise_for_status()
+            latencies.setdefault(kind, []).append(time.perf_counter() - arrival)
+
+        await asyncio.gather(*(send(number, kind, url) for number, (kind, url) in enumerate(urls)))
+    return latencies
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test of the API.')
+    parser.add_argument('--inline', action='store_true', help='Run the blocking work on the event loop')
+    args = parser.parse_args()
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    config.DATA_DICT = Path(tempfile.mkdtemp())
+    for number in range(SYMBOLS):
+        save_symbol(f'S{number}')
+    app.download_historical_data = slow_download
+    if args.inline:
+        async def run_inline(key, func, *func_args, **kwargs):
+            return func(*func_args, **kwargs)
+
+        api.run_blocking = run_inline
+
+    start = time.perf_counter()
+    results = asyncio.run(run_load(request_mix(REQUESTS)))
+    total = time.perf_counter() - start
+    print(f'{REQUESTS} requests, {RATE} per second, {"inline" if args.inline else "executor"} mode, '
+          f'{total:.2f} s total')
+    for kind, values in sorted(results.items()):
+        p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+        print(f'{kind:<11} {len(values):4} requests  p50 {p50:8.1f} ms  p95 {p95:8.1f} ms  p99 {p99:8.1f} ms')
@@ -1,5 +1,6 @@
 from pathlib import Path
 import logging.config
+import os
 import sys
 
 from rich.logging import RichHandler
@@ -10,6 +11,60 @@ DATA_DICT = DEFAULT_DICT / 'data'
 EXTENSIONS_DICT = Path(DEFAULT_DICT, 'extensions')
 LOGS_DIR = Path(DEFAULT_DICT, 'logs')
 
+# Storage engine of the price data, possible values: [tables, bars]
+#   tables - one table per symbol and frequency with the date range encoded in the name
+#   bars - single long-format table shared by all the symbols
+STORAGE_ENGINE = os.environ.get('FREEPI_STORAGE_ENGINE', 'tables')
+
+# SQLite connection settings applied once per connection
+# Memory mapped part of the database file in bytes
+DB_MMAP_SIZE = int(os.environ.get('FREEPI_DB_MMAP_SIZE', 256 * 1024 * 1024))
+# Page cache of every connection in KiB
+DB_CACHE_SIZE = int(os.environ.get('FREEPI_DB_CACHE_SIZE', 64 * 1024))
+# Number of prepared statements kept by every connection
+DB_CACHED_STATEMENTS = int(os.environ.get('FREEPI_DB_CACHED_STATEMENTS', 256))
+# Seconds a connection waits for the lock held by another writer
+DB_BUSY_TIMEOUT = float(os.environ.get('FREEPI_DB_BUSY_TIMEOUT', 30))
+
+# Number of headless browsers downloading symbols in parallel
+DRIVER_POOL_SIZE = int(os.environ.get('FREEPI_DRIVER_POOL_SIZE', 4))
+# Attempts of a queued symbol download before the job is marked as failed
+JOB_MAX_ATTEMPTS = int(os.environ.get('FREEPI_JOB_MAX_ATTEMPTS', 5))
+# Seconds before the first retry of a failed job, doubled after every next failure up to the maximum
+JOB_BACKOFF = float(os.environ.get('FREEPI_JOB_BACKOFF', 30))
+JOB_BACKOFF_MAX = float(os.environ.get('FREEPI_JOB_BACKOFF_MAX', 3600))
+# Pages opened by a single browser before it is restarted
+BROWSER_MAX_PAGES = int(os.environ.get('FREEPI_BROWSER_MAX_PAGES', 200))
+# JavaScript heap of the browser in bytes above which it is restarted before the next page
+BROWSER_MAX_MEMORY = int(os.environ.get('FREEPI_BROWSER_MAX_MEMORY', 512 * 1024 * 1024))
+# Address patterns never loaded by the browser, the images, fonts and ads are not needed to read the prices
+BROWSER_BLOCKED_URLS = os.environ.get(
+    'FREEPI_BROWSER_BLOCKED_URLS',
+    '*.png,*.jpg,*.jpeg,*.gif,*.webp,*.svg,*.ico,*.woff,*.woff2,*.ttf,*.otf,*.mp4,'
+    '*doubleclick.net*,*googlesyndication.com*,*googletagmanager.com*,*google-analytics.com*,*adservice.*,'
+    '*amazon-adsystem.com*,*scorecardresearch.com*,*criteo.*,*taboola.com*,*outbrain.com*').split(',')
+# Seconds the webpage is scrolled inside the browser before the loading is considered frozen
+SCROLL_TIMEOUT = float(os.environ.get('FREEPI_SCROLL_TIMEOUT', 120))
+# Seconds without new rows after a scroll which mark the end of the data
+SCROLL_IDLE = float(os.environ.get('FREEPI_SCROLL_IDLE', 3))
+# Refreshes of the webpage with the frozen loading before the download of the symbol fails
+SCROLL_MAX_REFRESHES = int(os.environ.get('FREEPI_SCROLL_MAX_REFRESHES', 3))
+# Base address of the Yahoo Finance webpage, may point to a local fixture server
+YAHOO_FINANCE_URL = os.environ.get('FREEPI_YAHOO_FINANCE_URL', 'https://finance.yahoo.com')
+# Base address of the Yahoo Finance API serving the history as CSV or JSON
+YAHOO_QUERY_URL = os.environ.get('FREEPI_YAHOO_QUERY_URL', 'https://query1.finance.yahoo.com')
+# Fetchers tried in order until one of them returns the data, possible values: [http, selenium]
+FETCH_BACKENDS = os.environ.get('FREEPI_FETCH_BACKENDS', 'http,selenium').split(',')
+
+# Number of threads serving the blocking work of the API requests
+API_WORKERS = int(os.environ.get('FREEPI_API_WORKERS', 8))
+# Seconds after which the cached API responses expire, covers the writes of the other processes
+RESPONSE_CACHE_TTL = float(os.environ.get('FREEPI_RESPONSE_CACHE_TTL', 300))
+# Memory budget of the cached API responses in bytes
+RESPONSE_CACHE_BYTES = int(os.environ.get('FREEPI_RESPONSE_CACHE_BYTES', 64 * 1024 * 1024))
+# Number of threads calculating the indicators of the batch requests, each with its own database connection
+BATCH_WORKERS = int(os.environ.get('FREEPI_BATCH_WORKERS', 4))
+
 # Create dictionaries
 DATA_DICT.mkdir(parents=True, exist_ok=True)
 LOGS_DIR.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,312 @@
+import asyncio
+import datetime
+import json
+import sqlite3
+import threading
+from http import HTTPStatus
+from pathlib import Path
+from typing import List
+import httpx
+import pandas as pd
+import pyarrow.ipc
+import pyarrow.parquet
+import pytest
+from fastapi.responses import JSONResponse
+from config import config
+from backend import api, columnar, export, response_cache, technical_indicators
+from backend.technical_indicators import IndicatorSpec
+from webScrape import app, db_controller, receiver, snapshot
+
+
+def history(days: int) -> pd.DataFrame:
+    """Create daily prices ending today, the latest rows first."""
+    dates = pd.date_range(end=datetime.date.today(), periods=days).strftime('%Y-%m-%d')
+    prices = [100.0 + i for i in range(days)]
+    return pd.DataFrame(
+        {
+            'Date': dates,
+            'Open': prices,
+            'High': prices,
+            'Low': prices,
+            'Close': prices,
+            'Adj Close': prices,
+            'Volume': [1000] * days
+        }
+    )[::-1]
+
+
+def save_symbol(symbol: str, days: int = 30) -> None:
+    conn = sqlite3.connect(Path(config.DATA_DICT, 'stock_database.db'))
+    db_controller.save_into_database(conn, history(days), symbol, 'oldest_2000-01-03', datetime.date.today(), '1d')
+    conn.close()
+
+
+@pytest.mark.api
+def test_concurrent_requests(tmp_path, monkeypatch):
+    """Test slow downloads do not block the other requests and identical misses download once."""
+    monkeypatch.setattr(config, 'DATA_DICT', tmp_path)
+    response_cache.invalidate()
+    save_symbol('FAST')
+    downloads: List[str] = []
+    lock = threading.Lock()
+    # The download finishes only after all the fast requests were answered
+    release = threading.Event()
+
+    def slow_download(symbol, *args, **kwargs):
+        with lock:
+            downloads.append(symbol)
+        assert release.wait(timeout=30)
+        save_symbol(symbol)
+
+    monkeypatch.setattr(app, 'download_historical_data', slow_download)
+
+    async def get(client, url) -> None:
+        response = await client.get(url)
+        assert response.status_code == 200
+
+    async def run_traffic():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            slow = [asyncio.ensure_future(get(client, '/data?symbol=SLOW&function=TIME_SERIES_DAILY'))
+                    for _ in range(5)]
+            await asyncio.gather(*(get(client, '/data?symbol=FAST&function=TIME_SERIES_DAILY') for _ in range(20)))
+            assert not any(task.done() for task in slow)
+            release.set()
+            await asyncio.gather(*slow)
+
+    asyncio.run(run_traffic())
+    assert downloads == ['SLOW']
+
+
+@pytest.mark.api
+def test_response_cache(tmp_path, monkeypatch):
+    """Test cached responses, conditional requests and invalidation after a write."""
+    monkeypatch.setattr(config, 'DATA_DICT', tmp_path)
+    response_cache.invalidate()
+    save_symbol('CACHE', 10)
+    reads: List[str] = []
+    receive_data = receiver.receive_data
+
+    def counted_receive_data(symbol, *args, **kwargs):
+        reads.append(symbol)
+        return receive_data(symbol, *args, **kwargs)
+
+    monkeypatch.setattr(receiver, 'receive_data', counted_receive_data)
+
+    async def requests():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            url = '/data?symbol=CACHE&function=TIME_SERIES_DAILY'
+            first = await client.get(url)
+            second = await client.get(url)
+            not_modified = await client.get(url, headers={'If-None-Match': first.headers['ETag']})
+            save_symbol('CACHE', 12)
+            changed = await client.get(url, headers={'If-None-Match': first.headers['ETag']})
+            return first, second, not_modified, changed
+
+    first, second, not_modified, changed = asyncio.run(requests())
+    assert first.json()['data'] == second.json()['data']
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert not_modified.status_code == 304 and not_modified.content == b''
+    assert changed.status_code == 200 and len(changed.json()['data']) == 12
+    assert changed.headers['ETag'] != first.headers['ETag']
+    assert reads == ['CACHE', 'CACHE']
+
+
+@pytest.mark.api
+def test_response_cache_budget(monkeypatch):
+    """Test the least recently used responses are evicted over the memory budget."""
+    monkeypatch.setattr(config, 'RESPONSE_CACHE_BYTES', 250)
+    response_cache.invalidate()
+    for symbol in ['A', 'B', 'C']:
+        response_cache.put(('data', symbol, '1d'), response_cache.CachedResponse(b'{}', symbol, 100),
+                           response_cache.generation(symbol))
+        response_cache.get(('data', 'A', '1d'))
+    assert response_cache.get(('data', 'A', '1d')) is not None
+    assert response_cache.get(('data', 'B', '1d')) is None
+    assert response_cache.get(('data', 'C', '1d')) is not None
+    # Responses read before the write of the symbol are not cached
+    stale_generation = response_cache.generation('D')
+    response_cache.invalidate('D')
+    response_cache.put(('data', 'D', '1d'), response_cache.CachedResponse(b'{}', 'D', 10), stale_generation)
+    assert response_cache.get(('data', 'D', '1d')) is None
+
+
+@pytest.mark.api
+@pytest.mark.parametrize('values', [
+    [1.33, 2.0, 1234.56, None],
+    [0.00001234, 1e-10, 0.5, 0.0],
+    [654321.123456, 2e16, 99999.99, -1.5]
+])
+def test_serialize_frame(values):
+    """Test the serialized response is identical to the JSON parsed and encoded again by FastAPI."""
+    data = pd.DataFrame({'Close': values, 'Volume': [1, 2, 3, 4], 'RSI/14': [50.0] * 4},
+                        index=pd.Index(['2023-03-04', '2023-03-03', '2023-03-02', '2023-03-01'], name='Date'))
+    meta_data = {'1. Message': 'OK', '2. Symbol': 'ŻABA', '4. Status-code': HTTPStatus.OK}
+    expected = JSONResponse({'Meta Data': meta_data, 'data': json.loads(data.to_json(orient='index'))}).body
+    assert api.render_response(meta_data, api.serialize_frame(data)) == expected
+
+
+@pytest.mark.api
+def test_data_selection(tmp_path, monkeypatch):
+    """Test the date range, columns and limit of the returned rows."""
+    monkeypatch.setattr(config, 'DATA_DICT', tmp_path)
+    response_cache.invalidate()
+    save_symbol('RANGE', 30)
+    today = datetime.date.today()
+    start = (today - datetime.timedelta(days=9)).strftime('%Y-%m-%d')
+
+    async def requests():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            url = '/data?symbol=RANGE&function=TIME_SERIES_DAILY'
+            return [await client.get(url + params) for params in [
+                f'&start={start}&columns=Close,Volume',
+                '&columns=Close&limit=3',
+                '&columns=Unknown',
+                '&start=2023-13-01',
+                '&limit=0'
+            ]] + [await client.get('/indicators?symbol=RANGE&function=RSI&time_period=5&limit=2')]
+
+    in_range, limited, unknown, invalid_date, invalid_limit, indicator = asyncio.run(requests())
+    rows = in_range.json()['data']
+    assert len(rows) == 10 and min(rows) == start
+    assert list(rows[start]) == ['Close', 'Volume']
+    assert list(limited.json()['data']) == [(today - datetime.timedelta(days=day)).strftime('%Y-%m-%d')
+                                            for day in range(3)]
+    assert unknown.status_code == invalid_date.status_code == invalid_limit.status_code == 400
+    assert indicator.status_code == 200 and len(indicator.json()['data']) == 2
+
+
+@pytest.mark.api
+def test_export(tmp_path, monkeypatch):
+    """Test streaming the data of many symbols as NDJSON and CSV."""
+    monkeypatch.setattr(config, 'DATA_DICT', tmp_path)
+    save_symbol('ONE', 20)
+    save_symbol('TWO', 15)
+    chunks = list(export.export_rows(['ONE', 'MISSING', 'TWO'], columns=['Close'], batch_size=8))
+    # Every symbol is read in batches, missing symbols are skipped
+    assert len(chunks) == 5
+    rows = [json.loads(line) for line in b''.join(chunks).splitlines()]
+    assert len(rows) == 35 and rows[0] == {'Symbol': 'ONE', 'Date': str(datetime.date.today()), 'Close': 119.0}
+
+    async def requests():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            ndjson = await client.get('/export?symbols=ONE,TWO', headers={'Accept-Encoding': 'gzip'})
+            csv = await client.get('/export?symbols=TWO&format=csv&columns=Close,Volume',
+                                   headers={'Accept-Encoding': 'identity'})
+            invalid = await client.get('/export?format=xml')
+            return ndjson, csv, invalid
+
+    ndjson, csv, invalid = asyncio.run(requests())
+    assert ndjson.headers['content-encoding'] == 'gzip'
+    assert len(ndjson.text.splitlines()) == 35
+    assert list(json.loads(ndjson.text.splitlines()[-1])) == ['Symbol', 'Date'] + export.DEFAULT_COLUMNS
+    assert 'content-encoding' not in csv.headers
+    lines = csv.text.splitlines()
+    assert lines[0] == 'Symbol,Date,Close,Volume' and len(lines) == 16 and lines[1].startswith('TWO,')
+    assert invalid.status_code == 400
+
+
+@pytest.mark.api
+def test_columnar_formats(tmp_path, monkeypatch):
+    """Test Arrow and Parquet responses negotiated with the Accept header."""
+    monkeypatch.setattr(config, 'DATA_DICT', tmp_path)
+    response_cache.invalidate()
+    save_symbol('ARROW', 10)
+
+    async def requests():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            url = '/data?symbol=ARROW&function=TIME_SERIES_DAILY&columns=Close,Volume'
+            return [await client.get(url, headers={'Accept': accept}) for accept in [
+                columnar.ARROW_STREAM,
+                f'{columnar.PARQUET}, application/json;q=0.5',
+                'application/json',
+                'text/html'
+            ]]
+
+    arrow, parquet, json_response, not_acceptable = asyncio.run(requests())
+    assert arrow.headers['content-type'] == columnar.ARROW_STREAM
+    table = pyarrow.ipc.open_stream(arrow.content).read_all()
+    assert table.column_names == ['Date', 'Close', 'Volume'] and table.num_rows == 10
+    assert table.schema.metadata[b'symbol'] == b'ARROW'
+    frame = pyarrow.parquet.read_table(pyarrow.BufferReader(parquet.content)).to_pandas()
+    assert frame['Close'].tolist() == [109.0 - day for day in range(10)]
+    assert json_response.json()['data'][str(datetime.date.today())] == {'Close': 109.0, 'Volume': 1000}
+    assert arrow.headers['ETag'] != json_response.headers['ETag']
+    assert not_acceptable.status_code == 406
+
+
+@pytest.mark.api
+def test_indicators_batch(tmp_path, monkeypatch):
+    """Test calculating the indicators of many symbols with a single request."""
+    monkeypatch.setattr(config, 'DATA_DICT', tmp_path)
+    save_symbol('ONE', 40)
+    save_symbol('TWO', 30)
+    indicators = [{'function': 'RSI'}, {'function': 'EMA', 'time_period': 5}, {'function': 'MACD'}]
+
+    async def requests():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            full = await client.post('/indicators/batch', json={'symbols': ['one', 'MISSING', 'TWO'],
+                                                               'indicators': indicators})
+            latest = await client.post('/indicators/batch', json={'symbols': ['ONE', 'TWO'],
+                                                                 'indicators': indicators, 'latest': True})
+            invalid = await client.post('/indicators/batch', json={'symbols': ['ONE'],
+                                                                  'indicators': [{'function': 'ADX'}]})
+            return full, latest, invalid
+
+    full, latest, invalid = asyncio.run(requests())
+    assert full.status_code == 200
+    data = full.json()['data']
+    assert list(data) == ['ONE', 'MISSING', 'TWO'] and data['MISSING'] is None
+    assert len(data['ONE']) == 40 and len(data['TWO']) == 30
+    # Values are equal to the indicators calculated over the whole history
+    prices = receiver.receive_data('ONE')[::-1]
+    expected = technical_indicators.compute_indicators(prices, [IndicatorSpec('EMA', 5), IndicatorSpec('MACD')])
+    today = str(datetime.date.today())
+    assert data['ONE'][today]['EMA_5'] == expected['EMA_5'][-1]
+    assert data['ONE'][today]['MACD_Hist'] == expected['MACD_Hist'][-1]
+    assert list(data['ONE'][today]) == ['RSI', 'EMA_5', 'MACD_Line', 'MACD_Signal', 'MACD_Hist']
+    assert [list(rows) for rows in latest.json()['data'].values()] == [[today], [today]]
+    assert invalid.status_code == 400
+
+
+@pytest.mark.api
+def test_latest(tmp_path, monkeypatch):
+    """Test the latest values served from the snapshot table and refreshed after the writes."""
+    monkeypatch.setattr(config, 'DATA_DICT', tmp_path)
+    response_cache.invalidate()
+    save_symbol('QUOTE', 30)
+    conn = sqlite3.connect(Path(tmp_path, 'stock_database.db'))
+    assert snapshot.get_snapshot(conn, 'QUOTE')['Close'] == 129.0
+    # Symbols saved before the snapshots are backfilled once, the following reads do not write
+    conn.execute(f'DELETE FROM {snapshot.SNAPSHOT_TABLE};')
+    conn.commit()
+    assert snapshot.get_snapshot(conn, 'QUOTE')['Close'] == 129.0
+    changes = conn.total_changes
+    assert snapshot.get_snapshot(conn, 'QUOTE')['Close'] == 129.0
+    assert conn.total_changes == changes and not conn.in_transaction
+    conn.close()
+    conn = sqlite3.connect(Path(tmp_path, 'empty_database.db'))
+    assert snapshot.get_snapshot(conn, 'QUOTE') is None
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table';").fetchone()[0] == 0
+    conn.close()
+
+    async def request(url: str):
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.get(url)
+
+    today = str(datetime.date.today())
+    latest = asyncio.run(request('/latest?symbol=QUOTE'))
+    assert latest.status_code == 200
+    assert latest.json()['data'] == {today: {'Open': 129.0, 'High': 129.0, 'Low': 129.0, 'Close': 129.0,
+                                             'Adj Close': 129.0, 'Volume': 1000}}
+    # Indicators calculated for the symbol are added to the snapshot
+    technical_indicators.update_indicators('QUOTE')
+    row = asyncio.run(request('/latest?symbol=QUOTE')).json()['data'][today]
+    assert row['RSI'] == 100.0 and 'MACD_Line' in row and 'EMA_10' in row
+    assert asyncio.run(request('/latest?symbol=MISSING')).status_code == 404
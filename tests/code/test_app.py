@@ -5,8 +5,10 @@ from typing import List
 import numpy as np
 import pandas as pd
 import pytest
+import selenium.common.exceptions
 from pyvirtualdisplay import Display
 
+from config import config
 from webScrape import app
 import datetime
 from pathlib import Path
@@ -163,6 +165,35 @@ def test_extract_date():
     assert table_end == datetime.date(2023, 3, 1)
 
 
+def test_data_converter():
+    """Test converting the history table text into the prices and the corporate actions."""
+    text: str = '\n'.join([
+        'Date Open High Low Close* Adj Close** Volume',
+        'Jul 02, 2010 1,001.50 1,002.00 999.00 1,000.25 1,000.25 1,968,637',
+        'Jul 01, 2010 0.11 Dividend',
+        'Jul 01, 2010 1.67 1.73 1.00 1.33 1.33 968,637,000',
+        'Jun 30, 2010 - - - - - -',
+        'Jun 29, 2010 3:2 Stock Split',
+        '*Close price adjusted for splits.**Adjusted close price adjusted for splits and dividend.'
+    ])
+    prices, events = app.data_converter(type('Table', (), {'text': text}))
+    assert prices.columns.tolist() == ['Date', 'Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+    assert prices['Date'].tolist() == ['2010-07-02', '2010-07-01', '2010-06-30']
+    assert prices['Open'].tolist() == [1001.5, 1.67, 0.0]
+    assert prices['Volume'].tolist() == [1968637, 968637000, 0]
+    assert events.to_dict('list') == {'Date': ['2010-07-01', '2010-06-29'], 'Event': ['Dividend', 'Split'],
+                                      'Value': [0.11, 1.5]}
+    # Cells extracted from the webpage give the same data
+    table = app.HistoryColumns(
+        ['Date', 'Open', 'High', 'Low', 'Close*', 'Adj Close**', 'Volume'],
+        [['2010-07-02', '2010-07-01', '2010-06-30'], [1001.5, 1.67, None], [1002, 1.73, None], [999, 1, None],
+         [1000.25, 1.33, None], [1000.25, 1.33, None], [1968637, 968637000, None]],
+        [['Jul 01, 2010', '0.11 Dividend'], ['Jun 29, 2010', '3:2 Stock Split']])
+    cells_prices, cells_events = app.data_converter(table)
+    pd.testing.assert_frame_equal(cells_prices, prices)
+    pd.testing.assert_frame_equal(cells_events, events)
+
+
 @pytest.mark.csvfile
 @pytest.mark.scraper
 def test_download_csv_list(data_directory):
@@ -176,3 +207,213 @@ def test_download_csv_list(data_directory):
     companies: np.ndarray = data['Company'].unique()
     result = set(stock_symbols).intersection(companies)
     assert set(stock_symbols) == result
+
+
+@pytest.mark.database
+def test_driver_pool(tmp_path, data):
+    from webScrape import driver_pool
+    created_drivers: List[object] = []
+
+    class StubDriver:
+        def quit(self):
+            pass
+
+    def driver_factory():
+        driver = StubDriver()
+        created_drivers.append(driver)
+        return driver
+
+    def fetch(driver, symbol, start, end, frequency, database_name, incorrect_symbols):
+        time.sleep(0.01)
+        if symbol == 'WRONG':
+            incorrect_symbols.append(symbol)
+            return None
+        if symbol == 'BROKEN':
+            raise ValueError('Page layout changed')
+        return data.copy(), start.date()
+
+    symbols: List[str] = ['AAPL', 'WRONG', 'MSFT', 'BROKEN', 'TSLA', 'AMZN']
+    database = str(tmp_path / 'test_pool.db')
+    start, end = datetime.datetime(2010, 7, 1), datetime.datetime(2010, 7, 2)
+    frames, reports = driver_pool.download_symbols(symbols, start, end, '1d', True, database, pool_size=3,
+                                                   driver_factory=driver_factory, fetch=fetch)
+    assert [frame['Company'].iloc[0] for frame in frames] == ['AAPL', 'MSFT', 'TSLA', 'AMZN']
+    assert len(created_drivers) <= 4
+    errors = {report.symbol: report.error for report in reports}
+    assert errors['WRONG'] == 'Incorrect symbol'
+    assert 'Page layout changed' in errors['BROKEN']
+    assert errors['AAPL'] is None
+    conn = sqlite3.connect(database)
+    for symbol in ['AAPL', 'MSFT', 'TSLA', 'AMZN']:
+        assert app.get_name_of_symbol_table(symbol, '1d', conn) is not None
+    conn.close()
+
+
+@pytest.mark.database
+def test_driver_pool_failed_save(tmp_path, data):
+    """Test a symbol failing inside the database writer does not stop saving the remaining symbols."""
+    from webScrape import driver_pool
+
+    class StubDriver:
+        def quit(self):
+            pass
+
+    def fetch(driver, symbol, start, end, frequency, database_name, incorrect_symbols):
+        stock_df = data.copy()
+        if symbol == 'BAD':
+            stock_df['Date'] = ['not a date']
+        return stock_df, start.date()
+
+    symbols: List[str] = ['BAD', 'AAPL', 'MSFT', 'TSLA', 'AMZN']
+    database = str(tmp_path / 'test_pool_save.db')
+    start, end = datetime.datetime(2010, 7, 1), datetime.datetime(2010, 7, 2)
+    frames, reports = driver_pool.download_symbols(symbols, start, end, '1d', True, database, pool_size=1,
+                                                   driver_factory=StubDriver, fetch=fetch)
+    assert [frame['Company'].iloc[0] for frame in frames] == ['AAPL', 'MSFT', 'TSLA', 'AMZN']
+    errors = {report.symbol: report.error for report in reports}
+    assert 'ValueError' in errors['BAD']
+    assert all(errors[symbol] is None for symbol in symbols[1:])
+
+
+@pytest.mark.database
+def test_job_queue(tmp_path, data, monkeypatch):
+    """Test the queued symbols are checkpointed, retried with the backoff and never downloaded twice."""
+    from config import config
+    from webScrape import database, jobs
+    monkeypatch.setattr(config, 'JOB_BACKOFF', 0.01)
+    fetched: List[str] = []
+
+    class StubDriver:
+        def quit(self):
+            pass
+
+    def fetch(driver, symbol, start, end, frequency, database_name, incorrect_symbols):
+        fetched.append(symbol)
+        if symbol == 'WRONG':
+            incorrect_symbols.append(symbol)
+            return None
+        if symbol == 'FLAKY' and fetched.count('FLAKY') == 1:
+            raise ValueError('Browser crashed')
+        return data.copy(), start.date()
+
+    database_name = str(tmp_path / 'test_jobs.db')
+    with database.connect(database_name) as conn:
+        jobs.enqueue(conn, ['AAPL', 'WRONG', 'FLAKY', 'MSFT'], '1d', datetime.date(2010, 7, 1),
+                     datetime.date(2010, 7, 2))
+        # Job left running by a crashed process is resumed
+        jobs.set_running(conn, jobs.ready_jobs(conn)[:1])
+    waits: List[float] = []
+
+    def sleep(seconds: float):
+        waits.append(seconds)
+        time.sleep(seconds)
+
+    frames, reports = jobs.run_jobs(database_name, pool_size=2, sleep=sleep, fetch=fetch, driver_factory=StubDriver)
+    assert sorted(fetched) == ['AAPL', 'FLAKY', 'FLAKY', 'MSFT', 'WRONG']
+    # Only the failed job waits for its backoff
+    assert 0 < sum(waits) <= config.JOB_BACKOFF and len(frames) == 3
+    with database.connect(database_name) as conn:
+        assert jobs.job_counts(conn) == {'done': 3, 'failed': 1}
+        state = conn.execute("SELECT attempts, last_error FROM scrape_jobs WHERE symbol = 'FLAKY';").fetchone()
+        assert state[0] == 1 and state[1] is None
+    # Resuming the queue does not download the finished jobs again
+    fetched.clear()
+    jobs.run_jobs(database_name, fetch=fetch, driver_factory=StubDriver)
+    assert fetched == []
+    # Finished jobs queued again are downloaded again, only the jobs of this call are run
+    with database.connect(database_name) as conn:
+        job_ids = jobs.enqueue(conn, ['AAPL', 'FLAKY'], '1d', datetime.date(2010, 7, 1), datetime.date(2010, 7, 2))
+        jobs.enqueue(conn, ['OTHER'], '1d', datetime.date(2010, 7, 1), datetime.date(2010, 7, 2))
+    fetched.clear()
+    waits.clear()
+    frames, _ = jobs.run_jobs(database_name, sleep=sleep, job_ids=job_ids, wait=False, fetch=fetch,
+                              driver_factory=StubDriver)
+    assert sorted(fetched) == ['AAPL', 'FLAKY'] and len(frames) == 1 and waits == []
+    with database.connect(database_name) as conn:
+        # The failed attempt waits for the resume command, the unrelated job stays queued
+        assert jobs.job_counts(conn) == {'done': 2, 'failed': 1, 'pending': 2}
+    database.close_connections()
+
+
+@pytest.mark.database
+def test_update_windows(tmp_path, data, monkeypatch):
+    """Test every symbol downloads only its own missing range, grouped with the symbols of the same range."""
+    from backend import technical_indicators
+    from webScrape import db_controller, fetchers
+    database_name = str(tmp_path / 'test_windows.db')
+    conn = app.connect_to_database(database_name)
+    for symbol, end_date in [('AAPL', datetime.date(2010, 7, 2)), ('MSFT', datetime.date(2010, 7, 2)),
+                             ('STALE', datetime.date(2010, 6, 1)), ('FRESH', datetime.datetime.now().date())]:
+        db_controller.save_into_database(conn, data, symbol, datetime.date(2010, 1, 4), end_date, '1d')
+    conn.close()
+    today = datetime.datetime.now().date()
+    windows = app.plan_update_windows(['AAPL', 'MSFT', 'STALE', 'FRESH', 'NEW'], '1d', database_name)
+    assert windows == {(datetime.date(1972, 6, 2), today): ['NEW'], (datetime.date(2010, 6, 1), today): ['STALE'],
+                       (datetime.date(2010, 7, 2), today): ['AAPL', 'MSFT']}
+
+    fetched = {}
+
+    def fetch(driver, symbol, start, end, frequency, database_name, incorrect_symbols):
+        fetched[symbol] = start.date()
+        return None
+
+    monkeypatch.setattr(fetchers, 'fetch_symbol', fetch)
+    monkeypatch.setattr(technical_indicators, 'update_indicators', lambda *args: None)
+    app.update_historical_data(['AAPL', 'MSFT', 'STALE', 'FRESH'], '1d', database_name=database_name)
+    assert fetched == {'AAPL': datetime.date(2010, 7, 2), 'MSFT': datetime.date(2010, 7, 2),
+                       'STALE': datetime.date(2010, 6, 1)}
+
+
+def test_scroll_history_table(tmp_path):
+    """Test the webpage is scrolled by a single script call per page load and the frozen loading is refreshed."""
+    calls: List[str] = []
+
+    class StubElement:
+        def click(self):
+            pass
+
+    table = app.HistoryColumns(['Date', 'Close*'], [['2010-07-01'], [1.33]], [])
+
+    class StubDriver:
+        title = 'History'
+        current_url = 'https://finance.yahoo.com/quote/AAPL/history?interval=1d&frequency=1d'
+
+        def __init__(self, results):
+            self.results = results
+
+        def get(self, url):
+            calls.append('get')
+
+        def refresh(self):
+            calls.append('refresh')
+
+        def find_element(self, by, value):
+            calls.append('find_element')
+            return StubElement()
+
+        def execute_async_script(self, script, *args):
+            calls.append('execute_async_script')
+            return self.results.pop(0)
+
+        def execute_script(self, script, *args):
+            calls.append('execute_script')
+            return {'header': ['Date', 'Close*'], 'columns': [['2010-07-01'], [1.33]], 'events': []}
+
+    database_name = str(tmp_path / 'test_scroll.db')
+    start, end = datetime.datetime(2010, 7, 1), datetime.datetime(2023, 1, 3)
+    driver = StubDriver([{'status': 'stalled', 'lastDate': 'Jan 03, 2015', 'rows': 2000},
+                         {'status': 'target', 'lastDate': 'Jul 01, 2010', 'rows': 3147}])
+    assert app.symbol_handler(driver, 'AAPL', start, end, '1d', database_name, []) == (table, start.date())
+    assert calls.count('execute_async_script') == 2 and calls.count('refresh') == 1
+    assert len(calls) <= 10
+
+    driver = StubDriver([{'status': 'end', 'lastDate': 'Dec 12, 1980', 'rows': 10000}])
+    start = datetime.datetime(1970, 1, 1)
+    assert app.symbol_handler(driver, 'AAPL', start, end, '1d', database_name, []) == (table, 'oldest_1980-12-12')
+
+    # The webpage which never loads fails the symbol after the limited number of refreshes
+    calls.clear()
+    driver = StubDriver([{'status': 'stalled', 'lastDate': None, 'rows': 0}] * (config.SCROLL_MAX_REFRESHES + 1))
+    with pytest.raises(selenium.common.exceptions.TimeoutException):
+        app.symbol_handler(driver, 'AAPL', start, end, '1d', database_name, [])
+    assert calls.count('refresh') == config.SCROLL_MAX_REFRESHES and not driver.results
@@ -1,9 +1,11 @@
+import datetime
 import os
 import sqlite3
 from typing import List
 import pandas as pd
 import pytest
-from webScrape import db_controller
+from config import config
+from webScrape import db_controller, catalog, bars, corporate_actions, database, receiver, schema
 from pathlib import Path
 
 
@@ -91,3 +93,210 @@ def test_db_duplicates(data_directory, data):
     results = get_database_data(conn, 'test_table')
     assert len(results) == 1
     conn.close()
+
+
+@pytest.mark.database
+def test_symbol_catalog(tmp_path, data):
+    """Test registering symbol tables inside the catalog and resolving them without scanning."""
+    conn = sqlite3.connect(Path(tmp_path, 'test_catalog.db'))
+    db_controller.save_into_database(conn, data, 'TSLA', datetime.date(2010, 7, 1), datetime.date(2010, 7, 2), '1d')
+    entry = catalog.get_entry(conn, 'tsla', '1d')
+    assert entry.table_name == 'stock_TSLA|2010-07-01-2010-07-02&freq=1d'
+    assert entry.row_count == 1 and not entry.oldest
+    # Extend the table and check the catalog follows the renamed table
+    newer = data.assign(Date='2010-07-06')
+    db_controller.save_into_database(conn, newer, 'TSLA', datetime.date(2010, 7, 2), datetime.date(2010, 7, 6), '1d')
+    entry = catalog.get_entry(conn, 'TSLA', '1d')
+    assert entry.table_name == 'stock_TSLA|2010-07-01-2010-07-06&freq=1d'
+    assert entry.end_date == datetime.date(2010, 7, 6) and entry.row_count == 2
+    # Unknown symbols and tables missing in the catalog are absent, sqlite_master is never scanned
+    data.to_sql('stock_NVDA|oldest_1999-01-22-2010-07-01&freq=1wk', conn, index=False)
+    conn.execute('CREATE TABLE pending (value INTEGER);')
+    conn.execute('INSERT INTO pending VALUES (1);')
+    statements: List[str] = []
+    conn.set_trace_callback(statements.append)
+    assert catalog.get_entry(conn, 'NVDA', '1wk') is None and catalog.get_entry(conn, 'AAPL', '1d') is None
+    conn.set_trace_callback(None)
+    assert not [statement for statement in statements if 'sqlite_master' in statement]
+    # The open transaction of the caller is neither committed nor extended by the reads
+    assert conn.in_transaction
+    conn.rollback()
+    assert conn.execute('SELECT COUNT(*) FROM pending;').fetchone()[0] == 0
+    # Tables created before the catalog are registered once, by rebuild_catalog or when the database is opened
+    assert catalog.rebuild_catalog(conn) == 2
+    entry = catalog.get_entry(conn, 'NVDA', '1wk')
+    assert entry.oldest and entry.start_date == datetime.date(1999, 1, 22) and entry.row_count == 1
+    # Writes of this process invalidate only their own symbol, writes of other processes every entry
+    entry = catalog.get_entry(conn, 'TSLA', '1d')
+    db_controller.save_into_database(conn, data, 'AMD', datetime.date(2010, 7, 1), datetime.date(2010, 7, 2), '1d')
+    assert catalog.get_entry(conn, 'TSLA', '1d') is entry
+    other = sqlite3.connect(Path(tmp_path, 'test_catalog.db'))
+    other.execute(f'PRAGMA user_version = {other.execute("PRAGMA user_version;").fetchone()[0] + 1};')
+    other.close()
+    assert catalog.get_entry(conn, 'TSLA', '1d') is not entry
+    assert catalog.get_entry(conn, 'TSLA', '1d') == entry
+    conn.close()
+
+
+@pytest.mark.database
+def test_bars_storage_engine(tmp_path, data, monkeypatch):
+    """Test saving into the long-format bars table and migrating per-symbol tables."""
+    conn = sqlite3.connect(Path(tmp_path, 'test_bars.db'))
+    # Legacy per-symbol table migrated into the bars table
+    data.to_sql('stock_AAPL|oldest_2010-07-01-2010-07-01&freq=1d', conn, index=False)
+    assert bars.migrate_to_bars(conn, drop_tables=True) == 1
+    entry = catalog.get_entry(conn, 'AAPL', '1d')
+    assert entry.table_name == bars.BARS_TABLE and entry.oldest and entry.row_count == 1
+    # New data saved with the bars engine extends the range of the symbol
+    monkeypatch.setattr(config, 'STORAGE_ENGINE', 'bars')
+    newer = data.assign(Date='2010-07-02', Close=1.5)
+    db_controller.save_into_database(conn, newer, 'AAPL', datetime.date(2010, 7, 1), datetime.date(2010, 7, 2), '1d')
+    entry = catalog.get_entry(conn, 'AAPL', '1d')
+    assert entry.start_date == datetime.date(2010, 7, 1) and entry.end_date == datetime.date(2010, 7, 2)
+    assert entry.oldest and entry.row_count == 2
+    result = bars.read_bars(conn, 'AAPL', '1d', entry.start_date, entry.end_date)
+    assert list(result.columns) == list(data.columns)
+    assert result['Date'].tolist() == ['2010-07-02', '2010-07-01']
+    assert result['Close'].tolist() == [1.5, 1.33]
+    projected = bars.read_bars(conn, 'AAPL', '1d', entry.start_date, entry.end_date, columns=['Close'], limit=1)
+    assert projected.to_dict('list') == {'Date': ['2010-07-02'], 'Close': [1.5]}
+    conn.close()
+
+
+@pytest.mark.database
+def test_connection_manager(tmp_path, data, monkeypatch):
+    """Test reusing the thread connection and reading while another connection writes."""
+    monkeypatch.setattr(config, 'DATA_DICT', tmp_path)
+    with database.connect('test_connections.db') as conn:
+        assert conn.execute('PRAGMA journal_mode;').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA synchronous;').fetchone()[0] == 1
+        # Nested blocks share the connection and the outer transaction
+        with database.connect('test_connections.db') as nested:
+            assert nested is conn
+        data.to_sql('prices', conn, index=False)
+    # The readers are not blocked by the open write transaction
+    writer = database.open_connection('test_connections.db')
+    writer.execute('INSERT INTO prices (Date) VALUES (?);', ('2010-07-02',))
+    with database.connect('test_connections.db') as reader:
+        assert reader is conn
+        assert reader.execute('SELECT COUNT(*) FROM prices;').fetchone()[0] == 1
+    writer.commit()
+    writer.close()
+    # Removed database file is opened again
+    database.close_connections()
+    os.remove(Path(tmp_path, 'test_connections.db'))
+    with database.connect('test_connections.db') as reopened:
+        assert reopened is not conn
+        assert reopened.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'prices';").fetchone()[0] == 0
+
+
+@pytest.mark.database
+def test_upsert_rows(tmp_path, data):
+    """Test the saved rows are deduplicated by the unique dates, also inside the tables saved before."""
+    conn = sqlite3.connect(Path(tmp_path, 'test_upsert.db'))
+    db_controller.save_into_database(conn, data, 'AMD', datetime.date(2010, 7, 1), datetime.date(2010, 7, 1), '1d')
+    newer = pd.concat([data.assign(Date='2010-07-02'), data.assign(Close=2.0)], ignore_index=True)
+    statements: List[str] = []
+    conn.set_trace_callback(statements.append)
+    db_controller.save_into_database(conn, newer, 'AMD', datetime.date(2010, 7, 1), datetime.date(2010, 7, 2), '1d')
+    conn.set_trace_callback(None)
+    # The row count is updated by the inserted rows, the whole table is never counted
+    assert not [statement for statement in statements if 'COUNT(*)' in statement and 'WHERE' not in statement]
+    entry = catalog.get_entry(conn, 'AMD', '1d')
+    assert entry.row_count == 2
+    table_name = entry.table_name
+    rows = conn.execute(f'SELECT Date, Close FROM `{table_name}` ORDER BY Date;').fetchall()
+    assert rows == [(14791, 2.0), (14792, 1.33)]
+    # The failed save is rolled back as a whole, including the events saved before the rows
+    broken = data.assign(Date='2010-07-06', Dividends=0.5)
+    corporate_actions.attach_events(broken, pd.DataFrame({'Date': ['2010-07-06'], 'Event': ['Dividend'],
+                                                          'Value': [0.5]}))
+    with pytest.raises(sqlite3.OperationalError):
+        db_controller.save_into_database(conn, broken, 'AMD', datetime.date(2010, 7, 1), datetime.date(2010, 7, 6),
+                                         '1d')
+    assert corporate_actions.load_actions(conn, 'AMD').empty
+    assert catalog.get_entry(conn, 'AMD', '1d').end_date == datetime.date(2010, 7, 2)
+    conn.close()
+    # Duplicates of the legacy table are removed once, when the database is opened
+    conn = sqlite3.connect(Path(tmp_path, 'test_legacy.db'))
+    pd.concat([data, data], ignore_index=True).to_sql('stock_INTC|2010-07-01-2010-07-01&freq=1d', conn, index=False)
+    conn.close()
+    conn = database.open_connection(Path(tmp_path, 'test_legacy.db'))
+    entry = catalog.get_entry(conn, 'INTC', '1d')
+    assert entry.row_count == 1 and schema.has_epoch_dates(schema.column_types(conn, entry.table_name))
+    db_controller.save_into_database(conn, data.assign(Date='2010-07-02'), 'INTC', datetime.date(2010, 7, 1),
+                                     datetime.date(2010, 7, 2), '1d')
+    assert catalog.get_entry(conn, 'INTC', '1d').row_count == 2
+    conn.close()
+
+
+@pytest.mark.database
+def test_typed_schema_migration(tmp_path):
+    """Test the legacy text table is migrated into the typed columns and read the same as before."""
+    conn = sqlite3.connect(Path(tmp_path, 'test_schema.db'))
+    table_name = 'stock_AMD|2010-07-01-2010-07-06&freq=1d'
+    pd.DataFrame({
+        'Date': ['2010-07-01', '2010-07-02', '2010-07-02', '2010-07-06'],
+        'Open': ['1001.5', '1.2', '1.2', '1.3'],
+        'Close': ['1002.25', '1.25', '9.99', '1.35'],
+        'Volume': ['1,968,637', '5000', '5000', '7,000'],
+        'RSI_14': [None, 55.5, 55.5, 60.25]
+    }).to_sql(table_name, conn, index=False)
+    legacy = receiver.receiver(conn, table_name, datetime.date(2010, 7, 1), datetime.date(2010, 7, 6))
+    assert schema.migrate_table(conn, table_name)
+    assert schema.column_types(conn, table_name) == {'Date': 'INTEGER', 'Open': 'REAL', 'Close': 'REAL',
+                                                     'Volume': 'INTEGER', 'RSI_14': 'REAL'}
+    assert conn.execute(f'SELECT typeof(Volume) FROM `{table_name}` LIMIT 1;').fetchone()[0] == 'integer'
+    typed = receiver.receiver(conn, table_name, datetime.date(2010, 7, 1), datetime.date(2010, 7, 6))
+    # The first of the duplicated dates is kept, the same as by delete_duplicates
+    expected = legacy.drop(index=2).reset_index(drop=True)
+    pd.testing.assert_frame_equal(typed, expected, check_dtype=False)
+    assert typed['Open'].tolist() == [1.3, 1.2, 1001.5] and typed['Volume'].tolist() == [7000, 5000, 1968637]
+    limited = receiver.receiver(conn, table_name, datetime.date(2010, 7, 2), datetime.date(2010, 7, 2), limit=1)
+    assert limited['Date'].tolist() == ['2010-07-02']
+    assert not schema.migrate_table(conn, table_name)
+    conn.close()
+
+
+@pytest.mark.database
+def test_adjusted_prices(tmp_path, monkeypatch):
+    """Test the saved dividends and stock splits adjust only the rows downloaded before the split on read."""
+    monkeypatch.setattr(config, 'DATA_DICT', tmp_path)
+    conn = database.open_connection('test_actions.db')
+    # Rows downloaded before the split of 2010-07-05
+    prices = pd.DataFrame({
+        'Date': ['2010-07-02', '2010-07-01'],
+        'Open': [100.0, 98.0], 'High': [100.0, 98.0], 'Low': [100.0, 98.0], 'Close': [100.0, 98.0],
+        'Adj Close': [100.0, 98.0], 'Volume': [1000, 1000]
+    })
+    corporate_actions.attach_events(prices, pd.DataFrame({'Date': ['2010-07-02'], 'Event': ['Dividend'],
+                                                          'Value': [1.96]}))
+    db_controller.save_into_database(conn, prices, 'AMD', 'oldest_2010-07-01', datetime.date(2010, 7, 2), '1d')
+    # Update downloaded after the split, Yahoo already divided the prices and the dividend of 2010-07-02 by 2
+    update = pd.DataFrame({
+        'Date': ['2010-07-06', '2010-07-05', '2010-07-02'],
+        'Open': [50.0, 51.0, 50.0], 'High': [50.0, 51.0, 50.0], 'Low': [50.0, 51.0, 50.0],
+        'Close': [50.0, 51.0, 50.0], 'Adj Close': [50.0, 51.0, 50.0], 'Volume': [2000, 2000, 2000]
+    })
+    events = pd.DataFrame({'Date': ['2010-07-05', '2010-07-02'], 'Event': ['Split', 'Dividend'], 'Value': [2.0, 0.98]})
+    corporate_actions.attach_events(update, events)
+    db_controller.save_into_database(conn, update, 'AMD', datetime.date(2010, 7, 2), datetime.date(2010, 7, 6), '1d')
+    assert corporate_actions.load_actions(conn, 'AMD')['Event'].tolist() == ['Dividend', 'Split']
+    adjusted = receiver.receive_data('AMD', conn, '2010-07-01', '2010-07-06', adjusted=True)
+    # Only the row downloaded before the split is halved, dividend 0.98 after the close 49.0 takes 2 % more
+    assert adjusted['Close'].tolist() == [50.0, 51.0, 50.0, 48.02]
+    assert adjusted['Adj Close'].tolist() == adjusted['Close'].tolist()
+    assert adjusted['Volume'].tolist() == [2000, 2000, 2000, 2000]
+    # Any range and column selection uses the same cached factors
+    selected = receiver.receive_data('AMD', conn, '2010-07-01', '2010-07-02', columns=['Close'], adjusted=True)
+    assert selected['Close'].tolist() == [50.0, 48.02]
+    factors = corporate_actions.get_factors(conn, 'AMD', '1d')
+    assert corporate_actions.get_factors(conn, 'AMD', '1d') is factors
+    # History downloaded at once after the split is not adjusted for it again
+    corporate_actions.attach_events(prices, events)
+    prices[['Open', 'High', 'Low', 'Close', 'Adj Close']] /= 2
+    db_controller.save_into_database(conn, pd.concat([update.iloc[:2], prices]), 'INTC', 'oldest_2010-07-01',
+                                     datetime.date(2010, 7, 6), '1d')
+    adjusted = receiver.receive_data('INTC', conn, '2010-07-01', '2010-07-06', adjusted=True)
+    assert adjusted['Close'].tolist() == [50.0, 51.0, 50.0, 48.02]
+    conn.close()
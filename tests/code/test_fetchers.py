@@ -0,0 +1,178 @@
+import datetime
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+import pytest
+import selenium.common.exceptions
+from config import config
+from webScrape import app, browser, corporate_actions, fetchers
+
+CSV_HISTORY = b'''Date,Open,High,Low,Close,Adj Close,Volume
+2023-03-01,10.0,11.0,9.5,10.5,10.4,1000
+2023-03-02,10.5,12.0,10.0,11.5,11.4,2000
+2023-03-03,null,null,null,null,null,null
+'''
+DAY = 24 * 60 * 60
+START = 1677628800  # 2023-03-01 00:00 UTC
+JSON_HISTORY = json.dumps({'chart': {'result': [{
+    'meta': {'gmtoffset': -18000},
+    'timestamp': [START + 14 * 60 * 60 + 30 * 60 + day * DAY for day in range(2)],
+    'indicators': {
+        'quote': [{'open': [10.0, 10.5], 'high': [11.0, 12.0], 'low': [9.5, 10.0], 'close': [10.5, 11.5],
+                   'volume': [1000, 2000]}],
+        'adjclose': [{'adjclose': [10.4, 11.4]}]
+    },
+    'events': {
+        'dividends': {str(START + 14 * 60 * 60): {'amount': 0.1, 'date': START + 14 * 60 * 60}},
+        'splits': {str(START + DAY + 14 * 60 * 60): {'date': START + DAY + 14 * 60 * 60, 'numerator': 3,
+                                                    'denominator': 2, 'splitRatio': '3:2'}}
+    }
+}], 'error': None}}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serve the history of a few symbols the same way the chart API does."""
+    protocol_version = 'HTTP/1.1'
+    client_ports: List[int] = []
+
+    def do_GET(self):
+        self.client_ports.append(self.client_address[1])
+        symbol = self.path.split('/')[-1].split('?')[0]
+        if symbol == 'CSV':
+            self.respond(200, 'text/csv', CSV_HISTORY)
+        elif symbol == 'JSON':
+            self.respond(200, 'application/json', JSON_HISTORY)
+        elif symbol == 'BROKEN':
+            self.respond(400, 'application/json', b'{}')
+        else:
+            self.respond(404, 'application/json', b'{"chart": {"result": null}}')
+
+    def respond(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    StubHandler.client_ports = []
+    monkeypatch.setattr(config, 'YAHOO_QUERY_URL', f'http://127.0.0.1:{server.server_port}')
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('symbol', ['CSV', 'JSON'])
+def test_fetch_http(stub_server, tmp_path, symbol):
+    database = str(tmp_path / 'test_fetch.db')
+    start, end = datetime.datetime(2023, 3, 1), datetime.datetime(2023, 3, 4)
+    stock_df, start_to_file = fetchers.fetch_http(None, symbol, start, end, '1d', database, [])
+    assert list(stock_df.columns) == fetchers.PRICE_COLUMNS
+    assert list(stock_df['Date'][-2:]) == ['2023-03-02', '2023-03-01']
+    assert list(stock_df['Adj Close'][-2:]) == [11.4, 10.4]
+    assert stock_df['Volume'].dtype == 'int64'
+    assert start_to_file == start.date()
+    events = corporate_actions.attached_events(stock_df)
+    if symbol == 'JSON':
+        assert events.to_dict('list') == {'Date': ['2023-03-02', '2023-03-01'], 'Event': ['Split', 'Dividend'],
+                                          'Value': [1.5, 0.1]}
+    else:
+        assert events is None
+
+
+def test_fetch_fallback(stub_server, tmp_path, monkeypatch):
+    database = str(tmp_path / 'test_fetch.db')
+    start, end = datetime.datetime(2023, 3, 1), datetime.datetime(2023, 3, 4)
+    browser_symbols: List[str] = []
+
+    def fetch_browser(driver, symbol, *args):
+        browser_symbols.append(symbol)
+        return None
+
+    monkeypatch.setitem(fetchers.FETCHERS, 'selenium', fetch_browser)
+    driver = browser.LazyWebdriver(app.setup_webdriver)
+    incorrect_symbols: List[str] = []
+    for symbol in ['CSV', 'JSON', 'WRONG', 'BROKEN']:
+        fetchers.fetch_symbol(driver, symbol, start, end, '1d', database, incorrect_symbols, ['http', 'selenium'])
+    # Only the failed request falls back to the browser, which was never started
+    assert browser_symbols == ['BROKEN']
+    assert incorrect_symbols == ['WRONG']
+    driver.quit()
+    # All the requests were sent over a single kept alive connection
+    assert len(set(StubHandler.client_ports)) == 1
+    with pytest.raises(fetchers.FetchError):
+        fetchers.fetch_symbol(driver, 'BROKEN', start, end, '1d', database, [], ['http'])
+
+
+def test_browser_sessions(monkeypatch):
+    """Test the browsers are kept warm between the downloads and restarted when worn out or dead."""
+    started: List['StubDriver'] = []
+
+    class StubDriver:
+        def __init__(self):
+            self.alive = True
+            self.memory = 0
+            started.append(self)
+
+        def get(self, url):
+            pass
+
+        def execute_script(self, script):
+            if not self.alive:
+                raise selenium.common.exceptions.WebDriverException('Browser crashed')
+            return self.memory
+
+        def quit(self):
+            self.alive = False
+
+    monkeypatch.setattr(app, 'setup_webdriver', StubDriver)
+    monkeypatch.setattr(config, 'BROWSER_MAX_PAGES', 3)
+    monkeypatch.setattr(config, 'BROWSER_MAX_MEMORY', 100)
+    browser.close_sessions()
+    session = browser.acquire()
+    # Browser starts on the first page and is restarted after the maximum number of pages
+    for _ in range(4):
+        session.get('https://finance.yahoo.com')
+    assert len(started) == 2 and not started[0].alive
+    started[1].memory = 200
+    session.get('https://finance.yahoo.com')
+    assert len(started) == 3 and not started[1].alive
+    # Released session is reused by the next download
+    browser.release(session)
+    assert browser.acquire() is session
+    browser.release(session)
+    # Dead browser is replaced by a new session
+    started[2].alive = False
+    assert browser.acquire() is not session
+    browser.close_sessions()
+
+
+def test_chromedriver_cache(tmp_path, monkeypatch):
+    """Test the chromedriver is installed only when the version of Chrome changed."""
+    installs: List[str] = []
+    driver_file = tmp_path / 'chromedriver'
+    driver_file.write_text('')
+    chrome_version = ['120.0.6099.109']
+
+    def install():
+        installs.append(chrome_version[0])
+        return str(driver_file)
+
+    monkeypatch.setattr(browser.chromedriver_autoinstaller, 'install', install)
+    monkeypatch.setattr(browser.chromedriver_autoinstaller, 'get_chrome_version', lambda: chrome_version[0])
+    cache_file = tmp_path / 'chromedriver.json'
+    for version in ['120.0.6099.109', '120.0.6099.109', '121.0.6167.85']:
+        # New process starts without the path remembered in memory
+        monkeypatch.setattr(browser, '_driver_path', None)
+        chrome_version[0] = version
+        assert browser.chromedriver_path(cache_file) == str(driver_file)
+    assert installs == ['120.0.6099.109', '121.0.6167.85']
@@ -0,0 +1,165 @@
+import datetime
+import sqlite3
+import warnings
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+from backend import technical_indicators
+from webScrape import app, db_controller, receiver
+
+
+@pytest.fixture
+def data():
+    df = pd.DataFrame(
+        {
+            'Date': ['2010-07-01', '2010-07-02', '2010-07-06', '2010-07-07', '2010-07-08'],
+            'Open': [9.5, 10.5, 11.5, 10.0, 8.5],
+            'High': [10.0, 11.0, 12.0, 11.0, 9.0],
+            'Low': [9.0, 10.0, 11.0, 9.0, 8.0],
+            'Close': [9.8, 10.8, 11.8, 9.5, 8.2],
+            'Adj Close': [9.8, 10.8, 11.8, 9.5, 8.2],
+            'Volume': [1000, 1100, 1200, 1300, 1400]
+        }
+    )
+    return df
+
+
+@pytest.mark.indicators
+def test_parabolic_sar(data):
+    """Test PSAR values including the trend reversal."""
+    psar = technical_indicators.parabolic_sar(data['High'].to_numpy(), data['Low'].to_numpy())
+    assert np.allclose(psar, [9.0, 9.0, 9.0, 12.0, 12.0])
+    assert len(technical_indicators.parabolic_sar(np.array([]), np.array([]))) == 0
+
+
+@pytest.mark.indicators
+def test_calculate_psar_column(data):
+    """Test PSAR column returned in the order of the database table."""
+    result = technical_indicators.calculate_PSAR('TEST', append=False, data=data)
+    assert result['Date'].iloc[0] == '2010-07-08'
+    assert result['PSAR'].tolist() == [12.0, 12.0, 9.0, 9.0, 9.0]
+
+
+def synthetic_history(bars: int) -> pd.DataFrame:
+    """Create chronological random walk prices."""
+    rng = np.random.default_rng(7)
+    close = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.02, bars))), 2)
+    spread = np.round(np.abs(rng.normal(0, 0.01, bars)) * close, 2)
+    return pd.DataFrame(
+        {
+            'Date': pd.bdate_range('2000-01-03', periods=bars).strftime('%Y-%m-%d'),
+            'Open': close,
+            'High': close + spread,
+            'Low': close - spread,
+            'Close': close,
+            'Adj Close': close,
+            'Volume': rng.integers(1000, 5000, bars)
+        }
+    )
+
+
+@pytest.mark.indicators
+def test_incremental_update(tmp_path, monkeypatch):
+    """Test indicators calculated only for the new bars match the full recalculation."""
+    monkeypatch.setattr(app, 'download_historical_data', lambda *args, **kwargs: None)
+    conn = sqlite3.connect(Path(tmp_path, 'test_indicators.db'))
+    history = synthetic_history(300)
+    old, new = history.iloc[:250], history.iloc[250:]
+    db_controller.save_into_database(conn, old[::-1], 'TEST', 'oldest_2000-01-03',
+                                     datetime.date(2000, 12, 15), '1d')
+    table_name = app.get_name_of_symbol_table('TEST', '1d', conn)
+    for column in ['EMA_20', 'SMA_50', 'PSAR']:
+        conn.execute(f'ALTER TABLE `{table_name}` ADD COLUMN `{column}` REAL;')
+    technical_indicators.update_single_symbol(conn, 'TEST')
+    # Append new bars and calculate only them, without reading the whole history
+    db_controller.save_into_database(conn, new[::-1], 'TEST', datetime.date(2000, 12, 15),
+                                     datetime.date(2001, 2, 23), '1d')
+    with monkeypatch.context() as patch:
+        patch.setattr(receiver, 'receive_data', None)
+        technical_indicators.update_single_symbol(conn, 'TEST')
+    table_name = app.get_name_of_symbol_table('TEST', '1d', conn)
+    incremental = pd.read_sql(f'SELECT * FROM `{table_name}` ORDER BY Date', conn)
+    assert technical_indicators.load_indicator_state(conn, 'TEST')['last_date'] == history['Date'].iloc[-1]
+    # Full recalculation of the whole table
+    technical_indicators.update_single_symbol(conn, 'TEST', incremental=False)
+    full = pd.read_sql(f'SELECT * FROM `{table_name}` ORDER BY Date', conn)
+    pd.testing.assert_frame_equal(incremental[full.columns], full, check_dtype=False)
+    conn.close()
+
+
+@pytest.mark.indicators
+def test_incremental_update_overwritten_bars(tmp_path, monkeypatch):
+    """Test bars downloaded again with the changed prices are calculated again by the incremental update."""
+    monkeypatch.setattr(app, 'download_historical_data', lambda *args, **kwargs: None)
+    conn = sqlite3.connect(Path(tmp_path, 'test_overwritten.db'))
+    history = synthetic_history(300)
+    db_controller.save_into_database(conn, history.iloc[:250][::-1], 'TEST', 'oldest_2000-01-03',
+                                     datetime.date(2000, 12, 15), '1d')
+    technical_indicators.update_single_symbol(conn, 'TEST')
+    table_name = app.get_name_of_symbol_table('TEST', '1d', conn)
+
+    def assert_equal_to_full_update():
+        incremental = pd.read_sql(f'SELECT * FROM `{table_name}` ORDER BY Date', conn)
+        technical_indicators.update_single_symbol(conn, 'TEST', incremental=False)
+        full = pd.read_sql(f'SELECT * FROM `{table_name}` ORDER BY Date', conn)
+        pd.testing.assert_frame_equal(incremental[full.columns], full, check_dtype=False)
+
+    # The update window starts at the last stored bar, its close changed after the market closed
+    update = history.iloc[249:275].copy()
+    update.loc[249, ['High', 'Close']] = update.loc[249, 'Close'] * 1.2
+    db_controller.save_into_database(conn, update[::-1], 'TEST', datetime.date(2000, 12, 15),
+                                     datetime.date(2001, 2, 2), '1d')
+    with monkeypatch.context() as patch:
+        patch.setattr(receiver, 'receive_data', None)
+        technical_indicators.update_single_symbol(conn, 'TEST')
+    table_name = app.get_name_of_symbol_table('TEST', '1d', conn)
+    assert_equal_to_full_update()
+    # Older rows downloaded again drop the state, the whole table is calculated again
+    update = history.iloc[200:].copy()
+    update['Close'] = update['Close'] * 0.9
+    db_controller.save_into_database(conn, update[::-1], 'TEST', datetime.date(2000, 10, 16),
+                                     datetime.date(2001, 2, 23), '1d')
+    assert technical_indicators.load_indicator_state(conn, 'TEST') is None
+    technical_indicators.update_single_symbol(conn, 'TEST')
+    table_name = app.get_name_of_symbol_table('TEST', '1d', conn)
+    assert_equal_to_full_update()
+    conn.close()
+
+
+def reference_indicators(history: pd.DataFrame) -> pd.DataFrame:
+    """Calculate RSI, MACD, EMA_12 and SMA_5 with the pandas formulas of the single indicator functions."""
+    close = history['Close']
+    delta = close.diff(1).dropna()
+    gain_ema = delta.clip(lower=0).ewm(com=13, adjust=False).mean()
+    loss_ema = abs(delta.clip(upper=0).ewm(com=13, adjust=False).mean())
+    macd_line = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+    signal_line = macd_line.ewm(span=9, adjust=False).mean()
+    return pd.DataFrame({
+        'RSI': round(100 - 100 / (1 + gain_ema / loss_ema), 2),
+        'MACD_Line': round(macd_line, 2),
+        'MACD_Signal': round(signal_line, 2),
+        'MACD_Hist': round(macd_line - signal_line, 2),
+        'EMA_12': round(close.ewm(span=12, adjust=False).mean(), 2),
+        'SMA_5': round(close.rolling(window=5, min_periods=1).mean(), 2)
+    }, index=history.index)
+
+
+@pytest.mark.indicators
+def test_batched_indicators(monkeypatch):
+    """Test all indicators calculated in one pass equal the pandas formulas and are saved once."""
+    writes = []
+    monkeypatch.setattr(technical_indicators, 'append_to_table', lambda *args: writes.append(args))
+    history = synthetic_history(120)
+    specs = [technical_indicators.IndicatorSpec('RSI'), technical_indicators.IndicatorSpec('MACD'),
+             technical_indicators.IndicatorSpec('EMA', period=12), technical_indicators.IndicatorSpec('SMA', period=5)]
+    # Reversed slice of the latest first data, the same as passed by update_single_symbol
+    latest_first = history[::-1]
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', pd.errors.SettingWithCopyWarning)
+        batched = technical_indicators.calculate_indicators('TEST', specs, data=latest_first[::-1])
+    assert len(writes) == 1
+    expected = reference_indicators(history)[::-1]
+    pd.testing.assert_frame_equal(batched[expected.columns], expected)
+    assert batched['Date'].iloc[0] == history['Date'].iloc[-1]
+    assert np.isnan(batched['RSI'].iloc[-1])
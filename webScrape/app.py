@@ -1,11 +1,12 @@
 import functools
+import io
 import os
 import logging
 import sqlite3
 import time
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, NamedTuple, Tuple, Union
 from pandas import DataFrame
 import numpy as np
 import pandas as pd
@@ -13,7 +14,7 @@ from config import config
 from config.config import logger
 import re
 from backend import technical_indicators
-from webScrape import db_controller
+from webScrape import browser, db_controller, catalog, database, driver_pool, fetchers, jobs
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -21,7 +22,6 @@ from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import selenium.common.exceptions
 from selenium.webdriver.remote.webelement import WebElement
-import chromedriver_autoinstaller
 
 
 def setup_webdriver() -> webdriver:
@@ -30,9 +30,8 @@ def setup_webdriver() -> webdriver:
     :return: Webdriver for remote access to browser
     """
 
-    chromedriver_autoinstaller.install()    # Check if the current version of chromedriver exists
-                                            # and if it doesn't exist, download it automatically,
-                                            # then add chromedriver to path
+    # Chromedriver installed for the local Chrome, the install check is cached on disk
+    driver_path: str | None = browser.chromedriver_path()
     # Setup options for Chrome browser
     chrome_options = webdriver.ChromeOptions()
 
@@ -51,18 +50,46 @@ def setup_webdriver() -> webdriver:
     chrome_options.add_argument('--disable-gpu')  # Applicable to windows as only
     chrome_options.add_argument("--disable-dev-shm-usage")  # Overcome limited resource problems
     chrome_options.add_argument('--no-sandbox')  # Bypass OS security model WebDriver
+    # Lean profile, the images and notifications are never loaded
+    chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+    chrome_options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2,
+                                                     'profile.default_content_setting_values.notifications': 2})
 
     # Turn-off userAutomationExtension
     chrome_options.add_experimental_option("useAutomationExtension", False)
     try:
         os.environ['WDM_LOG'] = str(logging.NOTSET)
-        driver = webdriver.Chrome(options=chrome_options)
+        driver = webdriver.Chrome(options=chrome_options, service=webdriver.ChromeService(executable_path=driver_path))
     except selenium.common.exceptions.NoSuchDriverException:
         driver = webdriver.Chrome()
+    # Fonts and ads are blocked by the DevTools protocol
+    browser.block_resources(driver)
     driver.set_page_load_timeout(10)
+    # Scroll script reports the frozen loading by itself, the webdriver timeout is only the last resort
+    driver.set_script_timeout(config.SCROLL_TIMEOUT + config.SCROLL_IDLE)
     return driver
 
 
+def database_location(database_name: str = 'stock_database.db') -> str | Path:
+    """
+    Return the location of the database passed to the database access layer.
+    :param database_name: Name of the database, test databases are given with the path
+    :return: Name of the database inside the data directory or the absolute path of the test database
+    """
+    if 'test' in database_name:
+        return Path(database_name).absolute()
+    return database_name
+
+
+def connect_to_database(database_name: str = 'stock_database.db') -> sqlite3.Connection:
+    """
+    Connect to or create the database file.
+    :param database_name: Name of the database, test databases are given with the path
+    :return: Connection to the SQLite database
+    """
+    return database.open_connection(database_location(database_name))
+
+
 def initial_driver_run(driver: webdriver,
                        cookie_btn_path: str = '//*[@id="consent-page"]/div/div/div/form/div[2]/div[2]/button[1]'):
     """
@@ -98,18 +125,28 @@ def extract_date_from_table(table: str) -> (datetime.date, datetime.date):
     :param table: Name of the table
     :return: Start and end dates from the table name
     """
-    # Check that the data comes from the longest range
-    # if len(table.split('_')) > 3:
-    #     table_date = table.split('_')[3].split('&')[0]
-    if len(table.split('_')) > 2:
-        table_date = table.split('_')[2].split('&')[0]
-    else:
-        table_date = table.split('|')[1].split('&')[0]
-    table_start = datetime.strptime(table_date[:10], '%Y-%m-%d').date()
-    table_end = datetime.strptime(table_date[11:], '%Y-%m-%d').date()
+    # Resolve the range from the catalog without parsing the table name
+    entry = catalog.get_entry_by_table(table)
+    if entry is not None:
+        return entry.start_date, entry.end_date
+    table_start, table_end, _ = catalog.parse_table_name(table)
     return table_start, table_end
 
 
+def get_symbol_table_entry(symbol: str, frequency: str, connection: None | sqlite3.Connection = None,
+                           database_name: str = 'stock_database.db') -> catalog.CatalogEntry | None:
+    """
+    Get the catalog entry of the stock symbol table from the database
+    :param symbol: Stock market symbol
+    :param frequency: String specifying the frequency of the data, defaults-1d, possible values: [1d, 1wk, 1mo]
+    :param connection: Connection to the SQLite database
+    :param database_name: Name of the database where data will be saved. Default "stock_database"
+    :return: Catalog entry with the table name, date range, oldest flag and number of rows
+    """
+    with database.connect(database_location(database_name), connection) as connection:
+        return catalog.get_entry(connection, symbol, frequency)
+
+
 def get_name_of_symbol_table(symbol: str, frequency: str, connection: None | sqlite3.Connection = None,
                              database_name: str = 'stock_database.db') -> str:
     """
@@ -120,26 +157,9 @@ def get_name_of_symbol_table(symbol: str, frequency: str, connection: None | sql
     :param database_name: Name of the database where data will be saved. Default "stock_database"
     :return: Name of the stock symbol table
     """
-    new_connection: bool = False
-    if connection is None:
-        new_connection = True
-        if 'test' in database_name:
-            connection = sqlite3.connect(f'{database_name}')
-        else:
-            connection = sqlite3.connect(f'{Path(config.DATA_DICT, database_name)}')
-    find_table_query = (f"SELECT name "
-                        f"FROM sqlite_master "
-                        f"WHERE type='table' AND name LIKE 'stock_{symbol}|%freq={frequency}%';")
-    cursor = connection.execute(find_table_query)
-    try:
-        all_tables = cursor.fetchall()
-        table_name = all_tables[0][0]
-        if new_connection:
-            connection.close()
-        return table_name
-    except IndexError:
-        if new_connection:
-            connection.close()
+    entry = get_symbol_table_entry(symbol, frequency, connection, database_name)
+    if entry is not None:
+        return entry.table_name
 
 
 def date_and_freq_check(symbol: str, input_start_date: datetime.date, input_end_date: datetime.date,
@@ -159,11 +179,9 @@ def date_and_freq_check(symbol: str, input_start_date: datetime.date, input_end_
     # Variable to check if file is with the oldest data
     oldest: bool = False
     try:
-        database_table_name: str = get_name_of_symbol_table(symbol, frequency, connection, database_name)
-        if database_table_name is not None:
-            table_start, table_end = extract_date_from_table(database_table_name)
-            if database_table_name.split('_')[1].split('|')[1] == 'oldest':
-                oldest = True
+        entry = get_symbol_table_entry(symbol, frequency, connection, database_name)
+        if entry is not None:
+            table_start, table_end, oldest = entry.start_date, entry.end_date, entry.oldest
             if table_start <= input_start_date and input_end_date <= table_end:
                 return False
             if not oldest:
@@ -184,51 +202,221 @@ def date_and_freq_check(symbol: str, input_start_date: datetime.date, input_end_
         return True
 
 
-def symbol_handler(driver: webdriver, symbol: str, start_date: datetime, end_date: datetime,
-                   frequency: str, database_name: str = 'stock_database.db',
-                   incorrect_symbols: List[str] = None) -> pd.DataFrame | str | None:
+def plan_download(symbol: str, start_date: datetime, end_date: datetime, frequency: str,
+                  database_name: str = 'stock_database.db') \
+        -> Tuple[datetime, datetime, Union[datetime.date, str, None]] | None:
     """
-    Support method for download_historical_data method and list of symbols
-    :param driver: Webdriver for remote control and browsing the webpage
+    Determine the date range to download, skipping the data already saved in the database.
     :param symbol: Stock market symbol
     :param start_date: Beginning of the period of time
     :param end_date: End of the period of time
-    :param frequency: String specifying the frequency of the data, defaults-1d, possible values: [1d, 1wk, 1mo]
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
     :param database_name: Name of the database where data will be saved. Default "stock_database"
-    :param incorrect_symbols: Array with incorrect symbols.
-    :return: Pandas DataFrame with fetch data from the webpage
+    :return: Start and end of the range to download with the start date of the saved table to keep,
+    or None when the data already exists
     """
-    # Upper case symbol
-    symbol = symbol.upper()
-    use_previous_start_date: bool = False
-    previous_start_date: str = ''
-    stock_table: selenium.webdriver.remote.webelement = None
-
+    previous_start_date: Union[datetime.date, str, None] = None
     result = date_and_freq_check(symbol, start_date.date(), end_date.date(), frequency, database_name=database_name)
     if isinstance(result, bool):
-        condition = result
+        if not result:
+            return None
     else:
         condition, new_time, site_to_change = result
         if site_to_change == 'start':
             # Assign new end_date
             end_date = new_time
         elif site_to_change == 'end':
-            use_previous_start_date = True
             previous_start_date = start_date.date()
             # Assign new start_date
             start_date = new_time
         else:
-            use_previous_start_date = True
             previous_start_date = f'oldest_{new_time[0]}'
             # Assign new start_date
             start_date = new_time[1]
+    return start_date, end_date, previous_start_date
+
+
+def start_date_limits(start_date: datetime.date, frequency: str) -> Tuple[datetime.date, datetime.date]:
+    """
+    Return the range of dates around the start date where the first row of the data is expected.
+    :param start_date: Beginning of the period of time
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :return: Lower and upper limit of the first date
+    """
+    if frequency == '1wk':
+        margin = timedelta(days=7)
+    elif frequency == '1mo':
+        margin = timedelta(days=31)
+    else:
+        margin = timedelta(days=4)
+    return start_date - margin, start_date + margin
+
+
+# Scrolls the history table inside the webpage and reports back once, new rows are noticed by the MutationObserver.
+# Arguments: lower and upper limit of the start date in Unix milliseconds, idle time and timeout in milliseconds.
+# Returns the status: target - start date reached, end - no more rows, stalled - frozen loading, missing - no table
+HISTORY_SCROLL_SCRIPT: str = """
+const [lowerLimit, upperLimit, idleTime, timeout, done] = arguments;
+const section = document.querySelector('#Col1-1-HistoricalDataTable-Proxy > section');
+const table = section && section.querySelector('table');
+if (!table) {
+    done({status: 'missing', lastDate: null, rows: 0});
+    return;
+}
+const months = {Jan: 0, Feb: 1, Mar: 2, Apr: 3, May: 4, Jun: 5, Jul: 6, Aug: 7, Sep: 8, Oct: 9, Nov: 10, Dec: 11};
+const scroller = document.getElementById('render-target-default') || document.body;
+let finished = false;
+let idleTimer = null;
+const lastRowDate = () => {
+    const cell = table.querySelector('tbody > tr:last-child > td:first-child');
+    return cell ? cell.textContent.trim() : null;
+};
+const dateValue = (text) => {
+    const parts = /^(\\w{3}) (\\d{1,2}), (\\d{4})$/.exec(text || '');
+    return parts ? Date.UTC(Number(parts[3]), months[parts[1]], Number(parts[2])) : null;
+};
+const finish = (status) => {
+    if (finished) return;
+    finished = true;
+    observer.disconnect();
+    clearTimeout(idleTimer);
+    clearTimeout(deadline);
+    done({status: status, lastDate: lastRowDate(), rows: table.querySelectorAll('tbody > tr').length});
+};
+const check = () => {
+    const lastDate = dateValue(lastRowDate());
+    if (lastDate !== null && lowerLimit < lastDate && lastDate < upperLimit) {
+        finish('target');
+        return;
+    }
+    window.scrollTo(0, scroller.scrollHeight);
+    // No new rows after the scroll, the loading indicator left on the webpage means frozen loading
+    clearTimeout(idleTimer);
+    idleTimer = setTimeout(
+        () => finish(section.querySelector(':scope > div:nth-of-type(2) > div') ? 'stalled' : 'end'), idleTime);
+};
+const observer = new MutationObserver(check);
+observer.observe(table, {childList: true, subtree: true});
+const deadline = setTimeout(() => finish('stalled'), timeout);
+check();
+"""
+
+
+class ScrollResult(NamedTuple):
+    """Outcome of scrolling the history table, status is one of: target, end, stalled, missing."""
+    status: str
+    last_date: Union[datetime.date, None]
+    rows: int
+
+
+def _epoch_milliseconds(day: datetime.date) -> int:
+    """Return the Unix time of the midnight UTC of the day in milliseconds."""
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def scroll_history_table(driver: webdriver, start_date: datetime.date, frequency: str) -> ScrollResult:
+    """
+    Load the history table by scrolling inside the webpage, a single WebDriver call per page load.
+    :param driver: Webdriver for remote control and browsing the webpage
+    :param start_date: Beginning of the period of time
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :return: Status of the loading with the last loaded date and the number of the table rows
+    """
+    # Adjust lower and upper limits of last displayed date
+    lower_start_limit, upper_start_limit = start_date_limits(start_date, frequency)
+    try:
+        result: dict = driver.execute_async_script(HISTORY_SCROLL_SCRIPT, _epoch_milliseconds(lower_start_limit),
+                                                   _epoch_milliseconds(upper_start_limit),
+                                                   int(config.SCROLL_IDLE * 1000), int(config.SCROLL_TIMEOUT * 1000))
+    except (selenium.common.exceptions.ScriptTimeoutException, selenium.common.exceptions.JavascriptException):
+        return ScrollResult('stalled', None, 0)
+    try:
+        last_date: Union[datetime.date, None] = datetime.strptime(result['lastDate'], '%b %d, %Y').date()
+    except (TypeError, ValueError):
+        last_date = None
+    return ScrollResult(result['status'], last_date, result['rows'])
+
+
+# Reads the cells of the history table at once, skipping the layout and serialization of the whole table text.
+# Prices are returned by columns with the dates and numbers already converted, missing values shown as "-" are null.
+HISTORY_EXTRACT_SCRIPT: str = """
+const table = document.querySelector('#Col1-1-HistoricalDataTable-Proxy > section table');
+if (!table) return null;
+const months = {Jan: '01', Feb: '02', Mar: '03', Apr: '04', May: '05', Jun: '06',
+                Jul: '07', Aug: '08', Sep: '09', Oct: '10', Nov: '11', Dec: '12'};
+const isoDate = (text) => {
+    const parts = /^(\\w{3}) (\\d{1,2}), (\\d{4})$/.exec(text);
+    return parts && months[parts[1]] ? parts[3] + '-' + months[parts[1]] + '-' + parts[2].padStart(2, '0') : null;
+};
+const header = Array.from(table.querySelectorAll('thead th'), (cell) => cell.textContent.trim());
+const columns = header.map(() => []);
+const events = [];
+for (const row of table.querySelectorAll('tbody > tr')) {
+    const cells = row.cells;
+    // Dividends and stock splits take a single cell next to the date
+    if (cells.length !== header.length) {
+        events.push(Array.from(cells, (cell) => cell.textContent.trim()));
+        continue;
+    }
+    columns[0].push(isoDate(cells[0].textContent.trim()));
+    for (let i = 1; i < cells.length; i++) {
+        const value = Number(cells[i].textContent.replace(/,/g, ''));
+        columns[i].push(Number.isFinite(value) ? value : null);
+    }
+}
+return {header: header, columns: columns, events: events};
+"""
+
+
+class HistoryColumns(NamedTuple):
+    """Cells of the history table extracted from the webpage."""
+    # Column names with the stars of the footnote, "Close*"
+    header: List[str]
+    # Values of every column, dates as "2010-07-01" and the missing numbers as None, unknown dates as None too
+    columns: List[list]
+    # Date and description of the dividends and stock splits, ["Jul 01, 2010", "0.11 Dividend"]
+    events: List[List[str]]
+
+
+def extract_history_table(driver: webdriver) -> HistoryColumns | None:
+    """
+    Read the cells of the loaded history table with a single WebDriver call.
+    :param driver: Webdriver for remote control and browsing the webpage
+    :return: Columns of the table or None when the webpage has no table
+    """
+    result: dict | None = driver.execute_script(HISTORY_EXTRACT_SCRIPT)
+    if result is None:
+        return None
+    return HistoryColumns(result['header'], result['columns'], result['events'])
+
 
-    if condition:
+def symbol_handler(driver: webdriver, symbol: str, start_date: datetime, end_date: datetime,
+                   frequency: str, database_name: str = 'stock_database.db',
+                   incorrect_symbols: List[str] = None) -> pd.DataFrame | str | None:
+    """
+    Support method for download_historical_data method and list of symbols
+    :param driver: Webdriver for remote control and browsing the webpage
+    :param symbol: Stock market symbol
+    :param start_date: Beginning of the period of time
+    :param end_date: End of the period of time
+    :param frequency: String specifying the frequency of the data, defaults-1d, possible values: [1d, 1wk, 1mo]
+    :param database_name: Name of the database where data will be saved. Default "stock_database"
+    :param incorrect_symbols: Array with incorrect symbols.
+    :return: Pandas DataFrame with fetch data from the webpage
+    """
+    # Upper case symbol
+    symbol = symbol.upper()
+    stock_table: HistoryColumns | None = None
+
+    download_range = plan_download(symbol, start_date, end_date, frequency, database_name)
+    if download_range is not None:
+        start_date, end_date, previous_start_date = download_range
+        use_previous_start_date: bool = previous_start_date is not None
         # Convert time strings to timestamp format and
         start_time: int = int(start_date.replace(tzinfo=timezone.utc).timestamp())
         end_time: int = int(end_date.replace(tzinfo=timezone.utc).timestamp())
         start_date = start_date.date()
-        historical_url = f'https://finance.yahoo.com/quote/{symbol}/history?period1={start_time}&period2={end_time}' \
+        historical_url = f'{config.YAHOO_FINANCE_URL}/quote/{symbol}/history?period1={start_time}&period2={end_time}' \
                          f'&interval={frequency}&filter=history&frequency={frequency}&includeAdjustedClose=true'
         try:
             driver.get(historical_url)
@@ -248,10 +436,8 @@ def symbol_handler(driver: webdriver, symbol: str, start_date: datetime, end_dat
                 print('Error: %s - %s.' % (e.filename, e.strerror))
 
         # Collect all data from the webpage
-        all_data_loaded: bool = False
-        while not all_data_loaded:
-            # Variables to handle freezing webpage and not scrolling down
-            endless_loop: bool = False
+        refreshes: int = 0
+        while True:
             try:
                 WebDriverWait(driver, 10).until(
                     EC.presence_of_element_located(
@@ -259,87 +445,32 @@ def symbol_handler(driver: webdriver, symbol: str, start_date: datetime, end_dat
                 )
             except selenium.common.TimeoutException:
                 driver.refresh()
-            # Get the initial scroll position
-            prev_scroll_position = driver.execute_script("return window.pageYOffset;")
-            while True:
-                # Scroll down to bottom
+            # Scroll inside the webpage until the start date or the end of the data is reached
+            scroll: ScrollResult = scroll_history_table(driver, start_date, frequency)
+            # Refresh webpage caused by not loading data, the symbol fails when the webpage never loads
+            if scroll.status == 'stalled':
+                if refreshes == config.SCROLL_MAX_REFRESHES:
+                    raise selenium.common.exceptions.TimeoutException(
+                        f'History of {symbol} did not load after {refreshes} refreshes')
+                refreshes += 1
+                driver.refresh()
+                continue
+            last_date: datetime.date = scroll.last_date or datetime.now().date()
+            if scroll.status == 'target' and last_date.year == 1972:
+                print('1972-06-02 reached DEAD END')
+                start_date = 'oldest_' + str(last_date)
+            elif scroll.status == 'end':
+                print('Reached the end of the data')
+                # Change start date into last date from the yahoo finance
+                start_date = 'oldest_' + str(last_date)
+
+            # Get all data from the loaded table
+            if scroll.rows:
                 try:
-                    driver.execute_script(
-                        'window.scrollTo(0, document.getElementById("render-target-default").scrollHeight);')
-                except selenium.common.exceptions.StaleElementReferenceException:
-                    driver.refresh()
+                    stock_table = extract_history_table(driver)
                 except selenium.common.exceptions.JavascriptException:
                     driver.refresh()
-                # Wait to load page
-                time.sleep(0.2)
-                # Get the current scroll position
-                current_scroll_position = driver.execute_script("return window.pageYOffset;")
-                try:
-                    last_row_date = driver.find_element(By.CSS_SELECTOR,
-                                                        '#Col1-1-HistoricalDataTable-Proxy > section > div.Pb\(10px\).Ovx\(a\).W\(100\%\) > table > tbody > tr:last-child > td.Py\(10px\).Ta\(start\)')
-                except selenium.common.exceptions.NoSuchElementException:
-                    all_data_loaded = True
-                    break
-                except selenium.common.exceptions.TimeoutException:
-                    driver.refresh()
-                    last_row_date = ''
-                try:
-                    last_date: datetime.date = datetime.strptime(last_row_date.text, "%b %d, %Y").date()
-                except AttributeError:
-                    last_date = datetime.now().date()
-                # Adjust lower and upper limits of last displayed date
-                if frequency == '1wk':
-                    lower_start_limit: datetime.date = start_date - timedelta(days=7)
-                    upper_start_limit: datetime.date = start_date + timedelta(days=7)
-                elif frequency == '1mo':
-                    lower_start_limit: datetime.date = start_date - timedelta(days=31)
-                    upper_start_limit: datetime.date = start_date + timedelta(days=31)
-                else:
-                    lower_start_limit: datetime.date = start_date - timedelta(days=4)
-                    upper_start_limit: datetime.date = start_date + timedelta(days=4)
-
-                # Check whether all the data loaded
-                if lower_start_limit < last_date < upper_start_limit:
-                    if last_date.year == 1972:
-                        print('1972-06-02 reached DEAD END')
-                        start_date = 'oldest_' + str(last_date)
-
-                    # Get all data from the loaded table
-                    try:
-                        stock_table = driver.find_element(By.XPATH,
-                                                          '//*[@id="Col1-1-HistoricalDataTable-Proxy"]/section/div[2]/table')
-                    except selenium.common.exceptions.NoSuchElementException:
-                        driver.refresh()
-
-                    all_data_loaded = True
-                    break
-
-                # If the current scroll position is the same as the previous position, you've reached the end
-                if current_scroll_position == prev_scroll_position:
-                    try:
-                        driver.find_element(By.XPATH, '//*[@id="Col1-1-HistoricalDataTable-Proxy"]/section/div[2]/div')
-                        endless_loop = True
-                        break
-                    except selenium.common.exceptions.NoSuchElementException:
-                        print('Reached the end of the data')
-                        # Change start date into last date from the yahoo finance
-                        start_date = 'oldest_' + str(last_date)
-
-                        # Get all data from the loaded table
-                        try:
-                            stock_table = driver.find_element(By.XPATH,
-                                                              '//*[@id="Col1-1-HistoricalDataTable-Proxy"]/section/div[2]/table')
-                        except selenium.common.exceptions.NoSuchElementException:
-                            driver.refresh()
-
-                        all_data_loaded = True
-                        break
-
-                # Update the previous scroll position for the next iteration
-                prev_scroll_position = current_scroll_position
-            # Refresh webpage caused by not loading data
-            if endless_loop:
-                driver.refresh()
+            break
 
         if use_previous_start_date:
             return stock_table, previous_start_date
@@ -349,59 +480,118 @@ def symbol_handler(driver: webdriver, symbol: str, start_date: datetime, end_dat
         print('Data in a given date range already exists')
 
 
-def data_converter(stock_table: WebElement) -> pd.DataFrame:
+class ConvertedHistory(NamedTuple):
+    """Prices and corporate actions read from the history table of the webpage."""
+    prices: pd.DataFrame
+    events: pd.DataFrame
+
+
+# Columns of the dividends and stock splits, Value is the dividend amount or the split ratio
+EVENT_COLUMNS: List[str] = ['Date', 'Event', 'Value']
+# Numbers of the abbreviated month names shown on the webpage
+MONTHS: dict = {month: f'{number:02d}' for number, month in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], start=1)}
+
+
+def _to_iso_dates(months: pd.Series, days: pd.Series, years: pd.Series) -> pd.Series:
+    """Convert the "Jul 01, 2010" date parts into "2010-07-01" strings at once."""
+    month_numbers = months.map(MONTHS)
+    if month_numbers.isna().any():
+        raise ValueError(f'Unknown month names: {", ".join(months[month_numbers.isna()].unique())}')
+    return (years + '-' + month_numbers + '-' + days.str.rstrip(',').str.zfill(2)).astype(object)
+
+
+def _parse_events(lines: pd.Series) -> pd.DataFrame:
     """
-    Convert data into Pandas DataFrame fetch from the webpage.
-    :param stock_table: Selenium webElement with the data fetched from the database.
-    :return: Pandas DataFrame with stock symbol data.
+    Convert the dividend and stock split lines of the history table.
+    :param lines: Lines like "Jun 15, 2010 0.11 Dividend" or "Jun 10, 2010 2:1 Stock Split"
+    :return: Pandas DataFrame with the Date, Event and Value columns, the latest rows first
     """
-    # Merge downloaded data into arrays and format it
-    tmp_arr: np.array = np.array(stock_table.text.split('\n'))
-    separated_data = [re.split(r'\s+(?!Close\*\*)', line) for line in tmp_arr[:-1]
-                      if 'Dividend' not in line if 'Split' not in line]
-    # Remove stars from column names
-    new_column_list: List[str] = []
-    for column_name in separated_data[0]:
-        if '*' in column_name:
-            new_column_list.append(column_name.replace('*', ''))
-        else:
-            new_column_list.append(column_name)
-    separated_data[0] = new_column_list
-    # Concatenate date elements into one element
-    stock_data: List = []
-    for i in range(1, len(separated_data)):
-        date: str = ' '.join(separated_data[i][:3])
-        converted_date: datetime.date = datetime.strftime(datetime.strptime(date, '%b %d, %Y').date(), '%Y-%m-%d')
-        stock_data.append([converted_date] + separated_data[i][3:])
-    final_list = [separated_data[0]] + stock_data
-
-    # Join created arrays into Pandas DataFrame
-    stock_df = pd.DataFrame(final_list[1:], columns=final_list[0])
-
-    # Convert numeric columns to appropriate data type
-    numeric_columns: List[str] = ['Open', 'High', 'Low', 'Close', 'Adj Close']
-    # Remove '-' values with 0
-    try:
-        stock_df[numeric_columns] = stock_df[numeric_columns].astype(float)
-    except ValueError:
-        stock_df = stock_df.replace('-', '0')
-        for column in numeric_columns:
-            stock_df[column] = stock_df[column].str.replace(',', '')
-        stock_df[numeric_columns] = stock_df[numeric_columns].astype(float)
-
-    # Remove commas from "Volume" column and convert to integer
+    if lines.empty:
+        return pd.DataFrame(columns=EVENT_COLUMNS).astype({'Value': float})
+    parts = lines.str.split(r'\s+', n=4, regex=True, expand=True)
+    is_split = parts[4].str.contains('Split')
+    # Split ratio "2:1" means two new shares for a single old share
+    ratio = parts[3].str.split(':', n=1, expand=True).reindex(columns=[0, 1])
+    split_values = pd.to_numeric(ratio[0], errors='coerce') / pd.to_numeric(ratio[1], errors='coerce')
+    dividend_values = pd.to_numeric(parts[3].str.replace(',', ''), errors='coerce')
+    return pd.DataFrame({
+        'Date': _to_iso_dates(parts[0], parts[1], parts[2]),
+        'Event': np.where(is_split, 'Split', 'Dividend').astype(object),
+        'Value': np.where(is_split, split_values, dividend_values)
+    }).reset_index(drop=True)
+
+
+def parse_history_text(text: str) -> ConvertedHistory:
+    """
+    Convert the text of the history table into the prices and the corporate actions.
+    The rows are parsed at once by the pandas CSV reader instead of splitting every line in Python.
+    :param text: Text of the table, the header first and the footnote in the last line
+    :return: Prices with the columns of the table header and the dividends and stock splits
+    """
+    # The footnote below the table is skipped
+    lines: List[str] = text.split('\n')[:-1]
+    # Remove stars from column names, "Adj Close**" is a single column
+    header: List[str] = [column.replace('*', '') for column in re.split(r'\s+(?!Close\*\*)', lines[0].strip())]
+    # Dividends and stock splits take separate lines between the prices
+    is_event: List[bool] = ['Dividend' in line or 'Split' in line for line in lines]
+    events: pd.DataFrame = _parse_events(pd.Series([line.strip() for line, event in zip(lines, is_event) if event],
+                                                   dtype=object))
+    price_lines: List[str] = [line for line, event in zip(lines[1:], is_event[1:]) if not event]
+
+    # Date takes three fields of the line, "Jul 01, 2010"
+    columns: List[str] = ['Month', 'Day', 'Year'] + header[1:]
     try:
-        stock_df['Volume'] = stock_df['Volume'].str.replace(',', '').astype(np.int64)
-    except ValueError:
-        stock_df['Volume'] = stock_df['Volume'].replace('-', '0')
-        stock_df['Volume'] = stock_df['Volume'].str.replace(',', '').astype(np.int64)
-
-    return stock_df
+        stock_df = pd.read_csv(io.StringIO('\n'.join(price_lines)), sep=r'\s+', header=None, names=columns,
+                               dtype={'Month': str, 'Day': str, 'Year': str}, thousands=',',
+                               na_values=['-', 'null'], keep_default_na=False)
+    except pd.errors.EmptyDataError:
+        stock_df = pd.DataFrame(columns=columns)
+    stock_df.insert(0, 'Date', _to_iso_dates(stock_df.pop('Month'), stock_df.pop('Day'), stock_df.pop('Year')))
+
+    # Missing values shown as "-" are saved as zeros
+    numeric_columns: List[str] = [column for column in ['Open', 'High', 'Low', 'Close', 'Adj Close']
+                                  if column in stock_df.columns]
+    stock_df[numeric_columns] = stock_df[numeric_columns].fillna(0).astype(float)
+    if 'Volume' in stock_df.columns:
+        stock_df['Volume'] = stock_df['Volume'].fillna(0).astype(np.int64)
+    return ConvertedHistory(stock_df, events)
+
+
+def parse_history_columns(table: HistoryColumns) -> ConvertedHistory:
+    """
+    Convert the columns extracted from the history table into the prices and the corporate actions.
+    :param table: Columns of the table with the numbers converted by the webpage script
+    :return: Prices with the columns of the table header and the dividends and stock splits
+    """
+    # Remove stars from column names
+    header: List[str] = [column.replace('*', '').strip() for column in table.header]
+    events: pd.DataFrame = _parse_events(pd.Series([' '.join(event) for event in table.events], dtype=object))
+    dates = pd.Series(table.columns[0], dtype=object)
+    if dates.isna().any():
+        raise ValueError(f'Unknown dates in {dates.isna().sum()} rows of the history table')
+    stock_df = pd.DataFrame({'Date': dates})
+    for column, values in zip(header[1:], table.columns[1:]):
+        # Missing values shown as "-" are saved as zeros
+        values = pd.Series(values, dtype=float).fillna(0)
+        stock_df[column] = values.astype(np.int64) if column == 'Volume' else values
+    return ConvertedHistory(stock_df, events)
+
+
+def data_converter(stock_table: HistoryColumns | WebElement) -> ConvertedHistory:
+    """
+    Convert data into Pandas DataFrame fetch from the webpage.
+    :param stock_table: Cells of the history table or Selenium webElement with the table text.
+    :return: Pandas DataFrames with stock symbol data and with the dividends and stock splits.
+    """
+    if isinstance(stock_table, HistoryColumns):
+        return parse_history_columns(stock_table)
+    return parse_history_text(stock_table.text)
 
 
 def download_historical_data(symbols: str | List[str] | np.ndarray, start: str, end: str, frequency: str = '1d',
                              save_database: bool = True, database_name: str = 'stock_database.db',
-                             update_list: List[str] = None) -> DataFrame | None:
+                             update_list: List[str] = None, pool_size: int | None = None) -> DataFrame | None:
     """
     Fetch stock market data from the yahoo finance over a given period.
     :param symbols: Stock symbol, accepts a single symbol or a list of symbols
@@ -411,6 +601,7 @@ def download_historical_data(symbols: str | List[str] | np.ndarray, start: str,
     :param save_database: Determine whether to save csv file. Default True
     :param database_name: Name of the database where data will be saved. Default "stock_database"
     :param update_list: Array with symbols to update.
+    :param pool_size: Number of webdrivers downloading the list of symbols. Default config.DRIVER_POOL_SIZE
     """
     # Check if given frequency is in correct format
     if frequency not in ['1d', '1wk', '1mo']:
@@ -434,67 +625,52 @@ def download_historical_data(symbols: str | List[str] | np.ndarray, start: str,
         logger.error(err)
         return
 
-    # Set up the driver and accept cookies
-    driver = setup_webdriver()
-    # Connect to or create the database file
-    if 'test' in database_name:
-        conn = sqlite3.connect(f'{database_name}')
-    else:
-        conn = sqlite3.connect(f'{Path(config.DATA_DICT, database_name)}')
-    # Execute downloading for single symbol
-    if isinstance(symbols, str):
-        try:
-            # Create DataFrame with downloaded data from webpage
-            stock_table, start_to_file = symbol_handler(driver, symbols, start, end, frequency, database_name, [])
-            if stock_table is not None:
-                stock_df = data_converter(stock_table)
-                # Save downloaded data into csv file or return bare DataFrame
-                if save_database:
-                    db_controller.save_into_database(conn, stock_df, symbols, start_to_file, end_to_file, frequency)
-                if 'test' in database_name:
-                    driver.quit()
-                    conn.close()
-                    return stock_df
-        except TypeError:
-            pass
-
-    # Execute downloading for list of symbols
-    elif isinstance(symbols, list) or isinstance(symbols, np.ndarray):
-        all_symbols_df: List[pd.DataFrame] = []
+    # Execute downloading for list of symbols with the pool of webdrivers
+    if isinstance(symbols, list) or isinstance(symbols, np.ndarray):
         incorrect_symbols: List[str] = []
-        for symbol in symbols:
-            print(f'Download_func - symbol: {symbol}')
-            # Download data for single symbol
-            try:
-                stock_df, start_to_file = symbol_handler(driver, symbol, start, end, frequency, database_name,
-                                                         incorrect_symbols)
-                if stock_df is None:
-                    continue
-                stock_df = data_converter(stock_df)
-                if save_database:
-                    # Save data to the database and append to the shared DataFrame
-                    db_controller.save_into_database(conn, stock_df, symbol, start_to_file, end_to_file, frequency)
-                    stock_df['Company'] = symbol
-                    all_symbols_df.append(stock_df)
-                else:
-                    # Append data to the shared DataFrame
-                    stock_df['Company'] = symbol
-                    all_symbols_df.append(stock_df)
-            except TypeError:
-                pass
-
+        if save_database:
+            # Queue the symbols, every saved symbol is checkpointed and an interrupted run is resumed from the queue
+            with database.connect(database_location(database_name)) as conn:
+                job_ids: List[int] = jobs.enqueue(conn, symbols, frequency, start_to_file, end_to_file)
+            # Only the queued symbols are downloaded, the retries waiting for the backoff are left to the resume command
+            all_symbols_df, _ = jobs.run_jobs(database_name, pool_size, incorrect_symbols, job_ids=job_ids, wait=False)
+        else:
+            all_symbols_df, _ = driver_pool.download_symbols(symbols, start, end, frequency, save_database,
+                                                             database_name, pool_size, incorrect_symbols)
         # Remove incorrect symbols from the symbols list to be updated
-        for symbol in incorrect_symbols:
-            update_list.remove(symbol)
+        if update_list is not None:
+            for symbol in incorrect_symbols:
+                if symbol in update_list:
+                    update_list.remove(symbol)
 
         if len(all_symbols_df) != 0 and 'test' in database_name:
-            driver.quit()
-            conn.close()
             return pd.concat(all_symbols_df, ignore_index=True)
+        return
 
-    # Quit the webdriver and close the browser and database connection
-    driver.quit()
-    conn.close()
+    # Warm browser session, the browser starts only when the symbol is downloaded with Selenium
+    driver = browser.acquire()
+    try:
+        # Execute downloading for single symbol
+        if isinstance(symbols, str):
+            # Reuse the database connection of the current thread
+            with database.connect(database_location(database_name)) as conn:
+                # Create DataFrame with downloaded data
+                result = fetchers.fetch_symbol(driver, symbols, start, end, frequency, database_name, [])
+                if result is not None:
+                    stock_df, start_to_file = result
+                    # Save downloaded data into csv file or return bare DataFrame
+                    if save_database:
+                        db_controller.save_into_database(conn, stock_df, symbols, start_to_file, end_to_file,
+                                                         frequency)
+                    if 'test' in database_name:
+                        return stock_df
+    except TypeError:
+        pass
+    except (fetchers.FetchError, selenium.common.exceptions.WebDriverException) as err:
+        logger.error(f'Downloading {symbols} failed: {err}')
+    finally:
+        # Keep the browser for the next download
+        browser.release(driver)
 
 
 def define_update_range(symbol: str, frequency: str, database_name: str = 'stock_database.db') -> datetime.date:
@@ -505,13 +681,36 @@ def define_update_range(symbol: str, frequency: str, database_name: str = 'stock
     :param database_name: Name of the database where data will be saved. Default "stock_database"
     :return: Start date of update date range
     """
-    database_table_name: str = get_name_of_symbol_table(symbol, frequency, database_name=database_name)
-    if database_table_name is not None:
-        table_start, table_end = extract_date_from_table(database_table_name)
-        return table_end
+    entry = get_symbol_table_entry(symbol, frequency, database_name=database_name)
+    if entry is not None:
+        return entry.end_date
     return datetime.strptime('1972-06-02', '%Y-%m-%d').date()
 
 
+def plan_update_windows(symbols: List[str] | np.ndarray, frequency: str, database_name: str = 'stock_database.db',
+                        current_date: Union[datetime.date, None] = None) \
+        -> Dict[Tuple[datetime.date, datetime.date], List[str]]:
+    """
+    Compute the missing range of every symbol from the catalog and group the symbols with the same range.
+    :param symbols: List of stock market symbols
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param database_name: Name of the database where data will be saved. Default "stock_database"
+    :param current_date: Last day of the ranges. Default today
+    :return: Dictionary with the ranges and the symbols missing them, the oldest ranges first
+    """
+    current_date = current_date or datetime.now().date()
+    windows: Dict[Tuple[datetime.date, datetime.date], List[str]] = {}
+    for symbol in symbols:
+        try:
+            table_end: datetime.date = define_update_range(symbol, frequency, database_name)
+        # Except whether wrong frequency was given
+        except TypeError:
+            continue
+        if table_end < current_date:
+            windows.setdefault((table_end, current_date), []).append(symbol)
+    return dict(sorted(windows.items()))
+
+
 @timer
 def update_historical_data(symbols: str | List[str] | np.ndarray, frequency: str, save_database: bool = True,
                            database_name: str = 'stock_database.db') -> pd.DataFrame | None:
@@ -545,34 +744,34 @@ def update_historical_data(symbols: str | List[str] | np.ndarray, frequency: str
                 technical_indicators.update_indicators(symbols, database_name)
     # Update data for list of symbols
     elif isinstance(symbols, List) or isinstance(symbols, np.ndarray):
-        # Variable to determine the start date for update
-        latest_end_date: datetime.date = datetime.now().date()
-        # Lists of stock symbols to update
-        symbols_to_update: List[str] = []
-        for symbol in symbols:
-            try:
-                final_table_end = define_update_range(symbol, frequency, database_name)
-            # Except whether wrong frequency was given
-            except TypeError:
-                # Assign further variables to empty string
-                final_table_end = ''
-                pass
-            try:
-                # Append symbol to symbols_to_update
-                if final_table_end < current_date:
-                    symbols_to_update.append(symbol)
-                if final_table_end < latest_end_date:
-                    latest_end_date = final_table_end
-            except TypeError:
-                pass
-
-        if current_date == latest_end_date:
+        # Every symbol downloads only its own missing range, symbols with the same range are downloaded together
+        windows = plan_update_windows(symbols, frequency, database_name, current_date)
+        symbols_to_update: List[str] = [symbol for window_symbols in windows.values() for symbol in window_symbols]
+        if not windows:
             print('Nothing to update, table is up-to-date')
         else:
-            # Download data from the new date range and save into symbol table
-            updated_data = download_historical_data(symbols_to_update, latest_end_date.strftime('%Y-%m-%d'),
-                                                    current_date.strftime('%Y-%m-%d'),
-                                                    frequency, save_database, database_name, symbols_to_update)
+            for (window_start, window_end), window_symbols in windows.items():
+                logger.info(f'Updating {len(window_symbols)} symbols from {window_start} to {window_end}')
+            incorrect_symbols: List[str] = []
+            if save_database:
+                # Queue every range first, the pool of webdrivers downloads them in a single run
+                job_ids: List[int] = []
+                with database.connect(database_location(database_name)) as conn:
+                    for (window_start, window_end), window_symbols in windows.items():
+                        job_ids += jobs.enqueue(conn, window_symbols, frequency, window_start, window_end)
+                frames, _ = jobs.run_jobs(database_name, incorrect_symbols=incorrect_symbols, job_ids=job_ids,
+                                          wait=False)
+            else:
+                frames = []
+                for (window_start, window_end), window_symbols in windows.items():
+                    start = datetime.combine(window_start, datetime.min.time())
+                    end = datetime.combine(window_end, datetime.min.time())
+                    window_frames, _ = driver_pool.download_symbols(window_symbols, start, end, frequency, False,
+                                                                    database_name, incorrect_symbols=incorrect_symbols)
+                    frames += window_frames
+            symbols_to_update = [symbol for symbol in symbols_to_update if symbol.upper() not in incorrect_symbols]
+            if len(frames) != 0:
+                updated_data = pd.concat(frames, ignore_index=True)
             # Update technical indicators
             if 'test' not in database_name or save_database:
                 technical_indicators.update_indicators(symbols_to_update, database_name)
@@ -0,0 +1,176 @@
+import argparse
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Tuple, Union
+import pandas as pd
+from config.config import logger
+from webScrape import catalog, database, receiver
+
+# Name of the long-format table with the price data of all the symbols
+BARS_TABLE: str = 'bars'
+# Mapping of the bars table columns into the columns used across the application
+BARS_COLUMNS: dict = {
+    'date': 'Date',
+    'open': 'Open',
+    'high': 'High',
+    'low': 'Low',
+    'close': 'Close',
+    'adj_close': 'Adj Close',
+    'volume': 'Volume'
+}
+
+
+def create_bars_table(connection: sqlite3.Connection) -> None:
+    """
+    Create the long-format table with the price data if it does not exist yet.
+    :param connection: Connection to the SQLite database
+    """
+    connection.execute(f'''
+        CREATE TABLE IF NOT EXISTS {BARS_TABLE} (
+            "symbol" TEXT NOT NULL,
+            "freq" TEXT NOT NULL,
+            "date" TEXT NOT NULL,
+            "open" REAL,
+            "high" REAL,
+            "low" REAL,
+            "close" REAL,
+            "adj_close" REAL,
+            "volume" INTEGER,
+            PRIMARY KEY("symbol", "freq", "date")
+        ) WITHOUT ROWID;
+    ''')
+
+
+def write_bars(connection: sqlite3.Connection, data: pd.DataFrame, symbol: str, frequency: str) -> int:
+    """
+    Insert the price data of the symbol into the bars table, newer rows replace the existing ones.
+    Committed by the caller.
+    :param connection: Connection to the SQLite database
+    :param data: Pandas DataFrame with stock symbol data
+    :param symbol: Stock market symbol
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :return: Number of rows stored for the symbol and frequency
+    """
+    symbol = symbol.upper()
+    create_bars_table(connection)
+    # Convert columns into plain Python lists once, instead of converting every row
+    columns: List[list] = [data[column].tolist() for column in BARS_COLUMNS.values()]
+    rows = ((symbol, frequency, *row) for row in zip(*columns))
+    connection.executemany(f'''
+        INSERT INTO {BARS_TABLE} (symbol, freq, date, open, high, low, close, adj_close, volume)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(symbol, freq, date) DO UPDATE SET
+            open = excluded.open, high = excluded.high, low = excluded.low, close = excluded.close,
+            adj_close = excluded.adj_close, volume = excluded.volume;
+    ''', rows)
+    row_count: int = connection.execute(f'SELECT COUNT(*) FROM {BARS_TABLE} WHERE symbol = ? AND freq = ?;',
+                                        (symbol, frequency)).fetchone()[0]
+    return row_count
+
+
+def save_into_bars(connection: sqlite3.Connection, data: pd.DataFrame, symbol: str,
+                   start_date: Union[datetime.date, str], end_date: datetime.date, frequency: str) -> None:
+    """
+    Save data into the bars table and register the covered date range in the catalog, committed by the caller.
+    :param connection: Connection to the SQLite database
+    :param data: Pandas DataFrame with stock symbol data
+    :param symbol: Stock market symbol
+    :param start_date: Beginning of the period of time, "oldest_" prefix marks the oldest available data
+    :param end_date: End of the period of time
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    """
+    oldest: bool = False
+    if isinstance(start_date, str):
+        oldest = start_date.startswith('oldest_')
+        start_date = datetime.strptime(start_date.replace('oldest_', ''), '%Y-%m-%d').date()
+    # Keep the range of the data already stored
+    entry = catalog.get_entry(connection, symbol, frequency)
+    if entry is not None:
+        if entry.start_date <= start_date:
+            start_date, oldest = entry.start_date, entry.oldest or oldest
+        end_date = max(end_date, entry.end_date)
+    row_count: int = write_bars(connection, data, symbol, frequency)
+    catalog.register_table(connection, symbol, frequency, BARS_TABLE, row_count, (start_date, end_date, oldest))
+
+
+def bars_query(columns: List[str] | None = None) -> Tuple[List[str], str]:
+    """
+    Create the query reading the date range of a symbol, parameters: symbol, frequency, start date, end date and limit.
+    :param columns: Names of the columns to read, None reads all the columns
+    :return: Names of the selected columns and the query
+    """
+    column_names: List[str] = receiver.select_columns(list(BARS_COLUMNS.values()), columns)
+    table_columns: Dict[str, str] = {name: column for column, name in BARS_COLUMNS.items()}
+    # Range read served by the primary key
+    fetch_query: str = f'''
+        SELECT {', '.join(table_columns[name] for name in column_names)}
+        FROM {BARS_TABLE}
+        WHERE symbol = ? AND freq = ? AND date BETWEEN ? AND ?
+        ORDER BY date DESC
+        LIMIT ?;
+    '''
+    return column_names, fetch_query
+
+
+def read_bars(connection: sqlite3.Connection, symbol: str, frequency: str, start_date: datetime.date,
+              end_date: datetime.date, change_index: bool = False, columns: List[str] | None = None,
+              limit: int | None = None) -> pd.DataFrame:
+    """
+    Return stock data of the symbol from the bars table.
+    :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param start_date: Beginning of the period of time
+    :param end_date: End of the period of time
+    :param change_index: Whether to set date as indices in data
+    :param columns: Names of the columns to read, None reads all the columns
+    :param limit: Maximum number of the latest rows to read, None reads all the rows
+    :return: Pandas DataFrame with stock data from a date range
+    """
+    column_names, fetch_query = bars_query(columns)
+    cursor = connection.execute(fetch_query, (symbol.upper(), frequency, str(start_date), str(end_date),
+                                              -1 if limit is None else limit))
+    df_symbol: pd.DataFrame = pd.DataFrame(cursor.fetchall(), columns=column_names)
+    if change_index:
+        df_symbol.set_index('Date', inplace=True)
+    return df_symbol
+
+
+def migrate_to_bars(connection: sqlite3.Connection, drop_tables: bool = False) -> int:
+    """
+    Copy the price data from the per-symbol tables into the bars table.
+    :param connection: Connection to the SQLite database
+    :param drop_tables: Whether to delete the per-symbol tables after copying the data
+    :return: Number of migrated tables
+    """
+    # Make sure every per-symbol table is registered in the catalog
+    catalog.rebuild_catalog(connection)
+    cursor = connection.execute(f'''
+        SELECT symbol, frequency, table_name, start_date, end_date, oldest
+        FROM {catalog.CATALOG_TABLE}
+        WHERE table_name != ?;
+    ''', (BARS_TABLE,))
+    tables: List[Tuple[str, str, str, str, str, int]] = cursor.fetchall()
+    for symbol, frequency, table_name, start_date, end_date, oldest in tables:
+        table_start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        table_end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        # Receiver normalizes the legacy column types
+        data: pd.DataFrame = receiver.receiver(connection, table_name, table_start, table_end)
+        with connection:
+            row_count: int = write_bars(connection, data, symbol, frequency)
+            catalog.register_table(connection, symbol, frequency, BARS_TABLE, row_count,
+                                   (table_start, table_end, bool(oldest)))
+            if drop_tables:
+                connection.execute(f'DROP TABLE `{table_name}`;')
+        logger.info(f'Migrated {table_name} into {BARS_TABLE} table, {row_count} rows')
+    return len(tables)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migrate per-symbol tables into the long-format bars table.')
+    parser.add_argument('--database', default='stock_database.db', help='Name of the database file')
+    parser.add_argument('--drop', action='store_true', help='Delete per-symbol tables after the migration')
+    args = parser.parse_args()
+    conn = database.open_connection(args.database)
+    migrate_to_bars(conn, args.drop)
+    conn.close()
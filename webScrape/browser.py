@@ -0,0 +1,171 @@
+import atexit
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable, List
+import chromedriver_autoinstaller
+import selenium.common.exceptions
+from config import config
+from config.config import logger
+from webScrape import app
+
+# Chromedriver installed for the local Chrome, checked without the network until Chrome is updated
+DRIVER_CACHE_FILE: Path = config.DATA_DICT / 'chromedriver.json'
+
+# Sessions kept warm between the downloads, at most one for every worker of the pool
+_idle_sessions: List['BrowserSession'] = []
+_sessions_lock = threading.Lock()
+_driver_path_lock = threading.Lock()
+_driver_path: str | None = None
+
+
+def chromedriver_path(cache_file: Path = DRIVER_CACHE_FILE) -> str | None:
+    """
+    Return the chromedriver matching the local Chrome, installed only when Chrome changed since the last check.
+    :param cache_file: File with the installed chromedriver and the version of Chrome it was installed for
+    :return: Path of the chromedriver or None when it cannot be installed
+    """
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is not None and os.path.isfile(_driver_path):
+            return _driver_path
+        chrome_version: str | None = chromedriver_autoinstaller.get_chrome_version()
+        try:
+            cached: dict = json.loads(Path(cache_file).read_text())
+        except (OSError, ValueError):
+            cached = {}
+        if cached.get('chrome_version') == chrome_version and os.path.isfile(cached.get('path') or ''):
+            _driver_path = cached['path']
+        else:
+            # Check if the current version of chromedriver exists and if it doesn't exist, download it
+            _driver_path = chromedriver_autoinstaller.install()
+            if _driver_path:
+                Path(cache_file).write_text(json.dumps({'chrome_version': chrome_version, 'path': _driver_path}))
+        return _driver_path
+
+
+def block_resources(driver) -> None:
+    """
+    Stop the browser from loading the images, fonts and ads, the addresses are matched by the DevTools protocol.
+    :param driver: Webdriver of the Chrome browser
+    """
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': config.BROWSER_BLOCKED_URLS})
+    except (AttributeError, selenium.common.exceptions.WebDriverException) as err:
+        logger.warning(f'Blocking the resources of the browser failed: {err!r}')
+
+
+class LazyWebdriver:
+    """Webdriver started on the first use, so symbols downloaded over HTTP never launch the browser."""
+
+    def __init__(self, driver_factory: Callable):
+        self._driver_factory = driver_factory
+        self._driver = None
+
+    def _started(self):
+        """Return the webdriver, started on the first call."""
+        if self._driver is None:
+            self._driver = self._driver_factory()
+        return self._driver
+
+    def __getattr__(self, name: str):
+        return getattr(self._started(), name)
+
+    def quit(self) -> None:
+        if self._driver is not None:
+            self._driver.quit()
+            self._driver = None
+
+
+class BrowserSession(LazyWebdriver):
+    """
+    Long-lived webdriver started on the first use and restarted after a number of pages or above the memory limit.
+    """
+
+    def __init__(self, driver_factory: Callable | None = None, max_pages: int | None = None,
+                 max_memory: int | None = None):
+        super().__init__(driver_factory or app.setup_webdriver)
+        self.max_pages: int = max_pages or config.BROWSER_MAX_PAGES
+        self.max_memory: int = max_memory or config.BROWSER_MAX_MEMORY
+        self.pages: int = 0
+
+    def memory_usage(self) -> int:
+        """Return the used JavaScript heap of the current page in bytes."""
+        return self._started().execute_script(
+            'return performance.memory ? performance.memory.usedJSHeapSize : 0;') or 0
+
+    def healthy(self) -> bool:
+        """Check whether the browser still responds, a session not started yet is healthy."""
+        if self._driver is None:
+            return True
+        try:
+            self._driver.execute_script('return 1;')
+            return True
+        except selenium.common.exceptions.WebDriverException:
+            return False
+
+    def needs_recycling(self) -> bool:
+        """Check whether the browser opened too many pages or holds too much memory."""
+        if self._driver is None:
+            return False
+        if self.pages >= self.max_pages:
+            return True
+        try:
+            return self.memory_usage() >= self.max_memory
+        except selenium.common.exceptions.WebDriverException:
+            return True
+
+    def get(self, url: str) -> None:
+        """Open the webpage, the worn out browser is restarted first."""
+        if self.needs_recycling():
+            logger.info(f'Restarting the browser after {self.pages} pages')
+            self.quit()
+        self.pages += 1
+        self._started().get(url)
+
+    def quit(self) -> None:
+        super().quit()
+        self.pages = 0
+
+
+def acquire() -> BrowserSession:
+    """
+    Return a warm session left by the previous download, the browsers which stopped responding are replaced.
+    :return: Session starting the browser on the first use
+    """
+    while True:
+        with _sessions_lock:
+            session: BrowserSession | None = _idle_sessions.pop() if _idle_sessions else None
+        if session is None:
+            return BrowserSession()
+        if session.healthy():
+            return session
+        session.quit()
+
+
+def release(driver) -> None:
+    """
+    Keep the session warm for the next download, other webdrivers and the sessions above the pool size are closed.
+    :param driver: Webdriver or session returned by acquire
+    """
+    if isinstance(driver, BrowserSession):
+        with _sessions_lock:
+            if len(_idle_sessions) < config.DRIVER_POOL_SIZE:
+                _idle_sessions.append(driver)
+                return
+    driver.quit()
+
+
+@atexit.register
+def close_sessions() -> None:
+    """Close the browsers of all the idle sessions."""
+    with _sessions_lock:
+        sessions = list(_idle_sessions)
+        _idle_sessions.clear()
+    for session in sessions:
+        try:
+            session.quit()
+        except selenium.common.exceptions.WebDriverException:
+            pass
@@ -0,0 +1,220 @@
+import argparse
+import sqlite3
+from datetime import datetime
+from typing import Dict, Tuple, NamedTuple
+from webScrape import database
+
+# Name of the metadata table describing every stock symbol table
+CATALOG_TABLE: str = 'symbol_catalog'
+
+
+class CatalogEntry(NamedTuple):
+    """Metadata of a single stock symbol table."""
+    table_name: str
+    start_date: datetime.date
+    end_date: datetime.date
+    oldest: bool
+    row_count: int
+
+
+# In-process cache of the catalog, {(database, symbol, frequency): (catalog_version, entry)}
+_catalog_cache: Dict[Tuple[str, str, str], Tuple[int, CatalogEntry]] = {}
+# Entries indexed by the table name, used to resolve dates without parsing the name
+_entries_by_table: Dict[str, CatalogEntry] = {}
+# Databases where the catalog table was already created
+_initialized_databases: set = set()
+# Last seen user version of every database and the catalog version derived from it
+_versions: Dict[str, Tuple[int, int]] = {}
+
+
+def parse_table_name(table_name: str) -> Tuple[datetime.date, datetime.date, bool]:
+    """
+    Extract the date range and the oldest flag encoded in the name of the symbol table.
+    :param table_name: Name of the table, ex. "stock_TSLA|2020-08-01-2023-03-01&freq=1d"
+    :return: Start date, end date and whether the table starts with the oldest available data
+    """
+    if len(table_name.split('_')) > 2:
+        table_date = table_name.split('_')[2].split('&')[0]
+    else:
+        table_date = table_name.split('|')[1].split('&')[0]
+    table_start = datetime.strptime(table_date[:10], '%Y-%m-%d').date()
+    table_end = datetime.strptime(table_date[11:], '%Y-%m-%d').date()
+    oldest: bool = '|oldest_' in table_name
+    return table_start, table_end, oldest
+
+
+def version_key(connection: sqlite3.Connection) -> Tuple[str, int]:
+    """
+    Return the key of the database and the catalog version, used to validate the in-process caches.
+    Both are read from the database header with a single query, without touching any table.
+    The version changes only with the catalog writes of the other processes, the writes of this process
+    invalidate the changed entries themselves.
+    :param connection: Connection to the SQLite database
+    :return: Key identifying the database file and the current catalog version
+    """
+    database_file, user_version = connection.execute('SELECT d.file, u.user_version '
+                                                     'FROM pragma_database_list() d, pragma_user_version() u '
+                                                     "WHERE d.name = 'main';").fetchone()
+    database_key: str = database_file if database_file else f':memory:{id(connection)}'
+    seen = _versions.get(database_key)
+    if seen is None or seen[0] != user_version:
+        # Another process wrote into the catalog, every cached entry of the database is outdated
+        seen = _versions[database_key] = (user_version, seen[1] + 1 if seen is not None else 0)
+    return database_key, seen[1]
+
+
+def bump_version(connection: sqlite3.Connection) -> None:
+    """
+    Change the catalog version to invalidate the caches of the other processes, committed by the caller.
+    :param connection: Connection to the SQLite database
+    """
+    database_key, version = version_key(connection)
+    user_version: int = _versions[database_key][0] + 1
+    connection.execute(f'PRAGMA user_version = {user_version};')
+    # The caches of this process stay valid, the caller invalidates the changed entries
+    _versions[database_key] = (user_version, version)
+
+
+def create_catalog(connection: sqlite3.Connection) -> None:
+    """
+    Create the catalog table if it does not exist yet.
+    :param connection: Connection to the SQLite database
+    """
+    database_key, _ = version_key(connection)
+    if database_key in _initialized_databases:
+        return
+    connection.execute(f'''
+        CREATE TABLE IF NOT EXISTS {CATALOG_TABLE} (
+            "symbol" TEXT NOT NULL,
+            "frequency" TEXT NOT NULL,
+            "table_name" TEXT NOT NULL,
+            "start_date" TEXT NOT NULL,
+            "end_date" TEXT NOT NULL,
+            "oldest" INTEGER NOT NULL DEFAULT 0,
+            "row_count" INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY("symbol", "frequency")
+        ) WITHOUT ROWID;
+    ''')
+    _initialized_databases.add(database_key)
+
+
+def invalidate(symbol: str | None = None, frequency: str | None = None) -> None:
+    """
+    Drop cached catalog entries, all of them or only the ones of a given symbol.
+    :param symbol: Stock market symbol, None invalidates the whole cache including the created catalog tables
+    :param frequency: String specifying the frequency of the data, None invalidates every frequency
+    """
+    if symbol is None:
+        _initialized_databases.clear()
+    for key in list(_catalog_cache):
+        if symbol is None or (key[1] == symbol.upper() and frequency in (None, key[2])):
+            _, entry = _catalog_cache.pop(key)
+            _entries_by_table.pop(entry.table_name, None)
+
+
+def _cache_entry(connection: sqlite3.Connection, symbol: str, frequency: str, entry: CatalogEntry) -> None:
+    """Save the entry inside the in-process cache together with the current catalog version."""
+    database_key, version = version_key(connection)
+    _catalog_cache[(database_key, symbol, frequency)] = (version, entry)
+    # Tables shared by many symbols cannot be resolved by the name
+    if entry.table_name.startswith('stock_'):
+        _entries_by_table[entry.table_name] = entry
+
+
+def register_table(connection: sqlite3.Connection, symbol: str, frequency: str, table_name: str,
+                   row_count: int | None = None,
+                   date_range: Tuple[datetime.date, datetime.date, bool] | None = None) -> CatalogEntry:
+    """
+    Insert or replace the catalog entry of the stock symbol table, committed by the caller.
+    :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param table_name: Name of the stock symbol table
+    :param row_count: Number of rows inside the table, counted when not given
+    :param date_range: Start date, end date and oldest flag, parsed from the table name when not given
+    :return: Registered catalog entry
+    """
+    symbol = symbol.upper()
+    create_catalog(connection)
+    if date_range is None:
+        date_range = parse_table_name(table_name)
+    table_start, table_end, oldest = date_range
+    if row_count is None:
+        row_count = connection.execute(f'SELECT COUNT(*) FROM `{table_name}`;').fetchone()[0]
+    connection.execute(f'''
+        INSERT OR REPLACE INTO {CATALOG_TABLE}
+            (symbol, frequency, table_name, start_date, end_date, oldest, row_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?);
+    ''', (symbol, frequency, table_name, str(table_start), str(table_end), int(oldest), row_count))
+    # Bump the catalog version to invalidate the caches of the other processes
+    bump_version(connection)
+    # The entry is cached by the next lookup, after the caller committed it
+    invalidate(symbol, frequency)
+    return CatalogEntry(table_name, table_start, table_end, oldest, row_count)
+
+
+def get_entry(connection: sqlite3.Connection, symbol: str, frequency: str) -> CatalogEntry | None:
+    """
+    Return the catalog entry of the stock symbol table.
+    Tables saved before the catalog are registered by schema.upgrade_database, a missing entry means no table.
+    :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :return: Catalog entry or None when the table does not exist
+    """
+    symbol = symbol.upper()
+    # Serve from the cache when the catalog did not change since the entry was cached
+    database_key, version = version_key(connection)
+    cached = _catalog_cache.get((database_key, symbol, frequency))
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    # Reading never writes, the catalog table is created by the first registered table
+    try:
+        row = connection.execute(f'''
+            SELECT table_name, start_date, end_date, oldest, row_count
+            FROM {CATALOG_TABLE}
+            WHERE symbol = ? AND frequency = ?;
+        ''', (symbol, frequency)).fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    if row is None:
+        return None
+    entry = CatalogEntry(row[0], datetime.strptime(row[1], '%Y-%m-%d').date(),
+                         datetime.strptime(row[2], '%Y-%m-%d').date(), bool(row[3]), row[4])
+    _cache_entry(connection, symbol, frequency, entry)
+    return entry
+
+
+def get_entry_by_table(table_name: str) -> CatalogEntry | None:
+    """
+    Return the cached catalog entry of the given table.
+    :param table_name: Name of the stock symbol table
+    :return: Catalog entry or None when the table was not resolved in this process
+    """
+    return _entries_by_table.get(table_name)
+
+
+def rebuild_catalog(connection: sqlite3.Connection) -> int:
+    """
+    Register every stock symbol table of the database inside the catalog, in a single transaction.
+    :param connection: Connection to the SQLite database
+    :return: Number of registered tables
+    """
+    cursor = connection.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'stock_%|%&freq=%';")
+    tables = [table[0] for table in cursor.fetchall()]
+    with database.transaction(connection):
+        create_catalog(connection)
+        for table_name in tables:
+            symbol: str = table_name[len('stock_'):].split('|')[0]
+            frequency: str = table_name.split('&freq=')[1]
+            register_table(connection, symbol, frequency, table_name)
+    return len(tables)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Register the per-symbol tables created before the catalog.')
+    parser.add_argument('--database', default='stock_database.db', help='Name of the database file')
+    args = parser.parse_args()
+    conn = database.open_connection(args.database)
+    print(f'Registered {rebuild_catalog(conn)} tables')
+    conn.close()
@@ -0,0 +1,298 @@
+import sqlite3
+import threading
+from datetime import date, datetime
+from typing import Dict, List, NamedTuple, Tuple
+import numpy as np
+import pandas as pd
+from webScrape import app, catalog, receiver
+
+# Table with the dividends and stock splits of every symbol
+ACTIONS_TABLE: str = 'corporate_actions'
+# Stored prices are kept as downloaded, Yahoo adjusts them for the stock splits known at the download.
+# Table with the date ranges downloaded after every split, the split does not adjust these rows again
+COVERAGE_TABLE: str = 'split_coverage'
+# Key of DataFrame.attrs carrying the events downloaded together with the prices
+EVENTS_ATTR: str = 'events'
+# Columns adjusted by the price factors
+PRICE_COLUMNS: List[str] = ['Open', 'High', 'Low', 'Close']
+
+
+class AdjustmentFactors(NamedTuple):
+    """Cumulative factors of the events, the rows before the n-th event date use the n-th factor."""
+    dates: np.ndarray
+    price: np.ndarray
+    volume: np.ndarray
+
+
+# Factors of the symbols, {(database, symbol, frequency): (catalog_version, factors)}
+_factor_cache: Dict[Tuple[str, str, str], Tuple[int, AdjustmentFactors]] = {}
+_factor_cache_lock = threading.Lock()
+
+
+def create_actions_table(connection: sqlite3.Connection) -> None:
+    """
+    Create the table of the corporate actions if it does not exist yet.
+    :param connection: Connection to the SQLite database
+    """
+    connection.execute(f'''
+        CREATE TABLE IF NOT EXISTS {ACTIONS_TABLE} (
+            "symbol" TEXT NOT NULL,
+            "date" TEXT NOT NULL,
+            "event" TEXT NOT NULL,
+            "value" REAL NOT NULL,
+            PRIMARY KEY("symbol", "date", "event")
+        ) WITHOUT ROWID;
+    ''')
+
+
+def create_coverage_table(connection: sqlite3.Connection) -> None:
+    """
+    Create the table of the date ranges already adjusted for the stock splits if it does not exist yet.
+    :param connection: Connection to the SQLite database
+    """
+    connection.execute(f'''
+        CREATE TABLE IF NOT EXISTS {COVERAGE_TABLE} (
+            "symbol" TEXT NOT NULL,
+            "frequency" TEXT NOT NULL,
+            "split_date" TEXT NOT NULL,
+            "start_date" TEXT NOT NULL,
+            "end_date" TEXT NOT NULL,
+            PRIMARY KEY("symbol", "frequency", "split_date", "start_date")
+        ) WITHOUT ROWID;
+    ''')
+
+
+def save_actions(connection: sqlite3.Connection, symbol: str, events: pd.DataFrame) -> int:
+    """
+    Insert the dividends and stock splits of the symbol, events saved before are replaced, committed by the caller.
+    :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
+    :param events: Pandas DataFrame with the Date, Event and Value columns
+    :return: Number of saved events
+    """
+    symbol = symbol.upper()
+    events = events.dropna(subset=['Value'])
+    create_actions_table(connection)
+    connection.executemany(f'INSERT OR REPLACE INTO {ACTIONS_TABLE} (symbol, date, event, value) '
+                           f'VALUES (?, ?, ?, ?);',
+                           zip([symbol] * len(events), events['Date'].astype(str).tolist(),
+                               events['Event'].tolist(), events['Value'].astype(float).tolist()))
+    # Bump the catalog version, the factors cached by the other processes are recalculated
+    catalog.bump_version(connection)
+    invalidate(symbol)
+    return len(events)
+
+
+def load_split_coverage(connection: sqlite3.Connection, symbol: str, frequency: str) -> pd.DataFrame:
+    """
+    Read the date ranges downloaded after the stock splits of the symbol.
+    :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :return: Pandas DataFrame with the Split Date, Start and End columns
+    """
+    create_coverage_table(connection)
+    cursor = connection.execute(f'SELECT split_date, start_date, end_date FROM {COVERAGE_TABLE} '
+                                f'WHERE symbol = ? AND frequency = ? ORDER BY split_date, start_date;',
+                                (symbol.upper(), frequency))
+    return pd.DataFrame(cursor.fetchall(), columns=['Split Date', 'Start', 'End'])
+
+
+def save_split_coverage(connection: sqlite3.Connection, symbol: str, frequency: str, dates: pd.Series,
+                        as_of: date | None = None) -> None:
+    """
+    Record the rows downloaded after the saved stock splits, their prices already include the splits.
+    The rows before a split date and downloaded after it are excluded from its adjustment on read.
+    Committed by the caller together with the rows.
+    :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param dates: Dates of the saved rows
+    :param as_of: Day of the download. Default today
+    """
+    symbol = symbol.upper()
+    as_of = as_of or datetime.now().date()
+    create_actions_table(connection)
+    splits: List[Tuple[str]] = connection.execute(f"SELECT date FROM {ACTIONS_TABLE} "
+                                                  f"WHERE symbol = ? AND event = 'Split' AND date <= ?;",
+                                                  (symbol, str(as_of))).fetchall()
+    dates = np.asarray(list(dates), dtype='datetime64[D]')
+    if not splits or len(dates) == 0:
+        return
+    coverage = load_split_coverage(connection, symbol, frequency)
+    for (split_date,) in splits:
+        before = dates[dates < np.datetime64(split_date)]
+        if len(before) == 0:
+            continue
+        # Merge the overlapping ranges, the rows inside them were downloaded after the split
+        ranges = coverage.loc[coverage['Split Date'] == split_date, ['Start', 'End']].values.tolist()
+        ranges.append([str(before.min()), str(before.max())])
+        merged: List[List[str]] = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        connection.execute(f'DELETE FROM {COVERAGE_TABLE} WHERE symbol = ? AND frequency = ? AND split_date = ?;',
+                           (symbol, frequency, split_date))
+        connection.executemany(f'INSERT INTO {COVERAGE_TABLE} (symbol, frequency, split_date, start_date, '
+                               f'end_date) VALUES (?, ?, ?, ?, ?);',
+                               [(symbol, frequency, split_date, start, end) for start, end in merged])
+    catalog.bump_version(connection)
+    invalidate(symbol)
+
+
+def attach_events(data: pd.DataFrame, events: pd.DataFrame) -> None:
+    """
+    Attach the events downloaded together with the prices, saved by save_into_database.
+    Kept as a list of tuples, pandas copies DataFrame.attrs with every operation on the data.
+    :param data: Pandas DataFrame with the downloaded prices
+    :param events: Pandas DataFrame with the Date, Event and Value columns
+    """
+    data.attrs[EVENTS_ATTR] = list(events[app.EVENT_COLUMNS].itertuples(index=False, name=None))
+
+
+def attached_events(data: pd.DataFrame) -> pd.DataFrame | None:
+    """
+    Return the events attached to the downloaded prices.
+    :param data: Pandas DataFrame with the downloaded prices
+    :return: Pandas DataFrame with the Date, Event and Value columns or None when nothing is attached
+    """
+    events = data.attrs.get(EVENTS_ATTR)
+    if not events:
+        return None
+    return pd.DataFrame(events, columns=app.EVENT_COLUMNS)
+
+
+def load_actions(connection: sqlite3.Connection, symbol: str) -> pd.DataFrame:
+    """
+    Read the dividends and stock splits of the symbol.
+    :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
+    :return: Pandas DataFrame with the Date, Event and Value columns, the oldest events first
+    """
+    create_actions_table(connection)
+    cursor = connection.execute(f'SELECT date, event, value FROM {ACTIONS_TABLE} WHERE symbol = ? ORDER BY date;',
+                                (symbol.upper(),))
+    return pd.DataFrame(cursor.fetchall(), columns=app.EVENT_COLUMNS)
+
+
+def invalidate(symbol: str | None = None) -> None:
+    """
+    Drop the cached factors, all of them or only the ones of a given symbol.
+    :param symbol: Stock market symbol, None invalidates the whole cache
+    """
+    with _factor_cache_lock:
+        for key in list(_factor_cache):
+            if symbol is None or key[1] == symbol.upper():
+                del _factor_cache[key]
+
+
+def _cumulative(event_dates: np.ndarray, factors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the sorted event dates and the product of the factors of all the later events."""
+    order = np.argsort(event_dates, kind='stable')
+    # The last element is used by the rows after every event
+    return event_dates[order], np.append(np.cumprod(factors[order][::-1])[::-1], 1.0)
+
+
+def calculate_factors(actions: pd.DataFrame, dates: np.ndarray, closes: np.ndarray,
+                      coverage: pd.DataFrame | None = None) -> AdjustmentFactors:
+    """
+    Calculate the cumulative factors of the events with the vectorized products.
+    Split ratio r divides the earlier prices by r and multiplies the volume by r, except the rows of the coverage
+    ranges, downloaded after the split and already adjusted by Yahoo. Every range is expressed as two opposite
+    events, so the factors keep a single value for the rows between two consecutive event dates.
+    Dividend D multiplies the earlier prices by 1 - D / close of the day before the event.
+    :param actions: Pandas DataFrame with the Date, Event and Value columns
+    :param dates: Dates of the stored prices, the oldest first
+    :param closes: Close prices of the given dates
+    :param coverage: Pandas DataFrame with the Split Date, Start and End columns of the adjusted rows
+    :return: Factors of the rows before every event date
+    """
+    is_split = (actions['Event'] == 'Split').to_numpy()
+    event_dates = np.asarray(actions['Date'].tolist(), dtype='datetime64[D]')
+    values = actions['Value'].to_numpy(dtype=float)
+    split_dates, ratios = event_dates[is_split], values[is_split]
+    if coverage is not None and not coverage.empty:
+        ratio_of = dict(zip(split_dates.astype(str), ratios))
+        coverage = coverage[coverage['Split Date'].isin(ratio_of)]
+        covered_ratios = coverage['Split Date'].map(ratio_of).to_numpy(dtype=float)
+        # Ratio restored for the rows up to the range end and applied again before the range start
+        split_dates = np.concatenate([split_dates,
+                                      np.asarray(coverage['End'].tolist(), dtype='datetime64[D]') + 1,
+                                      np.asarray(coverage['Start'].tolist(), dtype='datetime64[D]')])
+        ratios = np.concatenate([ratios, 1 / covered_ratios, covered_ratios])
+    # Product of the split factors of every row, used to compare dividends with the closes on the same basis
+    sorted_split_dates, split_level = _cumulative(split_dates, 1 / ratios)
+
+    dividend_dates, dividends = event_dates[~is_split], values[~is_split]
+    # Close of the last row before the event, missing for the events older than the data
+    previous = np.searchsorted(dates, dividend_dates, side='left') - 1
+    previous_close = np.where(previous >= 0, closes[np.maximum(previous, 0)], np.nan)
+    if len(dates) > 0:
+        previous_dates = dates[np.maximum(previous, 0)]
+        previous_close = previous_close * split_level[np.searchsorted(sorted_split_dates, previous_dates, side='right')]
+    # Dividends are adjusted by Yahoo the same way as the prices downloaded together with them
+    dividends = dividends * split_level[np.searchsorted(sorted_split_dates, dividend_dates, side='right')]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dividend_factor = 1 - dividends / previous_close
+    dividend_factor = np.where((previous >= 0) & (dividend_factor > 0), dividend_factor, 1.0)
+
+    all_dates = np.concatenate([split_dates, dividend_dates])
+    factor_dates, price = _cumulative(all_dates, np.concatenate([1 / ratios, dividend_factor]))
+    _, volume = _cumulative(all_dates, np.concatenate([ratios, np.ones(len(dividend_dates))]))
+    return AdjustmentFactors(factor_dates, price, volume)
+
+
+def get_factors(connection: sqlite3.Connection, symbol: str, frequency: str) -> AdjustmentFactors:
+    """
+    Return the factors of the symbol, calculated once and reused until new data or events are saved.
+    :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :return: Cumulative factors of the symbol events
+    """
+    symbol = symbol.upper()
+    database_key, version = catalog.version_key(connection)
+    key = (database_key, symbol, frequency)
+    with _factor_cache_lock:
+        cached = _factor_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    actions = load_actions(connection, symbol)
+    dates, closes = np.array([], dtype='datetime64[D]'), np.array([], dtype=float)
+    entry = catalog.get_entry(connection, symbol, frequency)
+    if entry is not None and (actions['Event'] == 'Dividend').any():
+        prices = receiver.read_symbol_table(connection, symbol, frequency, entry.table_name,
+                                            datetime.min.date(), datetime.max.date(), columns=['Close'])[::-1]
+        dates = np.asarray(prices['Date'].tolist(), dtype='datetime64[D]')
+        closes = prices['Close'].to_numpy(dtype=float)
+    factors = calculate_factors(actions, dates, closes, load_split_coverage(connection, symbol, frequency))
+    with _factor_cache_lock:
+        _factor_cache[key] = (version, factors)
+    return factors
+
+
+def adjust(data: pd.DataFrame, factors: AdjustmentFactors) -> pd.DataFrame:
+    """
+    Apply the cumulative factors to the prices and the volume of any date range.
+    :param data: Pandas DataFrame with the Date column or indexed by the date
+    :param factors: Cumulative factors of the symbol events
+    :return: Copy of the data with the adjusted prices and volume
+    """
+    data = data.copy()
+    if data.empty or len(factors.dates) == 0:
+        return data
+    dates = data['Date'] if 'Date' in data.columns else data.index
+    # Number of the events not later than every row, the row uses the factor of the next event
+    position = np.searchsorted(factors.dates, np.asarray(list(dates), dtype='datetime64[D]'), side='right')
+    price_factor = factors.price[position]
+    for column in PRICE_COLUMNS:
+        if column in data.columns:
+            data[column] = np.round(data[column].to_numpy(dtype=float) * price_factor, 6)
+    # Stored Adj Close already includes the events known at the download, it is replaced by the adjusted Close
+    if 'Adj Close' in data.columns and 'Close' in data.columns:
+        data['Adj Close'] = data['Close']
+    if 'Volume' in data.columns:
+        data['Volume'] = np.round(data['Volume'].to_numpy(dtype=float) * factors.volume[position]).astype(np.int64)
+    return data
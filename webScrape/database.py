@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+from config import config
+from config.config import logger
+
+# Connections reused by the current thread, {database path: _ThreadConnection}
+_local = threading.local()
+
+
+class _ThreadConnection:
+    """Connection owned by a single thread together with the identity of the opened file."""
+
+    def __init__(self, connection: sqlite3.Connection, file_id: Tuple[int, int] | None):
+        self.connection = connection
+        self.file_id = file_id
+        # Number of nested connect() blocks using the connection
+        self.depth: int = 0
+
+
+def database_path(database_name: str | Path = 'stock_database.db') -> Path:
+    """
+    Return the path of the database file, absolute paths are returned unchanged.
+    :param database_name: Name of the database inside the data directory or the path of the file
+    :return: Path of the database file
+    """
+    return Path(config.DATA_DICT, database_name)
+
+
+def configure(connection: sqlite3.Connection) -> None:
+    """
+    Apply the settings of the connection, WAL lets the readers work while a single writer saves the data.
+    :param connection: Connection to the SQLite database
+    """
+    try:
+        connection.execute('PRAGMA journal_mode=WAL;')
+    except sqlite3.OperationalError as err:
+        # Another connection holds the lock, the database stays in the previous journal mode
+        logger.warning(f'Enabling WAL failed: {err}')
+    connection.execute('PRAGMA synchronous=NORMAL;')
+    connection.execute(f'PRAGMA mmap_size={config.DB_MMAP_SIZE};')
+    connection.execute(f'PRAGMA cache_size=-{config.DB_CACHE_SIZE};')
+    connection.execute('PRAGMA temp_store=MEMORY;')
+
+
+def open_connection(database_name: str | Path = 'stock_database.db',
+                    check_same_thread: bool = True) -> sqlite3.Connection:
+    """
+    Open a new configured connection, closed by the caller.
+    :param database_name: Name of the database inside the data directory or the path of the file
+    :param check_same_thread: Whether only the creating thread may use the connection
+    :return: Connection to the SQLite database
+    """
+    connection = sqlite3.connect(database_path(database_name), timeout=config.DB_BUSY_TIMEOUT,
+                                 cached_statements=config.DB_CACHED_STATEMENTS,
+                                 check_same_thread=check_same_thread)
+    configure(connection)
+    # Tables saved by the previous versions are migrated once, before anything reads or writes them
+    from webScrape import schema
+    schema.upgrade_database(connection)
+    return connection
+
+
+@contextmanager
+def transaction(connection: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """
+    Run the statements inside a single transaction, committed at the end or rolled back on error.
+    Unlike the implicit transaction, the created tables are rolled back together with the data.
+    :param connection: Connection to the SQLite database
+    :return: The same connection
+    """
+    if not connection.in_transaction:
+        connection.execute('BEGIN;')
+    with connection:
+        yield connection
+
+
+def _file_id(path: Path) -> Tuple[int, int] | None:
+    """Return the device and inode of the file, None when the file does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+@contextmanager
+def connect(database_name: str | Path = 'stock_database.db',
+            connection: sqlite3.Connection | None = None) -> Iterator[sqlite3.Connection]:
+    """
+    Use the connection of the current thread, opened once and reused by the following calls.
+    Transaction left open by the outermost block is rolled back, the same as after closing the connection.
+    :param database_name: Name of the database inside the data directory or the path of the file
+    :param connection: Connection passed by the caller, used instead of the thread connection
+    :return: Connection to the SQLite database
+    """
+    if connection is not None:
+        yield connection
+        return
+    path: Path = database_path(database_name)
+    connections: Dict[str, _ThreadConnection] = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    item = connections.get(str(path))
+    # The database file was removed or replaced since the connection was opened
+    if item is not None and item.depth == 0 and item.file_id != _file_id(path):
+        item.connection.close()
+        item = None
+    if item is None:
+        new_connection = open_connection(path)
+        item = connections[str(path)] = _ThreadConnection(new_connection, _file_id(path))
+    item.depth += 1
+    try:
+        yield item.connection
+    finally:
+        item.depth -= 1
+        if item.depth == 0 and item.connection.in_transaction:
+            item.connection.rollback()
+
+
+def close_connections() -> None:
+    """Close the connections of the current thread, required before the database file is removed."""
+    connections: Dict[str, _ThreadConnection] = getattr(_local, 'connections', {})
+    for item in connections.values():
+        item.connection.close()
+    connections.clear()
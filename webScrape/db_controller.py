@@ -1,10 +1,11 @@
 import sqlite3
 import os
-import shutil
 import zipfile
 from pathlib import Path
-from webScrape import app
+from webScrape import app, bars, catalog, corporate_actions, database, receiver, schema, snapshot
+from backend import response_cache, technical_indicators
 from config import config
+import numpy as np
 import pandas as pd
 from typing import Union, List
 from datetime import datetime
@@ -37,12 +38,41 @@ def delete_duplicates(connection: sqlite3.Connection, table_name: str) -> None:
     connection.commit()
 
 
+def upsert_rows(connection: sqlite3.Connection, table_name: str, data: pd.DataFrame) -> int:
+    """
+    Insert the rows, rows with an existing date replace the stored values, committed by the caller.
+    The cost depends only on the number of the new rows, not on the size of the table.
+    Tables saved before the typed schema are migrated by schema.upgrade_database when the database is opened.
+    :param connection: Connection to the SQLite database.
+    :param table_name: Name of the stock symbol table.
+    :param data: Pandas DataFrame with stock symbol data.
+    :return: Number of the inserted rows, the replaced rows are not counted.
+    """
+    columns: List[str] = list(data.columns)
+    schema.create_symbol_table(connection, table_name, columns)
+    names: str = ', '.join(f'"{column}"' for column in columns)
+    updates: str = ', '.join(f'"{column}" = excluded."{column}"' for column in columns if column != 'Date')
+    upsert_query: str = (f'INSERT INTO `{table_name}` ({names}) VALUES ({", ".join("?" * len(columns))}) '
+                         f'ON CONFLICT(Date) DO UPDATE SET {updates};')
+    values: List[list] = [schema.to_epoch_days(data[column]) if column == 'Date' else data[column].tolist()
+                          for column in columns]
+    if len(data) == 0:
+        return 0
+    # Only the rows between the new dates are counted, through the primary key, before and after the upsert
+    count_query: str = f'SELECT COUNT(*) FROM `{table_name}` WHERE Date BETWEEN ? AND ?;'
+    dates: List[int] = values[columns.index('Date')]
+    stored_rows: int = connection.execute(count_query, (min(dates), max(dates))).fetchone()[0]
+    connection.executemany(upsert_query, zip(*values))
+    return connection.execute(count_query, (min(dates), max(dates))).fetchone()[0] - stored_rows
+
+
 def save_into_database(connection: sqlite3.Connection, data: pd.DataFrame, symbol: str,
                        start_date: Union[datetime.date, str],
                        end_date: datetime.date, frequency: str,
                        database_name: str = 'stock_database.db') -> None:
     """
     Save data to a database specific table.
+    The rows, the corporate actions, the catalog entry and the snapshot are saved in a single transaction.
     :param connection: Connection to the SQLite database.
     :param data: Pandas DataFrame with stock symbol data.
     :param symbol: Stock market symbol.
@@ -51,43 +81,69 @@ def save_into_database(connection: sqlite3.Connection, data: pd.DataFrame, symbo
     :param frequency: String specifying the frequency of the data, defaults-1d, possible values: [1d, 1wk, 1mo]
     :param database_name: Name of the database where data will be saved. Default "stock_database"
     """
+    try:
+        with database.transaction(connection):
+            _save_symbol_data(connection, data, symbol, start_date, end_date, frequency)
+    except Exception:
+        # Tables created inside the rolled back transaction must be created again
+        catalog.invalidate()
+        snapshot.invalidate()
+        raise
+    # Drop the dividend factors and the API responses calculated from the previous data
+    corporate_actions.invalidate(symbol)
+    response_cache.invalidate(symbol)
+
+
+def _save_symbol_data(connection: sqlite3.Connection, data: pd.DataFrame, symbol: str,
+                     start_date: Union[datetime.date, str], end_date: datetime.date, frequency: str) -> None:
+    """
+    Save the rows of the symbol and everything derived from them, committed by the caller.
+    :param connection: Connection to the SQLite database.
+    :param data: Pandas DataFrame with stock symbol data.
+    :param symbol: Stock market symbol.
+    :param start_date: Beginning of the period of time.
+    :param end_date: End of the period of time.
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    """
+    # Save the dividends and stock splits downloaded together with the prices
+    events = corporate_actions.attached_events(data)
+    if events is not None:
+        corporate_actions.save_actions(connection, symbol, events)
+    # Rows downloaded after the saved stock splits already include them
+    corporate_actions.save_split_coverage(connection, symbol, frequency, data['Date'])
+    # Save into the long-format table when the bars storage engine is used
+    if config.STORAGE_ENGINE == 'bars':
+        bars.save_into_bars(connection, data, symbol, start_date, end_date, frequency)
+        snapshot.refresh_snapshot(connection, symbol, frequency)
+        return
     # Create a table name
     table_name = f'stock_{symbol}|{start_date}-{end_date}&freq={frequency}'
-    # Define the table schema
-    create_table_query = '''
-                    CREATE TABLE IF NOT EXISTS master_table (
-                        "symbol" TEXT,
-                        "table_name" TEXT,
-                        PRIMARY KEY("symbol")
-                    );
-                    '''
-    # Execute the query to create the table
-    connection.execute(create_table_query)
-    insert_query = '''
-                    INSERT OR REPLACE INTO master_table (symbol, table_name)
-                    VALUES (?, ?);
-                    '''
-    connection.execute(insert_query, (symbol + '_' + frequency, table_name))
-
-    # Get the name of the stock symbol table
-    database_table_name: str = app.get_name_of_symbol_table(symbol, frequency, connection, database_name)
-    if database_table_name is not None:
-        table_start, table_end = app.extract_date_from_table(database_table_name)
+    # Get the catalog entry of the stock symbol table
+    entry = catalog.get_entry(connection, symbol, frequency)
+    if entry is not None:
+        table_start = entry.start_date
         if not isinstance(start_date, str):
             if table_start < start_date:
-                if database_table_name.split('_')[1].split('|')[1] == 'oldest':
+                if entry.oldest:
                     table_start = 'oldest_' + str(table_start)
                 table_name = f'stock_{symbol}|{table_start}-{end_date}&freq={frequency}'
-        # Add Pandas dataframe to the sql database
-        data.to_sql(database_table_name, connection, if_exists='append', index=False)
-        change_table_name_query = f'ALTER TABLE `{database_table_name}` RENAME TO `{table_name}`'
-        cursor = connection.cursor()
-        cursor.execute(change_table_name_query)
+        # Insert the new rows, rows with the already saved dates are updated
+        row_count: int = entry.row_count + upsert_rows(connection, entry.table_name, data)
+        if entry.table_name != table_name:
+            change_table_name_query = f'ALTER TABLE `{entry.table_name}` RENAME TO `{table_name}`'
+            cursor = connection.cursor()
+            cursor.execute(change_table_name_query)
     else:
-        data.to_sql(table_name, connection, if_exists='append', index=False)
+        row_count = upsert_rows(connection, table_name, data)
+    # Overwritten rows are calculated again by the next indicators update
+    if len(data) > 0:
+        first_date: str = str(np.asarray(list(data['Date']), dtype='datetime64[D]').min())
+        technical_indicators.rewind_indicator_state(connection, symbol, first_date, frequency)
 
-    # Check whether duplicates occur inside the table
-    delete_duplicates(connection, table_name)
+    # Register new name, date range and size of the table in the catalog, without counting the whole table
+    catalog.register_table(connection, symbol, frequency, table_name, row_count)
+    # Save the latest bar served by the /latest endpoint
+    snapshot.refresh_snapshot(connection, symbol, frequency)
 
 
 def fetch_from_database(symbol: str, frequency: str, connection: sqlite3.Connection | None = None,
@@ -99,21 +155,16 @@ def fetch_from_database(symbol: str, frequency: str, connection: sqlite3.Connect
     :param frequency: String specifying the frequency of the data, defaults-1d, possible values: [1d, 1wk, 1mo].
     :param database_name: Name of the database where data will be saved. Default "stock_database".
     """
-    if connection is None:
-        connection = sqlite3.connect(f'{Path(config.DATA_DICT, "stock_database.db")}')
-    try:
-        # Get the name of the symbol array
-        table_name: str = app.get_name_of_symbol_table(symbol, frequency, connection, database_name)
-        sort_query: str = f'SELECT * FROM `{table_name}` ORDER BY Date DESC'
-        cursor = connection.execute(sort_query)
-        results = cursor.fetchall()
-        # Fetch all the table columns
-        column_exists = connection.execute(f'PRAGMA table_info(`{table_name}`);')
-        table_columns = [col[1] for col in column_exists]
-        print('\n', pd.DataFrame(results, columns=table_columns))
-    except IndexError:
-        print(f'No data for {symbol}')
-    connection.close()
+    with database.connect(connection=connection) as connection:
+        try:
+            # Get the name of the symbol array
+            table_name: str = app.get_name_of_symbol_table(symbol, frequency, connection, database_name)
+            if table_name == bars.BARS_TABLE:
+                print('\n', bars.read_bars(connection, symbol, frequency, datetime.min.date(), datetime.max.date()))
+                return
+            print('\n', receiver.receiver(connection, table_name, datetime.min.date(), datetime.max.date()))
+        except IndexError:
+            print(f'No data for {symbol}')
 
 
 def check_previous_backup(backup_files_list: List[str] = None) -> str:
@@ -214,22 +265,20 @@ def manage_backups() -> None:
 def display_database_tables() -> None:
     """Display names of all the database tables."""
     # Connect to the database
-    conn = sqlite3.connect(f'{Path(config.DATA_DICT, "stock_database.db")}')
-    try:
-        cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        # Fetch everything from the database
-        tables = cursor.fetchall()
-        if tables:
-            # Print all table names
-            print('\nTables in the database')
-            for table in tables:
-                print(table[0])
-        else:
-            print('No tables in the database')
-    except sqlite3.Error as e:
-        print(f'Error: {e}')
-    finally:
-        conn.close()
+    with database.connect() as conn:
+        try:
+            cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table';")
+            # Fetch everything from the database
+            tables = cursor.fetchall()
+            if tables:
+                # Print all table names
+                print('\nTables in the database')
+                for table in tables:
+                    print(table[0])
+            else:
+                print('No tables in the database')
+        except sqlite3.Error as e:
+            print(f'Error: {e}')
 
 
 def reset_database() -> None:
@@ -237,13 +286,21 @@ def reset_database() -> None:
     try:
         # Create a backup of the database
         backup_database()
+        # Connections of the thread would keep the removed file open
+        database.close_connections()
+        # Entries cached from the removed database must not be served for the new one
+        catalog.invalidate()
+        corporate_actions.invalidate()
+        snapshot.invalidate()
         # Remove current working database
         os.remove(Path(config.DATA_DICT, 'stock_database.db'))
+        # Write-ahead log of the removed database must not be applied to the new one
+        for suffix in ('-wal', '-shm'):
+            Path(config.DATA_DICT, f'stock_database.db{suffix}').unlink(missing_ok=True)
     except FileNotFoundError:
         print('Database does not exist!')
     # Create a new empty database
-    conn = sqlite3.connect(f'{Path(config.DATA_DICT, "stock_database.db")}')
-    conn.close()
+    database.open_connection().close()
 
 
 def backup_database(force: bool = False) -> None:
@@ -256,9 +313,12 @@ def backup_database(force: bool = False) -> None:
     if current_weekday == 'Friday' or force:
         database_path: Path = Path(config.DATA_DICT, 'stock_database.db')
         backup_path: Path = Path(config.DATA_DICT, 'backups', f'backup_database_{current_day.date()}.db')
-        # Copy current database data to the backup database
+        # Copy current database data to the backup database, including the changes inside the write-ahead log
         if os.path.isfile(database_path):
-            shutil.copy2(database_path, backup_path)
+            with database.connect() as source:
+                destination = sqlite3.connect(backup_path)
+                source.backup(destination)
+                destination.close()
 
     # Manage backups
     manage_backups()
@@ -0,0 +1,141 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Tuple
+import pandas as pd
+import selenium.common.exceptions
+from config import config
+from config.config import logger
+from webScrape import app, browser, db_controller, fetchers
+
+
+class SymbolReport(NamedTuple):
+    """Outcome of downloading a single stock symbol."""
+    symbol: str
+    seconds: float
+    rows: int
+    error: str | None
+
+
+def _database_writer(results: queue.Queue, database_name: str, end_to_file: datetime.date, frequency: str,
+                     save_database: bool, collected: Dict[str, pd.DataFrame], write_errors: Dict[str, str],
+                     checkpoint: Callable[[sqlite3.Connection, str], None] | None = None) -> None:
+    """Save downloaded data with a single database connection, so SQLite never has concurrent writers."""
+    conn = app.connect_to_database(database_name) if save_database else None
+    while True:
+        item = results.get()
+        # Sentinel sent after all the symbols were downloaded
+        if item is None:
+            break
+        symbol, stock_df, start_to_file = item
+        try:
+            if save_database:
+                db_controller.save_into_database(conn, stock_df, symbol, start_to_file, end_to_file, frequency)
+                # Record the saved symbol right away, a crashed run does not download it again
+                if checkpoint is not None:
+                    checkpoint(conn, symbol)
+            stock_df['Company'] = symbol
+            collected[symbol] = stock_df
+        except Exception as err:
+            # Keep draining the queue, the workers would block on the full queue after the writer stopped
+            logger.error(f'Saving {symbol} into the database failed: {err!r}')
+            write_errors[symbol] = repr(err)
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+    if conn is not None:
+        conn.close()
+
+
+def download_symbols(symbols: List[str], start: datetime, end: datetime, frequency: str, save_database: bool = True,
+                     database_name: str = 'stock_database.db', pool_size: int | None = None,
+                     incorrect_symbols: List[str] | None = None, driver_factory: Callable | None = None,
+                     fetch: Callable | None = None,
+                     checkpoint: Callable[[sqlite3.Connection, str], None] | None = None) \
+        -> Tuple[List[pd.DataFrame], List[SymbolReport]]:
+    """
+    Download symbols in parallel with a pool of webdrivers and save them through a single database writer.
+    :param symbols: List of stock market symbols
+    :param start: Beginning of the period of time
+    :param end: End of the period of time
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param save_database: Determine whether to save data into the database
+    :param database_name: Name of the database where data will be saved. Default "stock_database"
+    :param pool_size: Number of webdrivers working in parallel. Default config.DRIVER_POOL_SIZE
+    :param incorrect_symbols: Array collecting incorrect symbols
+    :param driver_factory: Function creating a new webdriver. Default warm browser session of browser.acquire
+    :param fetch: Function downloading a single symbol with the webdriver. Default fetchers.fetch_symbol
+    :param checkpoint: Function called by the database writer with its connection after every saved symbol
+    :return: DataFrames of the downloaded symbols in the given order and reports for every symbol
+    """
+    symbols = list(symbols)
+    if incorrect_symbols is None:
+        incorrect_symbols = []
+    pool_size = max(1, min(pool_size or config.DRIVER_POOL_SIZE, len(symbols)))
+    driver_factory = driver_factory or browser.acquire
+    fetch = fetch or fetchers.fetch_symbol
+    end_to_file: datetime.date = end.date()
+
+    # Idle webdrivers, created on demand up to the number of workers
+    drivers: queue.Queue = queue.Queue()
+    created_drivers: List = []
+    drivers_lock = threading.Lock()
+    # Bounded queue stops downloading when the database writer falls behind
+    results: queue.Queue = queue.Queue(maxsize=pool_size * 2)
+    collected: Dict[str, pd.DataFrame] = {}
+    write_errors: Dict[str, str] = {}
+    writer = threading.Thread(target=_database_writer, daemon=True,
+                              args=(results, database_name, end_to_file, frequency, save_database, collected,
+                                    write_errors, checkpoint))
+    writer.start()
+
+    def worker(symbol: str) -> SymbolReport:
+        start_time = time.perf_counter()
+        try:
+            driver = drivers.get_nowait()
+        except queue.Empty:
+            driver = driver_factory()
+            with drivers_lock:
+                created_drivers.append(driver)
+        try:
+            result = fetch(driver, symbol, start, end, frequency, database_name, incorrect_symbols)
+        except (selenium.common.exceptions.WebDriverException, fetchers.FetchError, TypeError, ValueError) as err:
+            # Replace the webdriver, it might have crashed
+            with drivers_lock:
+                created_drivers.remove(driver)
+            try:
+                driver.quit()
+            except selenium.common.exceptions.WebDriverException:
+                pass
+            logger.error(f'Downloading {symbol} failed: {err!r}')
+            return SymbolReport(symbol, time.perf_counter() - start_time, 0, repr(err))
+        drivers.put(driver)
+        rows: int = 0
+        if result is not None:
+            stock_df, start_to_file = result
+            rows = len(stock_df)
+            results.put((symbol, stock_df, start_to_file))
+        error = 'Incorrect symbol' if symbol in incorrect_symbols else None
+        return SymbolReport(symbol, time.perf_counter() - start_time, rows, error)
+
+    try:
+        with ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='scraper') as executor:
+            reports: List[SymbolReport] = list(executor.map(worker, symbols))
+    finally:
+        results.put(None)
+        writer.join()
+        # Browser sessions are kept warm for the next download
+        for driver in created_drivers:
+            browser.release(driver)
+
+    # Attach failures of the database writer to the reports
+    reports = [report._replace(error=write_errors[report.symbol]) if report.symbol in write_errors else report
+               for report in reports]
+    for report in reports:
+        logger.info(f'{report.symbol}: {report.rows} rows in {report.seconds:.2f} sec'
+                    + (f', failed: {report.error}' if report.error else ''))
+    failed: int = sum(report.error is not None for report in reports)
+    logger.info(f'Downloaded {len(reports) - failed}/{len(reports)} symbols with {pool_size} webdrivers')
+    return [collected[symbol] for symbol in symbols if symbol in collected], reports
@@ -0,0 +1,217 @@
+import io
+import json
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple, Union
+import numpy as np
+import pandas as pd
+import urllib3
+from config import config
+from config.config import logger
+from webScrape import app, corporate_actions
+
+# Columns of the downloaded data, in the order returned by data_converter
+PRICE_COLUMNS: List[str] = ['Date', 'Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+# Timeout of a single HTTP request in seconds
+HTTP_TIMEOUT: float = 30.0
+
+# Keep-alive connections shared by all the HTTP downloads
+_http_pool: urllib3.PoolManager | None = None
+_http_pool_lock = threading.Lock()
+
+
+class FetchError(Exception):
+    """Raised when the fetcher cannot download the data and the next fetcher should be tried."""
+
+
+def get_http_pool() -> urllib3.PoolManager:
+    """
+    Return the connection pool used by the HTTP fetcher, created on the first call.
+    :return: Pool manager keeping the connections alive between the requests
+    """
+    global _http_pool
+    with _http_pool_lock:
+        if _http_pool is None:
+            retries = urllib3.Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                                    raise_on_status=False)
+            _http_pool = urllib3.PoolManager(maxsize=config.DRIVER_POOL_SIZE, retries=retries,
+                                             timeout=urllib3.Timeout(total=HTTP_TIMEOUT),
+                                             headers={'User-Agent': 'Mozilla/5.0'})
+        return _http_pool
+
+
+def parse_history_csv(body: bytes) -> pd.DataFrame:
+    """
+    Convert the history downloaded as CSV into Pandas DataFrame.
+    :param body: CSV file with Date, Open, High, Low, Close, Adj Close and Volume columns
+    :return: Pandas DataFrame with stock symbol data, the latest rows first
+    """
+    stock_df = pd.read_csv(io.BytesIO(body), na_values=['null', '-'])
+    return _format_history(stock_df)
+
+
+def parse_history_json(body: bytes) -> pd.DataFrame:
+    """
+    Convert the history downloaded from the chart API into Pandas DataFrame.
+    :param body: JSON document with the timestamps and the indicators of the symbol
+    :return: Pandas DataFrame with stock symbol data, the latest rows first
+    """
+    try:
+        result = json.loads(body)['chart']['result'][0]
+        quote = result['indicators']['quote'][0]
+        timestamps = np.asarray(result.get('timestamp', []), dtype=np.int64) + result['meta'].get('gmtoffset', 0)
+        stock_df = pd.DataFrame({
+            'Date': pd.to_datetime(timestamps, unit='s').strftime('%Y-%m-%d'),
+            'Open': quote.get('open', []),
+            'High': quote.get('high', []),
+            'Low': quote.get('low', []),
+            'Close': quote.get('close', []),
+            'Adj Close': result['indicators'].get('adjclose', [{}])[0].get('adjclose', quote.get('close', [])),
+            'Volume': quote.get('volume', [])
+        })
+        events = parse_chart_events(result.get('events', {}), result['meta'].get('gmtoffset', 0))
+    except (KeyError, IndexError, TypeError, ValueError) as err:
+        raise FetchError(f'Unexpected chart response: {err!r}')
+    stock_df = _format_history(stock_df)
+    # Corporate actions are saved together with the prices
+    corporate_actions.attach_events(stock_df, events)
+    return stock_df
+
+
+def parse_chart_events(chart_events: Dict, gmtoffset: int = 0) -> pd.DataFrame:
+    """
+    Convert the dividends and stock splits of the chart API into the events returned by data_converter.
+    :param chart_events: Dictionary with the "dividends" and "splits" indexed by the timestamps
+    :param gmtoffset: Offset of the exchange time zone in seconds
+    :return: Pandas DataFrame with the Date, Event and Value columns, the latest rows first
+    """
+    dividends = list(chart_events.get('dividends', {}).values())
+    splits = list(chart_events.get('splits', {}).values())
+    timestamps = np.asarray([event['date'] for event in dividends + splits], dtype=np.int64) + gmtoffset
+    events = pd.DataFrame({
+        'Date': pd.to_datetime(timestamps, unit='s').strftime('%Y-%m-%d').astype(object),
+        'Event': ['Dividend'] * len(dividends) + ['Split'] * len(splits),
+        'Value': [float(event['amount']) for event in dividends]
+                 + [event['numerator'] / event['denominator'] for event in splits]
+    }, columns=app.EVENT_COLUMNS)
+    return events.sort_values('Date', ascending=False, ignore_index=True)
+
+
+def _format_history(stock_df: pd.DataFrame) -> pd.DataFrame:
+    """Normalize the downloaded data into the format returned by data_converter."""
+    try:
+        stock_df = stock_df[PRICE_COLUMNS]
+    except KeyError as err:
+        raise FetchError(f'Missing columns in the downloaded data: {err}')
+    # Missing values are saved as zeros, the same as "-" on the webpage
+    stock_df = stock_df.fillna(0)
+    stock_df['Date'] = stock_df['Date'].astype(str)
+    stock_df[PRICE_COLUMNS[1:-1]] = stock_df[PRICE_COLUMNS[1:-1]].astype(float).round(2)
+    stock_df['Volume'] = stock_df['Volume'].astype(np.int64)
+    return stock_df.sort_values('Date', ascending=False, ignore_index=True)
+
+
+def fetch_http(driver, symbol: str, start: datetime, end: datetime, frequency: str, database_name: str,
+               incorrect_symbols: List[str]) -> Tuple[pd.DataFrame, Union[datetime.date, str]] | None:
+    """
+    Download the history of the symbol in a single HTTP request, served as CSV or JSON.
+    :param driver: Unused, keeps the signature of the other fetchers
+    :param symbol: Stock market symbol
+    :param start: Beginning of the period of time
+    :param end: End of the period of time
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param database_name: Name of the database where data will be saved
+    :param incorrect_symbols: Array collecting incorrect symbols
+    :return: Pandas DataFrame with the data and start date of the table or None when there is nothing to save
+    """
+    symbol = symbol.upper()
+    download_range = app.plan_download(symbol, start, end, frequency, database_name)
+    if download_range is None:
+        print('Data in a given date range already exists')
+        return None
+    start_date, end_date, previous_start_date = download_range
+    start_time: int = int(start_date.replace(tzinfo=timezone.utc).timestamp())
+    end_time: int = int(end_date.replace(tzinfo=timezone.utc).timestamp())
+    url: str = f'{config.YAHOO_QUERY_URL}/v8/finance/chart/{symbol}?period1={start_time}&period2={end_time}' \
+               f'&interval={frequency}&events=history%7Cdiv%7Csplit&includeAdjustedClose=true'
+    try:
+        response = get_http_pool().request('GET', url)
+    except urllib3.exceptions.HTTPError as err:
+        raise FetchError(f'Request failed: {err!r}')
+    if response.status == 404:
+        logger.error(f'Incorrect symbol stock "{symbol}", no such stock symbol.')
+        incorrect_symbols.append(symbol)
+        return None
+    if response.status != 200:
+        raise FetchError(f'Unexpected response status {response.status}')
+
+    if 'csv' in response.headers.get('Content-Type', ''):
+        stock_df = parse_history_csv(response.data)
+    else:
+        stock_df = parse_history_json(response.data)
+    if stock_df.empty:
+        print(f'No {symbol} data in a given date range')
+        return None
+
+    if previous_start_date is not None:
+        return stock_df, previous_start_date
+    # Mark the table when the history starts later than requested
+    first_date: datetime.date = datetime.strptime(stock_df['Date'].iloc[-1], '%Y-%m-%d').date()
+    if first_date > app.start_date_limits(start_date.date(), frequency)[1]:
+        return stock_df, f'oldest_{first_date}'
+    return stock_df, start_date.date()
+
+
+def fetch_selenium(driver, symbol: str, start: datetime, end: datetime, frequency: str, database_name: str,
+                   incorrect_symbols: List[str]) -> Tuple[pd.DataFrame, Union[datetime.date, str]] | None:
+    """
+    Download and convert the data of a single symbol by scrolling the webpage with the webdriver.
+    :param driver: Webdriver for remote control and browsing the webpage
+    :param symbol: Stock market symbol
+    :param start: Beginning of the period of time
+    :param end: End of the period of time
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param database_name: Name of the database where data will be saved
+    :param incorrect_symbols: Array collecting incorrect symbols
+    :return: Pandas DataFrame with the data and start date of the table or None when there is nothing to save
+    """
+    result = app.symbol_handler(driver, symbol, start, end, frequency, database_name, incorrect_symbols)
+    if result is None or result[0] is None:
+        return None
+    stock_table, start_to_file = result
+    prices, events = app.data_converter(stock_table)
+    # Corporate actions are saved together with the prices
+    corporate_actions.attach_events(prices, events)
+    return prices, start_to_file
+
+
+# Available fetchers, selected by the names inside config.FETCH_BACKENDS
+FETCHERS: Dict[str, Callable] = {
+    'http': fetch_http,
+    'selenium': fetch_selenium
+}
+
+
+def fetch_symbol(driver, symbol: str, start: datetime, end: datetime, frequency: str, database_name: str,
+                 incorrect_symbols: List[str], backends: List[str] | None = None) \
+        -> Tuple[pd.DataFrame, Union[datetime.date, str]] | None:
+    """
+    Download the data of a single symbol, trying the fetchers in order until one of them succeeds.
+    :param driver: Webdriver for remote control and browsing the webpage, used by the Selenium fetcher
+    :param symbol: Stock market symbol
+    :param start: Beginning of the period of time
+    :param end: End of the period of time
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param database_name: Name of the database where data will be saved
+    :param incorrect_symbols: Array collecting incorrect symbols
+    :param backends: Names of the fetchers to try. Default config.FETCH_BACKENDS
+    :return: Pandas DataFrame with the data and start date of the table or None when there is nothing to save
+    """
+    backends = backends or config.FETCH_BACKENDS
+    for position, backend in enumerate(backends):
+        try:
+            return FETCHERS[backend](driver, symbol, start, end, frequency, database_name, incorrect_symbols)
+        except FetchError as err:
+            if position == len(backends) - 1:
+                raise
+            logger.warning(f'Fetching {symbol} with {backend} failed, trying {backends[position + 1]}: {err}')
@@ -0,0 +1,258 @@
+import argparse
+import sqlite3
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, NamedTuple, Tuple
+import pandas as pd
+from config import config
+from config.config import logger
+from webScrape import app, database, driver_pool
+
+# Table with the queued downloads, a row for every symbol and date range
+JOBS_TABLE: str = 'scrape_jobs'
+# States of the jobs
+PENDING: str = 'pending'
+RUNNING: str = 'running'
+DONE: str = 'done'
+FAILED: str = 'failed'
+
+
+class Job(NamedTuple):
+    """Download of a single symbol over a date range."""
+    job_id: int
+    symbol: str
+    frequency: str
+    start_date: str
+    end_date: str
+    attempts: int
+
+
+def create_jobs_table(connection: sqlite3.Connection) -> None:
+    """
+    Create the table of the queued downloads if it does not exist yet.
+    :param connection: Connection to the SQLite database
+    """
+    connection.execute(f'''
+        CREATE TABLE IF NOT EXISTS {JOBS_TABLE} (
+            "id" INTEGER PRIMARY KEY,
+            "symbol" TEXT NOT NULL,
+            "frequency" TEXT NOT NULL,
+            "start_date" TEXT NOT NULL,
+            "end_date" TEXT NOT NULL,
+            "state" TEXT NOT NULL DEFAULT '{PENDING}',
+            "attempts" INTEGER NOT NULL DEFAULT 0,
+            "last_error" TEXT,
+            "next_attempt" REAL NOT NULL DEFAULT 0,
+            "updated" REAL NOT NULL DEFAULT 0,
+            UNIQUE("symbol", "frequency", "start_date", "end_date")
+        );
+    ''')
+
+
+def enqueue(connection: sqlite3.Connection, symbols: Iterable[str], frequency: str, start_date: datetime.date,
+            end_date: datetime.date) -> List[int]:
+    """
+    Queue the downloads of the symbols, the finished and failed jobs of the same range are queued again.
+    Jobs still pending or running are kept, they are already being downloaded.
+    :param connection: Connection to the SQLite database
+    :param symbols: Stock market symbols
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param start_date: Beginning of the period of time
+    :param end_date: End of the period of time
+    :return: Identifiers of the queued jobs
+    """
+    create_jobs_table(connection)
+    symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+    with connection:
+        connection.executemany(f'''
+            INSERT INTO {JOBS_TABLE} (symbol, frequency, start_date, end_date, updated)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(symbol, frequency, start_date, end_date) DO UPDATE
+                SET state = '{PENDING}', attempts = 0, last_error = NULL, next_attempt = 0,
+                    updated = excluded.updated
+                WHERE state IN ('{DONE}', '{FAILED}');
+        ''', [(symbol, frequency, str(start_date), str(end_date), time.time()) for symbol in symbols])
+    cursor = connection.execute(f'''
+        SELECT symbol, id FROM {JOBS_TABLE}
+        WHERE frequency = ? AND start_date = ? AND end_date = ?;
+    ''', (frequency, str(start_date), str(end_date)))
+    job_ids: Dict[str, int] = dict(cursor.fetchall())
+    return [job_ids[symbol] for symbol in symbols]
+
+
+def recover(connection: sqlite3.Connection, job_ids: Iterable[int] | None = None) -> int:
+    """
+    Return the jobs left running by a crashed process into the queue.
+    :param connection: Connection to the SQLite database
+    :param job_ids: Identifiers of the recovered jobs. Default every running job
+    :return: Number of the recovered jobs
+    """
+    create_jobs_table(connection)
+    cursor = connection.execute(f"SELECT id FROM {JOBS_TABLE} WHERE state = '{RUNNING}';")
+    running: List[int] = [row[0] for row in cursor.fetchall()]
+    if job_ids is not None:
+        running = sorted(set(running).intersection(job_ids))
+    with connection:
+        connection.executemany(f"UPDATE {JOBS_TABLE} SET state = '{PENDING}', updated = ? WHERE id = ?;",
+                               [(time.time(), job_id) for job_id in running])
+    return len(running)
+
+
+def ready_jobs(connection: sqlite3.Connection, now: float | None = None,
+               job_ids: Iterable[int] | None = None) -> List[Job]:
+    """
+    Return the queued jobs which may be started now, the retried jobs wait for their backoff.
+    :param connection: Connection to the SQLite database
+    :param now: Current Unix time. Default time.time()
+    :param job_ids: Identifiers of the returned jobs. Default every queued job
+    :return: List of the jobs in the queued order
+    """
+    cursor = connection.execute(f'''
+        SELECT id, symbol, frequency, start_date, end_date, attempts FROM {JOBS_TABLE}
+        WHERE state = '{PENDING}' AND next_attempt <= ?
+        ORDER BY id;
+    ''', (time.time() if now is None else now,))
+    jobs: List[Job] = [Job(*row) for row in cursor.fetchall()]
+    if job_ids is not None:
+        job_ids = set(job_ids)
+        jobs = [job for job in jobs if job.job_id in job_ids]
+    return jobs
+
+
+def next_attempt(connection: sqlite3.Connection, job_ids: Iterable[int] | None = None) -> float | None:
+    """Return the Unix time of the earliest queued job, None when the queue is empty."""
+    cursor = connection.execute(f"SELECT id, next_attempt FROM {JOBS_TABLE} WHERE state = '{PENDING}';")
+    if job_ids is not None:
+        job_ids = set(job_ids)
+    return min((wake_time for job_id, wake_time in cursor.fetchall() if job_ids is None or job_id in job_ids),
+               default=None)
+
+
+def set_running(connection: sqlite3.Connection, jobs: List[Job]) -> None:
+    """Mark the jobs taken by the current process."""
+    with connection:
+        connection.executemany(f"UPDATE {JOBS_TABLE} SET state = '{RUNNING}', updated = ? WHERE id = ?;",
+                               [(time.time(), job.job_id) for job in jobs])
+
+
+def complete(connection: sqlite3.Connection, job_id: int) -> None:
+    """
+    Checkpoint the job after its data was saved.
+    :param connection: Connection to the SQLite database
+    :param job_id: Identifier of the job
+    """
+    with connection:
+        connection.execute(f"UPDATE {JOBS_TABLE} SET state = '{DONE}', last_error = NULL, updated = ? WHERE id = ?;",
+                           (time.time(), job_id))
+
+
+def backoff_delay(attempts: int) -> float:
+    """Return the seconds before the next attempt, doubled after every failed attempt."""
+    return min(config.JOB_BACKOFF * 2 ** (attempts - 1), config.JOB_BACKOFF_MAX)
+
+
+def fail(connection: sqlite3.Connection, job: Job, error: str, retry: bool = True) -> None:
+    """
+    Record the failed attempt, the job is queued again with the exponential backoff until the attempts run out.
+    :param connection: Connection to the SQLite database
+    :param job: Failed job
+    :param error: Description of the failure
+    :param retry: Whether the job may be attempted again
+    """
+    attempts: int = job.attempts + 1
+    now: float = time.time()
+    state: str = PENDING if retry and attempts < config.JOB_MAX_ATTEMPTS else FAILED
+    with connection:
+        connection.execute(f'''
+            UPDATE {JOBS_TABLE} SET state = ?, attempts = ?, last_error = ?, next_attempt = ?, updated = ?
+            WHERE id = ?;
+        ''', (state, attempts, error, now + backoff_delay(attempts), now, job.job_id))
+
+
+def job_counts(connection: sqlite3.Connection) -> Dict[str, int]:
+    """
+    Return the number of the jobs in every state.
+    :param connection: Connection to the SQLite database
+    :return: Dictionary with the states and the numbers of the jobs
+    """
+    create_jobs_table(connection)
+    cursor = connection.execute(f'SELECT state, COUNT(*) FROM {JOBS_TABLE} GROUP BY state;')
+    return dict(cursor.fetchall())
+
+
+def run_jobs(database_name: str = 'stock_database.db', pool_size: int | None = None,
+             incorrect_symbols: List[str] | None = None, sleep: Callable[[float], None] = time.sleep,
+             job_ids: Iterable[int] | None = None, wait: bool = True,
+             **download_options) -> Tuple[List[pd.DataFrame], List['driver_pool.SymbolReport']]:
+    """
+    Download the queued symbols until the queue is empty, every saved symbol is checkpointed.
+    Jobs with the same date range are downloaded together by the pool of webdrivers.
+    :param database_name: Name of the database with the queue and the data
+    :param pool_size: Number of webdrivers working in parallel. Default config.DRIVER_POOL_SIZE
+    :param incorrect_symbols: Array collecting incorrect symbols
+    :param sleep: Function waiting for the backoff of the retried jobs
+    :param job_ids: Identifiers of the downloaded jobs, ex. returned by enqueue. Default every queued job
+    :param wait: Whether to wait for the backoff of the retried jobs, otherwise they are left to the resume command
+    :param download_options: Further arguments of driver_pool.download_symbols, ex. fetch or driver_factory
+    :return: DataFrames of the downloaded symbols and reports of every attempt
+    """
+    if incorrect_symbols is None:
+        incorrect_symbols = []
+    frames: List[pd.DataFrame] = []
+    reports: List[driver_pool.SymbolReport] = []
+    with database.connect(app.database_location(database_name)) as connection:
+        if job_ids is not None:
+            job_ids = set(job_ids)
+        recovered: int = recover(connection, job_ids)
+        if recovered:
+            logger.info(f'Resuming {recovered} interrupted jobs')
+        while True:
+            jobs = ready_jobs(connection, job_ids=job_ids)
+            if not jobs:
+                wake_time = next_attempt(connection, job_ids)
+                if wake_time is None:
+                    break
+                if not wait:
+                    logger.info('Jobs waiting for the retry are left to: python -m webScrape.jobs resume')
+                    break
+                sleep(max(0.0, wake_time - time.time()))
+                continue
+            # Jobs of the same range are downloaded by a single pool
+            groups: Dict[Tuple[str, str, str], Dict[str, Job]] = {}
+            for job in jobs:
+                groups.setdefault((job.frequency, job.start_date, job.end_date), {})[job.symbol] = job
+            for (frequency, start_date, end_date), group in groups.items():
+                set_running(connection, list(group.values()))
+                symbol_frames, symbol_reports = driver_pool.download_symbols(
+                    list(group), datetime.strptime(start_date, '%Y-%m-%d'), datetime.strptime(end_date, '%Y-%m-%d'),
+                    frequency, True, database_name, pool_size, incorrect_symbols,
+                    checkpoint=lambda writer_connection, symbol: complete(writer_connection, group[symbol].job_id),
+                    **download_options)
+                frames.extend(symbol_frames)
+                reports.extend(symbol_reports)
+                for report in symbol_reports:
+                    job = group[report.symbol]
+                    if report.symbol in incorrect_symbols:
+                        fail(connection, job, 'Incorrect symbol', retry=False)
+                    elif report.error is not None:
+                        fail(connection, job, report.error)
+                        logger.warning(f'{job.symbol} failed {job.attempts + 1} times, last error: {report.error}')
+                    else:
+                        # Symbols without the new data are finished too
+                        complete(connection, job.job_id)
+        counts = job_counts(connection)
+    logger.info(f'Job queue: {counts.get(DONE, 0)} done, {counts.get(FAILED, 0)} failed')
+    return frames, reports
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage the persistent queue of the symbol downloads.')
+    parser.add_argument('command', choices=['resume', 'status'],
+                        help='resume - download the queued and interrupted jobs, status - count the jobs')
+    parser.add_argument('--database', default='stock_database.db', help='Name of the database file')
+    parser.add_argument('--pool-size', type=int, default=None, help='Number of webdrivers working in parallel')
+    args = parser.parse_args()
+    if args.command == 'resume':
+        run_jobs(args.database, args.pool_size)
+    with database.connect(app.database_location(args.database)) as conn:
+        print(job_counts(conn))
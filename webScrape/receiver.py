@@ -1,14 +1,77 @@
 import sqlite3
+import threading
 from datetime import datetime
 import pandas as pd
-from webScrape import app
-from typing import List, Tuple
-from pathlib import Path
-from config import config
+from webScrape import app, bars, catalog, corporate_actions, database, schema
+from typing import Dict, Iterator, List, Tuple
+
+# Locks of the symbols being downloaded, {(symbol, frequency): lock}
+_download_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_download_locks_guard = threading.Lock()
+
+
+def table_columns(connection: sqlite3.Connection, symbol_table_name: str) -> List[str]:
+    """
+    Return the names of the columns of the table.
+    :param connection: Connection to the SQLite database
+    :param symbol_table_name: Name of the stock symbol table
+    :return: List with the column names
+    """
+    return [column[1] for column in connection.execute(f'PRAGMA table_info(`{symbol_table_name}`);')]
+
+
+def select_columns(available_columns: List[str], columns: List[str] | None = None) -> List[str]:
+    """
+    Validate the requested columns, the Date column is always returned first.
+    :param available_columns: Names of the columns inside the table
+    :param columns: Requested column names, None selects all the columns
+    :return: Names of the columns to read
+    """
+    if columns is None:
+        return available_columns
+    unknown_columns: List[str] = [column for column in columns if column not in available_columns]
+    if unknown_columns:
+        raise ValueError(f'Unknown columns: {", ".join(unknown_columns)}')
+    return ['Date'] + [column for column in dict.fromkeys(columns) if column != 'Date']
+
+
+def symbol_table_query(connection: sqlite3.Connection, symbol_table_name: str,
+                       columns: List[str] | None = None) -> Tuple[List[str], str]:
+    """
+    Create the query reading the date range of the symbol table, parameters: start date, end date and limit.
+    :param connection: Connection to the SQLite database
+    :param symbol_table_name: Name of the stock symbol table
+    :param columns: Names of the columns to read, None reads all the columns
+    :return: Names of the selected columns and the query
+    """
+    types: Dict[str, str] = schema.column_types(connection, symbol_table_name)
+    column_names: List[str] = select_columns(list(types), columns)
+    # Typed tables keep the epoch days, the dates are converted by SQLite in both directions,
+    # the filter and the order use the stored column instead of the converted one
+    typed: bool = schema.has_epoch_dates(types)
+    selected: List[str] = [schema.date_column(typed) if column == 'Date' else f'`{column}`'
+                           for column in column_names]
+    # Parameterized query, the same statement is reused for every date range
+    fetch_query = f"""
+            SELECT {', '.join(selected)}
+            FROM `{symbol_table_name}`
+            WHERE `{symbol_table_name}`.Date BETWEEN {schema.date_parameter(typed)} AND {schema.date_parameter(typed)}
+            ORDER BY `{symbol_table_name}`.Date DESC
+            LIMIT ?
+            """
+    return column_names, fetch_query
+
+
+def normalize_value(column: str, value):
+    """Convert a value saved as text by the legacy tables into a number, used by the row by row readers."""
+    if isinstance(value, str) and column != 'Date':
+        value = value.replace(',', '')
+        return int(value) if column == 'Volume' else float(value)
+    return value
 
 
 def receiver(connection: sqlite3.Connection, symbol_table_name: str, start_date: datetime.date, end_date: datetime.date,
-             change_index: bool = False) -> pd.DataFrame:
+             change_index: bool = False, columns: List[str] | None = None, limit: int | None = None) -> pd.DataFrame:
     """
     Return stock data from the database symbol table
     :param connection: Connection to the SQLite database
@@ -16,85 +79,171 @@ def receiver(connection: sqlite3.Connection, symbol_table_name: str, start_date:
     :param start_date: Beginning of the period of time, valid format: "2021-09-08"
     :param end_date: End of the period of time, valid format: "2021-08-08"
     :param change_index: Whether to set date as indices in data
+    :param columns: Names of the columns to read, None reads all the columns
+    :param limit: Maximum number of the latest rows to read, None reads all the rows
     :return: Pandas DataFrame with stock data from a date range
     """
-    # Query to fetch symbol data from the database
-    fetch_query = f"""
-            SELECT * 
-            FROM `{symbol_table_name}`
-            WHERE Date BETWEEN '{start_date}' AND '{end_date}'
-            ORDER BY Date DESC
-            """
+    column_names, fetch_query = symbol_table_query(connection, symbol_table_name, columns)
     # Fetch all data from the date range and save to a variable
-    cursor = connection.execute(fetch_query)
-    result: List[Tuple[str, str, str, str, str, str, str]] = cursor.fetchall()
+    cursor = connection.execute(fetch_query, (str(start_date), str(end_date), -1 if limit is None else limit))
+    result: List[tuple] = cursor.fetchall()
 
     # Create and save data inside the Pandas DataFrame
-    column_exists = connection.execute(f'PRAGMA table_info(`{symbol_table_name}`);')
-    column_names = [col[1] for col in column_exists]
     df_symbol: pd.DataFrame = pd.DataFrame(result, columns=column_names)
     if change_index:
         df_symbol.set_index('Date', inplace=True)
 
+    # Only the tables saved before the typed schema keep the numbers as text
+    text_columns: List[str] = [column for column in ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+                               if column in df_symbol.columns and not pd.api.types.is_numeric_dtype(df_symbol[column])]
     try:
         # Convert numeric columns to appropriate data type
-        numeric_columns: List[str] = ['Open', 'High', 'Low', 'Close', 'Adj Close']
+        numeric_columns: List[str] = [column for column in text_columns if column != 'Volume']
         df_symbol[numeric_columns] = df_symbol[numeric_columns].astype(float)
 
         # Remove commas from "Volume" column and convert to integer
-        df_symbol['Volume'] = df_symbol['Volume'].str.replace(',', '').astype(int)
+        if 'Volume' in text_columns:
+            df_symbol['Volume'] = df_symbol['Volume'].str.replace(',', '').astype(int)
     except AttributeError:
         pass
 
     return df_symbol
 
 
-def receive_data(symbol: str, connection: sqlite3.Connection | None = None, start: str = '1972-06-02',
-                 end: str = datetime.strftime(datetime.now().date(), '%Y-%m-%d'),
-                 frequency: str = '1d', change_index: bool = False,
-                 database_name: str = 'stock_database.db') -> pd.DataFrame:
+def read_symbol_table(connection: sqlite3.Connection, symbol: str, frequency: str, symbol_table_name: str,
+                      start_date: datetime.date, end_date: datetime.date, change_index: bool = False,
+                      columns: List[str] | None = None, limit: int | None = None) -> pd.DataFrame:
     """
-    Return data from a date range from a specific stock symbol
+    Return stock data of the symbol from the table used by its storage engine
+    :param connection: Connection to the SQLite database
     :param symbol: Stock market symbol
+    :param frequency: String defining the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param symbol_table_name: Name of the stock symbol table
+    :param start_date: Beginning of the period of time
+    :param end_date: End of the period of time
+    :param change_index: Whether to set date as indices in data
+    :param columns: Names of the columns to read, None reads all the columns
+    :param limit: Maximum number of the latest rows to read, None reads all the rows
+    :return: Pandas DataFrame with stock data from a date range
+    """
+    if symbol_table_name == bars.BARS_TABLE:
+        return bars.read_bars(connection, symbol, frequency, start_date, end_date, change_index, columns, limit)
+    return receiver(connection, symbol_table_name, start_date, end_date, change_index, columns, limit)
+
+
+def iterate_symbol_table(connection: sqlite3.Connection, symbol: str, frequency: str, symbol_table_name: str,
+                         start_date: datetime.date, end_date: datetime.date, columns: List[str] | None = None,
+                         batch_size: int = 1000) -> Tuple[List[str], Iterator[List[tuple]]]:
+    """
+    Read the data of the symbol in batches, keeping only a single batch of rows in memory.
+    :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
+    :param frequency: String defining the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param symbol_table_name: Name of the stock symbol table
+    :param start_date: Beginning of the period of time
+    :param end_date: End of the period of time
+    :param columns: Names of the columns to read, None reads all the columns
+    :param batch_size: Number of rows inside a single batch
+    :return: Names of the columns and the iterator over the batches of rows, the latest rows first
+    """
+    if symbol_table_name == bars.BARS_TABLE:
+        column_names, fetch_query = bars.bars_query(columns)
+        parameters: tuple = (symbol.upper(), frequency, str(start_date), str(end_date), -1)
+    else:
+        column_names, fetch_query = symbol_table_query(connection, symbol_table_name, columns)
+        parameters = (str(start_date), str(end_date), -1)
+    cursor = connection.execute(fetch_query, parameters)
+
+    def batches() -> Iterator[List[tuple]]:
+        rows = cursor.fetchmany(batch_size)
+        while rows:
+            yield rows
+            rows = cursor.fetchmany(batch_size)
+        cursor.close()
+
+    return column_names, batches()
+
+
+def needs_download(entry: catalog.CatalogEntry | None, start_date: datetime.date, end_date: datetime.date) -> bool:
+    """
+    Check whether the requested date range is not covered by the saved data.
+    :param entry: Catalog entry of the symbol table, None when the table does not exist
+    :param start_date: Beginning of the period of time
+    :param end_date: End of the period of time
+    :return: Whether the data has to be downloaded
+    """
+    if entry is None:
+        return True
+    limit_date: datetime.date = datetime.strptime('1972-06-02', '%Y-%m-%d').date()
+    return ((start_date < entry.start_date and not entry.oldest)
+            or end_date > entry.end_date
+            or (entry.start_date > limit_date and not entry.oldest))
+
+
+def download_missing_data(connection: sqlite3.Connection, symbol: str, start: str, end: str,
+                          frequency: str) -> catalog.CatalogEntry | None:
+    """
+    Download the data of the symbol, concurrent calls for the same symbol wait for a single download.
     :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
     :param start: Beginning of the period of time, valid format: "2021-09-08"
     :param end: End of the period of time, valid format: "2021-08-08"
+    :param frequency: String defining the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :return: Catalog entry of the symbol table after the download
+    """
+    key: Tuple[str, str] = (symbol.upper(), frequency)
+    with _download_locks_guard:
+        lock = _download_locks.setdefault(key, threading.Lock())
+    with lock:
+        # Data could be saved by the download which held the lock
+        entry = app.get_symbol_table_entry(symbol, frequency, connection)
+        if needs_download(entry, datetime.strptime(start, '%Y-%m-%d').date(),
+                          datetime.strptime(end, '%Y-%m-%d').date()):
+            app.download_historical_data(symbol, start, end, frequency)
+            entry = app.get_symbol_table_entry(symbol, frequency, connection)
+    return entry
+
+
+def receive_data(symbol: str, connection: sqlite3.Connection | None = None, start: str | None = None,
+                 end: str | None = None, frequency: str = '1d', change_index: bool = False,
+                 database_name: str = 'stock_database.db', columns: List[str] | None = None,
+                 limit: int | None = None, adjusted: bool = False) -> pd.DataFrame:
+    """
+    Return data from a date range from a specific stock symbol
+    :param symbol: Stock market symbol
+    :param connection: Connection to the SQLite database
+    :param start: Beginning of the period of time, valid format: "2021-09-08". Default the oldest available data
+    :param end: End of the period of time, valid format: "2021-08-08". Default today
     :param frequency: String defining the frequency of the data, defaults-1d, possible values: [1d, 1wk, 1mo]
     :param change_index: Whether to set date as indices in data
     :param database_name: Name of the database where data will be saved. Default "stock_database"
+    :param columns: Names of the columns to read, None reads all the columns
+    :param limit: Maximum number of the latest rows to read, None reads all the rows
+    :param adjusted: Whether to adjust the prices and the volume for the saved dividends and stock splits
     :return: Pandas DataFrame with stock data from a date range
     """
+    if start is None:
+        start = '1972-06-02'
+    if end is None:
+        end = datetime.strftime(datetime.now().date(), '%Y-%m-%d')
     # Convert passed start and end dates into datetime.date format
     received_data: pd.DataFrame = pd.DataFrame()
     start_date: datetime.date = datetime.strptime(start, '%Y-%m-%d').date()
     end_date: datetime.date = datetime.strptime(end, '%Y-%m-%d').date()
 
-    new_connection: bool = False
-    limit_date: datetime.date = datetime.strptime('1972-06-02', '%Y-%m-%d').date()
-    # Connect to the database
-    if connection is None:
-        new_connection = True
-        connection = sqlite3.connect(f'{Path(config.DATA_DICT, database_name)}')
-    # Get the name of the symbol table
-    symbol_table_name: str = app.get_name_of_symbol_table(symbol, frequency, connection)
-    if symbol_table_name is not None:
-        # Check whether the receiver date range is covered by existing data
-        table_start, table_end = app.extract_date_from_table(symbol_table_name)
-        if ((start_date < table_start and 'oldest' not in symbol_table_name.split('_')[1])
-                or end_date > table_end
-                or (table_start > limit_date and 'oldest' not in symbol_table_name.split('_')[1])):
-            app.download_historical_data(symbol, start, end, frequency)
-            # Update table name
-            symbol_table_name = app.get_name_of_symbol_table(symbol, frequency, connection)
-        received_data = receiver(connection, symbol_table_name, start_date, end_date, change_index)
-    else:
-        app.download_historical_data(symbol, start, end, frequency)
-        # Get the name of the symbol table
-        symbol_table_name = app.get_name_of_symbol_table(symbol, frequency, connection)
-        if symbol_table_name is not None:
-            received_data = receiver(connection, symbol_table_name, start_date, end_date, change_index)
-    if new_connection:
-        connection.close()
+    # Use the connection of the current thread when the connection is not given
+    with database.connect(database_name, connection) as connection:
+        # Get the catalog entry of the symbol table
+        entry = app.get_symbol_table_entry(symbol, frequency, connection)
+        if needs_download(entry, start_date, end_date):
+            entry = download_missing_data(connection, symbol, start, end, frequency)
+        if entry is not None:
+            received_data = read_symbol_table(connection, symbol, frequency, entry.table_name,
+                                              start_date, end_date, change_index, columns, limit)
+            if adjusted:
+                # Factors of the whole history are cached, only the selected rows are multiplied
+                factors = corporate_actions.get_factors(connection, symbol, frequency)
+                received_data = corporate_actions.adjust(received_data, factors)
     return received_data
 
 
@@ -0,0 +1,168 @@
+import argparse
+import sqlite3
+from typing import Dict, Iterable, List
+import numpy as np
+from config.config import logger
+from webScrape import catalog, database
+
+# Julian day of 1970-01-01, dates are stored as the number of days since this day
+UNIX_EPOCH_JULIAN_DAY: float = 2440587.5
+# Databases already checked for the tables saved before the catalog and the typed schema
+_upgraded_databases: set = set()
+# Types of the price columns, the other columns hold the indicator values
+COLUMN_TYPES: Dict[str, str] = {
+    'Date': 'INTEGER PRIMARY KEY',
+    'Open': 'REAL',
+    'High': 'REAL',
+    'Low': 'REAL',
+    'Close': 'REAL',
+    'Adj Close': 'REAL',
+    'Volume': 'INTEGER'
+}
+
+
+def column_types(connection: sqlite3.Connection, table_name: str) -> Dict[str, str]:
+    """
+    Return the declared types of the table columns.
+    :param connection: Connection to the SQLite database
+    :param table_name: Name of the stock symbol table
+    :return: Dictionary with the column names and their types, in the table order
+    """
+    return {column[1]: column[2].upper() for column in connection.execute(f'PRAGMA table_info(`{table_name}`);')}
+
+
+def has_epoch_dates(types: Dict[str, str]) -> bool:
+    """
+    Check whether the table stores the dates as the epoch days.
+    :param types: Declared types of the table columns
+    :return: Whether the table uses the typed schema
+    """
+    return types.get('Date') == 'INTEGER'
+
+
+def date_column(typed: bool) -> str:
+    """Return the SQL expression reading the Date column as the "YYYY-MM-DD" text."""
+    return f'date(`Date` + {UNIX_EPOCH_JULIAN_DAY}) AS `Date`' if typed else '`Date`'
+
+
+def date_parameter(typed: bool) -> str:
+    """Return the SQL placeholder converting the "YYYY-MM-DD" parameter into the stored date."""
+    return f'CAST(julianday(?) - {UNIX_EPOCH_JULIAN_DAY} AS INTEGER)' if typed else '?'
+
+
+def to_epoch_days(dates: Iterable) -> List[int]:
+    """
+    Convert the dates into the stored epoch days at once, without parsing the rows one by one.
+    :param dates: Dates in the "YYYY-MM-DD" format or the date objects
+    :return: List with the number of days since 1970-01-01
+    """
+    return np.asarray(list(dates), dtype='datetime64[D]').astype(np.int64).tolist()
+
+
+def column_definition(column: str) -> str:
+    """Return the definition of the column inside the typed schema."""
+    return f'"{column}" {COLUMN_TYPES.get(column, "REAL")}'
+
+
+def create_symbol_table(connection: sqlite3.Connection, table_name: str, columns: List[str]) -> None:
+    """
+    Create the symbol table with the typed schema if it does not exist yet.
+    The epoch day is the primary key, so the rows are stored in the order of the dates.
+    :param connection: Connection to the SQLite database
+    :param table_name: Name of the stock symbol table
+    :param columns: Names of the table columns
+    """
+    connection.execute(f'CREATE TABLE IF NOT EXISTS `{table_name}` '
+                       f'({", ".join(column_definition(column) for column in columns)});')
+
+
+def _converted_column(column: str) -> str:
+    """Return the SQL expression converting the legacy value into the typed schema."""
+    if column == 'Date':
+        return f'CAST(julianday(`Date`) - {UNIX_EPOCH_JULIAN_DAY} AS INTEGER)'
+    target: str = 'INTEGER' if column == 'Volume' else 'REAL'
+    # Numbers saved as text may contain the thousands separators
+    return (f"CASE WHEN typeof(`{column}`) = 'text' THEN CAST(REPLACE(`{column}`, ',', '') AS {target}) "
+            f"ELSE `{column}` END")
+
+
+def migrate_table(connection: sqlite3.Connection, table_name: str) -> bool:
+    """
+    Rewrite the table saved with the text dates into the typed schema, the first row of every date is kept.
+    :param connection: Connection to the SQLite database
+    :param table_name: Name of the stock symbol table
+    :return: Whether the table was migrated
+    """
+    types: Dict[str, str] = column_types(connection, table_name)
+    if not types or has_epoch_dates(types):
+        return False
+    columns: List[str] = list(types)
+    migrated_table: str = f'{table_name}&typed'
+    if connection.in_transaction:
+        connection.commit()
+    connection.execute('BEGIN;')
+    try:
+        connection.execute(f'DROP TABLE IF EXISTS `{migrated_table}`;')
+        create_symbol_table(connection, migrated_table, columns)
+        connection.execute(f'''
+            INSERT OR IGNORE INTO `{migrated_table}` ({", ".join(f'`{column}`' for column in columns)})
+            SELECT {", ".join(_converted_column(column) for column in columns)}
+            FROM `{table_name}`
+            ORDER BY ROWID;
+        ''')
+        connection.execute(f'DROP TABLE `{table_name}`;')
+        connection.execute(f'ALTER TABLE `{migrated_table}` RENAME TO `{table_name}`;')
+        connection.commit()
+    except sqlite3.Error:
+        connection.rollback()
+        raise
+    return True
+
+
+def migrate_database(connection: sqlite3.Connection) -> int:
+    """
+    Rewrite every per-symbol table of the database into the typed schema and register it in the catalog.
+    :param connection: Connection to the SQLite database
+    :return: Number of migrated tables
+    """
+    cursor = connection.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'stock_%|%&freq=%';")
+    migrated: int = 0
+    for (table_name,) in cursor.fetchall():
+        if migrate_table(connection, table_name):
+            migrated += 1
+            logger.info(f'Migrated {table_name} into the typed schema')
+    # Tables are registered after the migration, the catalog holds the row counts without the duplicates
+    catalog.rebuild_catalog(connection)
+    return migrated
+
+
+def upgrade_database(connection: sqlite3.Connection) -> int:
+    """
+    Migrate the per-symbol tables of the database saved before the catalog existed, once per database.
+    The write path then never migrates nor commits on its own and the catalog lookups never scan sqlite_master.
+    :param connection: Connection to the SQLite database
+    :return: Number of migrated tables
+    """
+    database_key, _ = catalog.version_key(connection)
+    if database_key in _upgraded_databases:
+        return 0
+    has_catalog, has_tables = connection.execute(f'''
+        SELECT EXISTS(SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?),
+               EXISTS(SELECT 1 FROM sqlite_master WHERE type = 'table' AND name LIKE 'stock_%|%&freq=%');
+    ''', (catalog.CATALOG_TABLE,)).fetchone()
+    migrated: int = 0
+    # The catalog is created together with the first table, the database without it was saved before
+    if has_tables and not has_catalog:
+        migrated = migrate_database(connection)
+        logger.info(f'Upgraded the database, {migrated} tables migrated into the typed schema')
+    _upgraded_databases.add(database_key)
+    return migrated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migrate per-symbol tables into the typed schema with epoch days.')
+    parser.add_argument('--database', default='stock_database.db', help='Name of the database file')
+    args = parser.parse_args()
+    conn = database.open_connection(args.database)
+    print(f'Migrated {migrate_database(conn)} tables')
+    conn.close()
@@ -0,0 +1,99 @@
+import json
+import sqlite3
+from datetime import datetime
+from typing import Dict
+from webScrape import bars, catalog, receiver
+
+# Table with the latest bar and the latest indicator values of every symbol
+SNAPSHOT_TABLE: str = 'symbol_snapshot'
+# Databases where the snapshot table was already created
+_initialized_databases: set = set()
+
+
+def create_snapshot_table(connection: sqlite3.Connection) -> None:
+    """
+    Create the snapshot table if it does not exist yet.
+    :param connection: Connection to the SQLite database
+    """
+    database_key, _ = catalog.version_key(connection)
+    if database_key in _initialized_databases:
+        return
+    connection.execute(f'''
+        CREATE TABLE IF NOT EXISTS {SNAPSHOT_TABLE} (
+            "symbol" TEXT NOT NULL,
+            "frequency" TEXT NOT NULL,
+            "date" TEXT NOT NULL,
+            "data" TEXT NOT NULL,
+            PRIMARY KEY("symbol", "frequency")
+        ) WITHOUT ROWID;
+    ''')
+    _initialized_databases.add(database_key)
+
+
+def invalidate() -> None:
+    """Forget the created snapshot tables, required after the database file was replaced."""
+    _initialized_databases.clear()
+
+
+def latest_row(connection: sqlite3.Connection, symbol: str, frequency: str, table_name: str) -> Dict | None:
+    """
+    Read the latest row of the symbol table.
+    :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
+    :param frequency: String specifying the frequency of the data, possible values: [1d, 1wk, 1mo]
+    :param table_name: Name of the stock symbol table
+    :return: Dictionary with the values of every column or None when the table is empty
+    """
+    if table_name == bars.BARS_TABLE:
+        column_names, fetch_query = bars.bars_query()
+        parameters: tuple = (symbol.upper(), frequency, str(datetime.min.date()), str(datetime.max.date()), 1)
+    else:
+        column_names, fetch_query = receiver.symbol_table_query(connection, table_name)
+        parameters = (str(datetime.min.date()), str(datetime.max.date()), 1)
+    row = connection.execute(fetch_query, parameters).fetchone()
+    if row is None:
+        return None
+    return {column: receiver.normalize_value(column, value) for column, value in zip(column_names, row)}
+
+
+def refresh_snapshot(connection: sqlite3.Connection, symbol: str, frequency: str = '1d') -> Dict | None:
+    """
+    Save the latest row of the symbol table inside the snapshot table, committed by the caller.
+    :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
+    :param frequency: String specifying the frequency of the data, defaults-1d, possible values: [1d, 1wk, 1mo]
+    :return: Dictionary with the latest values or None when the symbol has no data
+    """
+    symbol = symbol.upper()
+    entry = catalog.get_entry(connection, symbol, frequency)
+    if entry is None:
+        return None
+    row = latest_row(connection, symbol, frequency, entry.table_name)
+    if row is None:
+        return None
+    create_snapshot_table(connection)
+    connection.execute(f'INSERT OR REPLACE INTO {SNAPSHOT_TABLE} (symbol, frequency, date, data) '
+                       f'VALUES (?, ?, ?, ?);', (symbol, frequency, row['Date'], json.dumps(row)))
+    return row
+
+
+def get_snapshot(connection: sqlite3.Connection, symbol: str, frequency: str = '1d') -> Dict | None:
+    """
+    Return the latest bar and indicator values of the symbol, the snapshot is created for the tables saved before.
+    Only the first request of a symbol saved before the snapshots existed writes into the database.
+    :param connection: Connection to the SQLite database
+    :param symbol: Stock market symbol
+    :param frequency: String specifying the frequency of the data, defaults-1d, possible values: [1d, 1wk, 1mo]
+    :return: Dictionary with the latest values or None when the symbol has no data
+    """
+    try:
+        row = connection.execute(f'SELECT data FROM {SNAPSHOT_TABLE} WHERE symbol = ? AND frequency = ?;',
+                                 (symbol.upper(), frequency)).fetchone()
+    except sqlite3.OperationalError:
+        # The table is created by the first saved snapshot
+        row = None
+    if row is not None:
+        return json.loads(row[0])
+    with connection:
+        return refresh_snapshot(connection, symbol, frequency)
+